@@ -1,20 +1,38 @@
 """
 Main FastAPI application
 """
-import os
+import base64
+import json
 from datetime import datetime, timezone
-from fastapi import FastAPI, Response, Request
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Query, Response, Request
 from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
-from db import init_db
+from config import settings
+from db import count_users, init_db, iter_users, list_users_page, user_cache
 from auth import router as auth_router
-from calendar_api import router as google_router
-
-load_dotenv()
+from calendar_api import background_token_refresher, router as google_router
+from calendar_client import calendar_client
+from compression import CompressionMiddleware
+from profiling import ProfilingMiddleware
+from metrics import (
+    MetricsMiddleware,
+    cache_hits_total,
+    cache_misses_total,
+    google_concurrency_limit,
+    oauth_states,
+    render_metrics,
+    token_refresh_active_users,
+    user_cache_entries,
+)
+import token_refresh
+from token_cache import access_token_cache
+from token_refresh import token_refresh_scheduler
+from utils import start_http_client, close_http_client, session_token_cache, state_store
 
 # Configuration
-FRONTEND_ORIGIN = os.getenv("FRONTEND_ORIGIN", "http://localhost:3000")
+FRONTEND_ORIGIN = settings.frontend_origin
 
 # Create FastAPI app
 app = FastAPI(
@@ -32,15 +50,48 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip/brotli for responses over COMPRESSION_MIN_SIZE (streams flushed per chunk)
+app.add_middleware(CompressionMiddleware)
+
+# Sampled / on-demand cProfile dumps (PROFILE_SAMPLE_RATE, PROFILE_TOKEN)
+app.add_middleware(ProfilingMiddleware)
+
+# Request counts and latency per route (outermost, so it times everything)
+app.add_middleware(MetricsMiddleware)
+
+oauth_states.set_function(lambda: len(state_store))
+user_cache_entries.set_function(lambda: len(user_cache))
+token_refresh_active_users.set_function(lambda: len(token_refresh_scheduler))
+google_concurrency_limit.set_function(lambda: calendar_client.limiter.limit)
+for cache_name, cache in (
+    ("user", user_cache),
+    ("access_token", access_token_cache),
+    ("session_token", session_token_cache),
+):
+    cache_hits_total.set_function(lambda cache=cache: cache.hits, cache_name)
+    cache_misses_total.set_function(lambda cache=cache: cache.misses, cache_name)
+
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize database on startup"""
     init_db()
     print("✓ Database initialized")
+    await start_http_client()
+    if token_refresh.TOKEN_REFRESH_ENABLED:
+        token_refresh_scheduler.start(background_token_refresher)
+        print("✓ Background token refresh started")
     print(f"✓ CORS enabled for: {FRONTEND_ORIGIN}")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background work and close pooled upstream connections"""
+    await token_refresh_scheduler.stop()
+    await calendar_client.aclose()
+    await close_http_client()
+
+
 @app.get("/healthz")
 async def healthz():
     """
@@ -56,6 +107,17 @@ async def healthz():
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Metrics in the Prometheus text exposition format
+    
+    Route and upstream Google latency histograms, DB statement timings
+    and gauges such as the number of stored OAuth states.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/debug/set-cookie")
 async def debug_set_cookie(response: Response):
     """Debug endpoint to test cookie setting"""
@@ -78,41 +140,68 @@ async def debug_check_cookie(request: Request):
 @app.get("/debug/config")
 async def debug_config():
     """Debug endpoint to check environment config"""
-    import os
     return {
-        "OAUTH_REDIRECT_URI": os.getenv("OAUTH_REDIRECT_URI"),
-        "FRONTEND_ORIGIN": os.getenv("FRONTEND_ORIGIN"),
-        "GOOGLE_CLIENT_ID": os.getenv("GOOGLE_CLIENT_ID", "")[:20] + "...",
-        "HAS_CLIENT_SECRET": bool(os.getenv("GOOGLE_CLIENT_SECRET")),
+        "OAUTH_REDIRECT_URI": settings.oauth_redirect_uri,
+        "FRONTEND_ORIGIN": settings.frontend_origin,
+        "GOOGLE_CLIENT_ID": (settings.google_client_id or "")[:20] + "...",
+        "HAS_CLIENT_SECRET": bool(settings.google_client_secret),
+    }
+
+
+def _encode_user_cursor(user) -> str:
+    """Opaque keyset cursor pointing after `user`"""
+    payload = f"{user.created_at.isoformat()}|{user.id}"
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def _decode_user_cursor(cursor: str):
+    """Decode a cursor from _encode_user_cursor into (created_at, id)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, user_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(user_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _user_to_dict(user) -> dict:
+    return {
+        "id": user.id,
+        "email": user.email,
+        "created_at": user.created_at.isoformat(),
     }
 
 
 @app.get("/admin/users")
-async def list_all_users():
+def list_all_users(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+):
     """
-    Admin endpoint to list all registered users
+    Admin endpoint to list registered users, newest first
+    
+    Args:
+        limit: Max users per page (json format)
+        cursor: next_cursor from the previous page
+        format: "json" for one page, "ndjson" to stream every user
     
     Note: In production, protect this with admin authentication
     """
-    from db import User
-    from sqlmodel import Session, select
-    from db import engine
+    if format == "ndjson":
+        # Full export: one line per user, read in keyset batches
+        lines = (json.dumps(_user_to_dict(user)) + "\n" for user in iter_users())
+        return StreamingResponse(lines, media_type="application/x-ndjson")
     
-    with Session(engine) as session:
-        statement = select(User).order_by(User.created_at.desc())
-        users = session.exec(statement).all()
-        
-        return {
-            "total_users": len(users),
-            "users": [
-                {
-                    "id": user.id,
-                    "email": user.email,
-                    "created_at": user.created_at.isoformat(),
-                }
-                for user in users
-            ]
-        }
+    after = _decode_user_cursor(cursor) if cursor else None
+    users = list_users_page(limit, after)
+    next_cursor = _encode_user_cursor(users[-1]) if len(users) == limit else None
+    
+    return {
+        "total_users": count_users(),
+        "users": [_user_to_dict(user) for user in users],
+        "next_cursor": next_cursor,
+    }
 
 
 # Include routers
@@ -1,11 +1,10 @@
 """
 Authentication endpoints for OAuth flow
 """
-import os
 from fastapi import APIRouter, Request, Response, HTTPException, Depends
 from fastapi.responses import RedirectResponse, HTMLResponse
-from dotenv import load_dotenv
 
+from config import settings
 from utils import (
     generate_state,
     verify_state,
@@ -14,15 +13,14 @@ from utils import (
     create_session_cookie,
     clear_session_cookie,
 )
-from db import get_or_create_user, save_tokens_for_user
+from db import upsert_user_with_credential
 from deps import get_current_user
 from schemas import AuthUrlResponse, UserResponse, LogoutResponse
-
-load_dotenv()
+from token_cache import access_token_cache
 
 router = APIRouter()
 
-FRONTEND_ORIGIN = os.getenv("FRONTEND_ORIGIN", "http://localhost:3000")
+FRONTEND_ORIGIN = settings.frontend_origin
 
 
 @router.get("/login", response_model=AuthUrlResponse)
@@ -93,13 +91,17 @@ async def callback(
             detail="Failed to get user information from Google"
         )
     
-    # Get or create user
-    user = get_or_create_user(email=email, google_sub=google_sub)
+    # Create/update user and save refresh token in one transaction
+    # (refresh token only present on first auth or with prompt=consent)
+    user = upsert_user_with_credential(
+        email=email,
+        google_sub=google_sub,
+        refresh_token=tokens.get("refresh_token"),
+    )
     
-    # Save refresh token (only if present - Google returns it on first auth or with prompt=consent)
-    refresh_token = tokens.get("refresh_token")
-    if refresh_token:
-        save_tokens_for_user(user.id, refresh_token)
+    # Prime access token cache so the first Calendar call skips a refresh
+    if tokens.get("access_token"):
+        access_token_cache.put(user.id, tokens["access_token"], tokens.get("expires_in"))
     
     # Create session cookie
     create_session_cookie(response, user.id)
@@ -174,13 +176,17 @@ async def exchange(
             detail="Failed to get user information from Google"
         )
     
-    # Get or create user
-    user = get_or_create_user(email=email, google_sub=google_sub)
-    
-    # Save refresh token
-    refresh_token = tokens.get("refresh_token")
-    if refresh_token:
-        save_tokens_for_user(user.id, refresh_token)
+    # Create/update user and save refresh token in one transaction
+    # (refresh token only present on first auth or with prompt=consent)
+    user = upsert_user_with_credential(
+        email=email,
+        google_sub=google_sub,
+        refresh_token=tokens.get("refresh_token"),
+    )
+    
+    # Prime access token cache so the first Calendar call skips a refresh
+    if tokens.get("access_token"):
+        access_token_cache.put(user.id, tokens["access_token"], tokens.get("expires_in"))
     
     # Create session cookie
     create_session_cookie(response, user.id)
@@ -0,0 +1,154 @@
+"""
+Free/busy availability computed from Google's freebusy.query
+
+Busy intervals from all calendars are merged with a sort-and-sweep, then
+subtracted from the working-hours windows of every day in the requested
+timezone. Both lists are sorted, so the subtraction is a single linear pass.
+"""
+from datetime import datetime, time, timedelta
+from typing import Any, Dict, Iterable, List, Tuple
+from zoneinfo import ZoneInfo
+
+from rfc3339 import parse_rfc3339
+
+# (start, end) as timezone-aware datetimes, end exclusive
+Interval = Tuple[datetime, datetime]
+
+# Google accepts at most this many calendars per freebusy.query
+FREEBUSY_MAX_CALENDARS = 50
+
+
+def parse_time_of_day(value: str) -> time:
+    """
+    Parse "HH:MM" (24-hour clock)
+    
+    Raises:
+        ValueError: If the value is not a valid time of day
+    """
+    hours, _, minutes = value.partition(":")
+    return time(int(hours), int(minutes or 0))
+
+
+def busy_intervals(response: Dict[str, Any]) -> Tuple[List[Interval], Dict[str, str]]:
+    """
+    Extract busy intervals from a freebusy.query response
+    
+    Args:
+        response: freebusy.query response body
+    
+    Returns:
+        Tuple of (busy intervals of all calendars, unsorted;
+        calendar ID -> reason for calendars Google could not answer for)
+    """
+    intervals: List[Interval] = []
+    errors: Dict[str, str] = {}
+    for calendar_id, calendar in response.get("calendars", {}).items():
+        if calendar.get("errors"):
+            errors[calendar_id] = calendar["errors"][0].get("reason", "unknown")
+            continue
+        for busy in calendar.get("busy", ()):
+            intervals.append((parse_rfc3339(busy["start"]), parse_rfc3339(busy["end"])))
+    return intervals, errors
+
+
+def merge_intervals(intervals: Iterable[Interval]) -> List[Interval]:
+    """
+    Merge overlapping or touching intervals
+    
+    Args:
+        intervals: Intervals in any order
+    
+    Returns:
+        Disjoint intervals sorted by start
+    """
+    merged: List[Interval] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def working_hours(
+    range_start: datetime,
+    range_end: datetime,
+    tz: ZoneInfo,
+    day_start: time,
+    day_end: time,
+    include_weekends: bool = False,
+) -> List[Interval]:
+    """
+    Working-hours windows of every local day in a range
+    
+    Windows are built from local wall-clock times, so they follow DST
+    changes, and are clipped to the range.
+    
+    Args:
+        range_start: Aware start of the range
+        range_end: Aware end of the range
+        tz: Timezone the working hours are in
+        day_start: Start of the working day (local)
+        day_end: End of the working day (local)
+        include_weekends: Also return windows on Saturday and Sunday
+    
+    Returns:
+        Sorted, non-empty windows as aware datetimes in tz
+    """
+    windows: List[Interval] = []
+    day = range_start.astimezone(tz).date()
+    last_day = range_end.astimezone(tz).date()
+    while day <= last_day:
+        if include_weekends or day.weekday() < 5:
+            start = max(datetime.combine(day, day_start, tz), range_start)
+            end = min(datetime.combine(day, day_end, tz), range_end)
+            if start < end:
+                windows.append((start, end))
+        day += timedelta(days=1)
+    return windows
+
+
+def free_slots(
+    busy: List[Interval],
+    windows: List[Interval],
+    min_length: timedelta,
+) -> List[Interval]:
+    """
+    Subtract busy time from windows
+    
+    Args:
+        busy: Merged busy intervals (see merge_intervals)
+        windows: Sorted, disjoint windows to find free time in
+        min_length: Drop free slots shorter than this
+    
+    Returns:
+        Free slots sorted by start
+    """
+    slots: List[Interval] = []
+    index = 0
+    for window_start, window_end in windows:
+        # Busy intervals ending before this window can't affect later ones
+        while index < len(busy) and busy[index][1] <= window_start:
+            index += 1
+        
+        cursor = window_start
+        position = index
+        while position < len(busy) and busy[position][0] < window_end:
+            busy_start, busy_end = busy[position]
+            if busy_start - cursor >= min_length:
+                slots.append((cursor, busy_start))
+            cursor = max(cursor, busy_end)
+            position += 1
+        
+        if window_end - cursor >= min_length:
+            slots.append((cursor, window_end))
+    return slots
+
+
+def format_intervals(intervals: List[Interval], tz: ZoneInfo) -> List[Dict[str, str]]:
+    """Render intervals as {"start", "end"} RFC3339 strings in tz"""
+    return [
+        {"start": start.astimezone(tz).isoformat(), "end": end.astimezone(tz).isoformat()}
+        for start, end in intervals
+    ]
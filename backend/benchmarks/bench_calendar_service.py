@@ -0,0 +1,72 @@
+"""
+Benchmark: per-request overhead of preparing a Calendar events.list call
+
+Compares building the discovery service on every request (old behaviour)
+with reusing the shared service. No network calls are made - only request
+preparation is timed.
+
+Usage (from backend/):
+    python -m benchmarks.bench_calendar_service [iterations]
+"""
+import sys
+import time
+
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+
+from calendar_client import calendar_resource
+
+REQUEST_PARAMS = {
+    "calendarId": "primary",
+    "timeMin": "2025-01-01T00:00:00Z",
+    "timeMax": "2025-01-31T23:59:59Z",
+    "timeZone": "Asia/Bangkok",
+    "singleEvents": True,
+    "orderBy": "startTime",
+    "maxResults": 50,
+}
+
+
+def make_credentials() -> Credentials:
+    return Credentials(
+        token="bench-access-token",
+        refresh_token="bench-refresh-token",
+        token_uri="https://oauth2.googleapis.com/token",
+        client_id="bench-client-id",
+        client_secret="bench-client-secret",
+    )
+
+
+def per_request_build(creds: Credentials):
+    """Old path: build the whole service for every request"""
+    service = build("calendar", "v3", credentials=creds)
+    return service.events().list(**REQUEST_PARAMS)
+
+
+def shared_service(creds: Credentials):
+    """New path: shared service, access token sent by calendar_client"""
+    return calendar_resource("events").list(**REQUEST_PARAMS)
+
+
+def bench(fn, iterations: int) -> float:
+    """Return mean milliseconds per call"""
+    creds = make_credentials()
+    fn(creds)  # warm up (loads discovery document / caches)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(make_credentials())
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    before = bench(per_request_build, iterations)
+    after = bench(shared_service, iterations)
+    print(f"iterations:               {iterations}")
+    print(f"build() per request:      {before:8.3f} ms/request")
+    print(f"shared service:           {after:8.3f} ms/request")
+    print(f"speedup:                  {before / after:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark: bytes on the wire and CPU cost of compressing event payloads
+
+Serializes synthetic /api/events pages (as the endpoint does) and compresses
+them with gzip at several levels and, if the `brotli` package is installed,
+brotli at several qualities. Event IDs, times, summaries, descriptions and
+attendees are drawn at random (seeded) so the payloads are not much more
+repetitive than real calendars.
+
+Usage (from backend/):
+    python -m benchmarks.bench_compression [iterations]
+"""
+import random
+import string
+import sys
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.fake_google import make_events
+from calendar_api import events_response, map_event
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+PAGE_SIZES = (50, 250, 2500)
+GZIP_LEVELS = (1, 6, 9)
+BROTLI_QUALITIES = (1, 4, 6, 11)
+
+WORDS = (
+    "weekly sync planning review design budget hiring interview lunch retro "
+    "standup roadmap customer demo launch onboarding offsite quarterly board "
+    "incident postmortem training workshop dentist flight dinner gym call "
+    "product marketing sales finance legal security migration api mobile"
+).split()
+DOMAINS = ("example.com", "example.org", "corp.example.net", "gmail.com")
+FIRST_NAMES = ("ana", "bo", "chen", "dmitri", "eve", "farah", "goro", "hana", "ivan", "jo", "kofi", "lena")
+
+
+def varied_events(count: int, seed: int = 0) -> list:
+    """make_events with irregular times and realistic variety in the text fields"""
+    rng = random.Random(seed)
+    events = make_events(count)
+    start = datetime(2025, 1, 1, 8, tzinfo=timezone.utc)
+    for event in events:
+        start += timedelta(minutes=rng.choice((0, 15, 30, 45, 60, 90, 180, 600)))
+        end = start + timedelta(minutes=rng.choice((15, 30, 45, 60, 90, 120)))
+        attendees = [
+            {
+                "email": f"{rng.choice(FIRST_NAMES)}.{rng.randint(1, 999)}@{rng.choice(DOMAINS)}",
+                "responseStatus": rng.choice(("accepted", "declined", "tentative", "needsAction")),
+            }
+            for _ in range(rng.randint(0, 8))
+        ]
+        event.update({
+            "id": "".join(rng.choices(string.ascii_lowercase + string.digits, k=26)),
+            "summary": " ".join(rng.choices(WORDS, k=rng.randint(1, 5))).capitalize(),
+            "description": " ".join(rng.choices(WORDS, k=rng.randint(0, 40))) or None,
+            "start": {"dateTime": start.isoformat()},
+            "end": {"dateTime": end.isoformat()},
+            "attendees": attendees,
+            "organizer": {"email": attendees[0]["email"] if attendees else "owner@example.com"},
+        })
+    return events
+
+
+def gzip_compress(level: int):
+    def compress(data: bytes) -> bytes:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+    return compress
+
+
+def brotli_compress(quality: int):
+    def compress(data: bytes) -> bytes:
+        return brotli.compress(data, quality=quality)
+    return compress
+
+
+def measure(compress, data: bytes, iterations: int):
+    """Compressed size and milliseconds per compression"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        compressed = compress(data)
+    return len(compressed), (time.perf_counter() - start) / iterations * 1000
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    
+    codecs = [(f"gzip-{level}", gzip_compress(level)) for level in GZIP_LEVELS]
+    if brotli is not None:
+        codecs += [(f"br-{quality}", brotli_compress(quality)) for quality in BROTLI_QUALITIES]
+    else:
+        print("brotli not installed - gzip only")
+    
+    for page_size in PAGE_SIZES:
+        body = events_response([map_event(item) for item in varied_events(page_size)], None).body
+        print(f"\n{page_size} events: {len(body):,} bytes uncompressed")
+        print(f"  {'codec':10} {'bytes':>10} {'ratio':>7} {'ms':>8} {'MB/s':>8}")
+        for name, compress in codecs:
+            size, ms = measure(compress, body, iterations)
+            throughput = len(body) / 1e6 / (ms / 1000)
+            print(f"  {name:10} {size:10,} {len(body) / size:6.1f}x {ms:8.3f} {throughput:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
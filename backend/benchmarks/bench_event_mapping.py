@@ -0,0 +1,65 @@
+"""
+Benchmark: mapping and serializing a 2,500-event events.list page
+
+Compares the previous path (one EventResponse model per event, wrapped in
+EventsListResponse, re-validated as the response_model and encoded with
+jsonable_encoder + json.dumps) with the fast path (map_event dicts
+serialized by orjson). Both produce the same JSON document.
+
+Usage (from backend/):
+    python -m benchmarks.bench_event_mapping [iterations]
+"""
+import asyncio
+import json
+import sys
+import time
+
+import orjson
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from benchmarks.fake_google import make_events
+from calendar_api import events_response, map_event
+from schemas import EventResponse, EventsListResponse
+
+PAGE_SIZE = 2500
+
+response_field = create_response_field("response", EventsListResponse)
+
+
+def pydantic_path(items: list) -> bytes:
+    """Old behaviour of list_events"""
+    events = [EventResponse(**map_event(item)) for item in items]
+    content = EventsListResponse(events=events, nextPageToken=None)
+    encoded = asyncio.run(serialize_response(field=response_field, response_content=content))
+    return json.dumps(encoded, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+
+def fast_path(items: list) -> bytes:
+    """map_event dicts rendered by ORJSONResponse"""
+    return events_response([map_event(item) for item in items], None).body
+
+
+def per_event_us(function, items: list, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function(items)
+    return (time.perf_counter() - start) / (iterations * len(items)) * 1e6
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    items = make_events(PAGE_SIZE)
+    
+    assert orjson.loads(pydantic_path(items)) == orjson.loads(fast_path(items))
+    
+    slow = per_event_us(pydantic_path, items, iterations)
+    fast = per_event_us(fast_path, items, iterations)
+    print(f"events per page:     {PAGE_SIZE}")
+    print(f"pydantic + json:     {slow:8.2f} us/event  ({slow * PAGE_SIZE / 1000:7.2f} ms/page)")
+    print(f"dict + orjson:       {fast:8.2f} us/event  ({fast * PAGE_SIZE / 1000:7.2f} ms/page)")
+    print(f"speedup:             {slow / fast:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Benchmark: session JWT verification, full decode vs verified-token cache
+
+Usage (from backend/):
+    python -m benchmarks.bench_session_jwt [iterations]
+"""
+import sys
+import time
+
+from utils import create_session_jwt, session_token_cache, verify_session_jwt
+
+
+def cold(token: str, iterations: int) -> float:
+    """Tokens/sec with the cache emptied before every verification"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        session_token_cache.clear()
+        verify_session_jwt(token)
+    return iterations / (time.perf_counter() - start)
+
+
+def cached(token: str, iterations: int) -> float:
+    """Tokens/sec once the token has been verified"""
+    verify_session_jwt(token)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        verify_session_jwt(token)
+    return iterations / (time.perf_counter() - start)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    token = create_session_jwt(1)
+    cold_rate = cold(token, iterations)
+    cached_rate = cached(token, iterations)
+    print(f"iterations:        {iterations}")
+    print(f"full decode:       {cold_rate:12,.0f} tokens/sec")
+    print(f"cached signature:  {cached_rate:12,.0f} tokens/sec")
+    print(f"speedup:           {cached_rate / cold_rate:12.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+"""
+Local stand-in for the Google endpoints the backend talks to
+
+Used by tests and benchmarks to run the real HTTP code paths without
+network access. Latency and page size are configurable, and events can
+be changed while the server runs to exercise incremental sync.
+
+Usage:
+    fake = FakeGoogle(latency=0.1)
+    with fake.serve() as base_url:
+        set_calendar_endpoint(f"{base_url}/calendar/v3/")
+        ...
+"""
+import asyncio
+import socket
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import parse_qs
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from jose import jwt
+
+
+def make_events(
+    count: int,
+    start: datetime = datetime(2025, 1, 1, tzinfo=timezone.utc),
+    spacing: timedelta = timedelta(hours=2),
+    duration: timedelta = timedelta(hours=1),
+    prefix: str = "evt",
+) -> List[Dict[str, Any]]:
+    """
+    Generate synthetic Calendar event resources
+    
+    Args:
+        count: Number of events
+        start: Start of the first event
+        spacing: Time between event starts
+        duration: Length of each event
+        prefix: Event ID prefix
+    
+    Returns:
+        List of event dicts shaped like Calendar API resources
+    """
+    events = []
+    for i in range(count):
+        event_start = start + i * spacing
+        events.append({
+            "kind": "calendar#event",
+            "id": f"{prefix}{i}",
+            "status": "confirmed",
+            "summary": f"Event {i}",
+            "description": "Synthetic event " * 4,
+            "start": {"dateTime": event_start.isoformat()},
+            "end": {"dateTime": (event_start + duration).isoformat()},
+            "attendees": [
+                {"email": f"guest{j}@example.com", "responseStatus": "accepted"}
+                for j in range(3)
+            ],
+            "organizer": {"email": "owner@example.com"},
+        })
+    return events
+
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _event_time(bound: Dict[str, str]) -> datetime:
+    """Start or end of an event; all-day dates are taken at midnight UTC"""
+    if "dateTime" in bound:
+        return _parse_time(bound["dateTime"])
+    return datetime.fromisoformat(bound["date"]).replace(tzinfo=timezone.utc)
+
+
+def _parse_fields(mask: str) -> Dict[str, Any]:
+    """Parse a partial-response mask like "nextPageToken,items(id,start(date))" """
+    fields: Dict[str, Any] = {}
+    depth = 0
+    begin = 0
+    for i, char in enumerate(mask + ","):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            part = mask[begin:i].strip()
+            begin = i + 1
+            if "(" in part:
+                name, nested = part.split("(", 1)
+                fields[name] = _parse_fields(nested[:-1])
+            elif part:
+                fields[part] = None
+    return fields
+
+
+def _select_fields(value: Any, fields: Dict[str, Any]) -> Any:
+    """Apply a parsed mask the way Google's `fields` parameter does"""
+    if isinstance(value, list):
+        return [_select_fields(item, fields) for item in value]
+    if isinstance(value, dict):
+        return {
+            key: _select_fields(item, fields[key]) if fields[key] else item
+            for key, item in value.items()
+            if key in fields
+        }
+    return value
+
+
+class FakeGoogle:
+    """In-process fake of Google OAuth and Calendar endpoints"""
+    
+    def __init__(
+        self,
+        latency: float = 0.0,
+        page_size: int = 50,
+        events: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+    ):
+        self.latency = latency
+        self.page_size = page_size
+        self.calendars = events if events is not None else {"primary": make_events(10)}
+        self.requests: Counter = Counter()
+        # Incremental sync bookkeeping: calendar -> event id -> (seq, resource)
+        self._seq = 0
+        self._changes: Dict[str, Dict[str, tuple]] = {}
+        self.sync_tokens_expired = False
+        self.unselected_calendars: set = set()
+        self.issue_id_token = True
+        self.field_masks: List[Optional[str]] = []  # `fields` of each events.list call
+        self._throttled: List[JSONResponse] = []  # answers to the next Calendar calls
+        self.app = self._create_app()
+    
+    def update_event(self, calendar_id: str, event: Dict[str, Any]):
+        """Insert or replace an event, recording it as a change"""
+        items = self.calendars.setdefault(calendar_id, [])
+        items[:] = [e for e in items if e["id"] != event["id"]] + [event]
+        items.sort(key=lambda e: _event_time(e["start"]))
+        self._seq += 1
+        self._changes.setdefault(calendar_id, {})[event["id"]] = (self._seq, event)
+    
+    def delete_event(self, calendar_id: str, event_id: str):
+        """Delete an event, recording a cancelled tombstone as a change"""
+        items = self.calendars.get(calendar_id, [])
+        items[:] = [e for e in items if e["id"] != event_id]
+        self._seq += 1
+        tombstone = {"kind": "calendar#event", "id": event_id, "status": "cancelled"}
+        self._changes.setdefault(calendar_id, {})[event_id] = (self._seq, tombstone)
+    
+    def throttle(self, count: int, status: int = 429, retry_after: Optional[str] = None):
+        """
+        Reject the next `count` Calendar API calls as rate limited
+        
+        Args:
+            count: Number of calls to reject
+            status: 429, or 403 for a rateLimitExceeded error
+            retry_after: Retry-After header value to send (optional)
+        """
+        body = {"error": {
+            "code": status,
+            "message": "Rate Limit Exceeded",
+            "errors": [{"domain": "usageLimits", "reason": "rateLimitExceeded"}],
+        }}
+        headers = {"Retry-After": retry_after} if retry_after is not None else None
+        self._throttled.extend(
+            JSONResponse(body, status_code=status, headers=headers) for _ in range(count)
+        )
+    
+    def _throttled_response(self, operation: str) -> Optional[JSONResponse]:
+        if not self._throttled:
+            return None
+        self.requests[f"{operation}.throttled"] += 1
+        return self._throttled.pop(0)
+    
+    async def _delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+    
+    def _create_app(self) -> FastAPI:
+        app = FastAPI()
+        
+        @app.post("/token")
+        async def token(request: Request):
+            self.requests["token"] += 1
+            await self._delay()
+            # Parsed by hand: request.form() would need python-multipart
+            form = {k: v[0] for k, v in parse_qs((await request.body()).decode()).items()}
+            if form.get("grant_type") == "refresh_token" and form.get("refresh_token") == "revoked":
+                return JSONResponse({"error": "invalid_grant"}, status_code=400)
+            body = {
+                "access_token": f"fake-access-{self.requests['token']}",
+                "expires_in": 3599,
+                "token_type": "Bearer",
+                "refresh_token": "fake-refresh",
+            }
+            if form.get("grant_type") == "authorization_code" and self.issue_id_token:
+                now = int(time.time())
+                body["id_token"] = jwt.encode({
+                    "iss": "https://accounts.google.com",
+                    "aud": form.get("client_id"),
+                    "sub": "fake-sub",
+                    "email": "fake@example.com",
+                    "iat": now,
+                    "exp": now + 3600,
+                }, "fake-google-signing-key", algorithm="HS256")
+            return body
+        
+        @app.get("/userinfo")
+        async def userinfo():
+            self.requests["userinfo"] += 1
+            await self._delay()
+            return {"sub": "fake-sub", "email": "fake@example.com"}
+        
+        @app.get("/calendar/v3/users/me/calendarList")
+        async def calendar_list():
+            self.requests["calendarList.list"] += 1
+            await self._delay()
+            throttled = self._throttled_response("calendarList.list")
+            if throttled:
+                return throttled
+            return {
+                "kind": "calendar#calendarList",
+                "items": [
+                    {
+                        "id": calendar_id,
+                        "primary": calendar_id == "primary",
+                        "selected": calendar_id not in self.unselected_calendars,
+                    }
+                    for calendar_id in self.calendars
+                ],
+            }
+        
+        @app.post("/calendar/v3/freeBusy")
+        async def freebusy_query(request: Request):
+            self.requests["freebusy.query"] += 1
+            await self._delay()
+            throttled = self._throttled_response("freebusy.query")
+            if throttled:
+                return throttled
+            
+            body = await request.json()
+            time_min = _parse_time(body["timeMin"])
+            time_max = _parse_time(body["timeMax"])
+            calendars = {}
+            for item in body.get("items", []):
+                if item["id"] not in self.calendars:
+                    calendars[item["id"]] = {"errors": [{"domain": "global", "reason": "notFound"}], "busy": []}
+                    continue
+                busy = []
+                for event in self.calendars[item["id"]]:
+                    if event.get("transparency") == "transparent":
+                        continue
+                    start = _parse_time(event["start"]["dateTime"])
+                    end = _parse_time(event["end"]["dateTime"])
+                    if start < time_max and end > time_min:
+                        busy.append({
+                            "start": max(start, time_min).isoformat(),
+                            "end": min(end, time_max).isoformat(),
+                        })
+                calendars[item["id"]] = {"busy": busy}
+            
+            return {
+                "kind": "calendar#freeBusy",
+                "timeMin": body["timeMin"],
+                "timeMax": body["timeMax"],
+                "calendars": calendars,
+            }
+        
+        @app.get("/calendar/v3/calendars/{calendar_id}/events")
+        async def events_list(calendar_id: str, request: Request):
+            self.requests["events.list"] += 1
+            await self._delay()
+            throttled = self._throttled_response("events.list")
+            if throttled:
+                return throttled
+            
+            if calendar_id not in self.calendars:
+                return JSONResponse(
+                    {"error": {"code": 404, "message": "Not Found"}},
+                    status_code=404
+                )
+            
+            params = request.query_params
+            items = self.calendars[calendar_id]
+            if params.get("syncToken"):
+                if self.sync_tokens_expired:
+                    return JSONResponse(
+                        {"error": {"code": 410, "message": "Sync token is no longer valid, a full sync is required."}},
+                        status_code=410
+                    )
+                since = int(params["syncToken"])
+                changes = self._changes.get(calendar_id, {}).values()
+                items = [event for seq, event in sorted(changes, key=lambda c: c[0]) if seq > since]
+            if params.get("timeMin"):
+                time_min = _parse_time(params["timeMin"])
+                items = [e for e in items if _event_time(e["end"]) > time_min]
+            if params.get("timeMax"):
+                time_max = _parse_time(params["timeMax"])
+                items = [e for e in items if _event_time(e["start"]) < time_max]
+            
+            page_size = min(int(params.get("maxResults", self.page_size)), self.page_size)
+            offset = int(params.get("pageToken", 0))
+            page = items[offset:offset + page_size]
+            
+            body: Dict[str, Any] = {"kind": "calendar#events", "items": page}
+            if offset + page_size < len(items):
+                body["nextPageToken"] = str(offset + page_size)
+            else:
+                body["nextSyncToken"] = str(self._seq)
+            
+            self.field_masks.append(params.get("fields"))
+            if params.get("fields"):
+                body = _select_fields(body, _parse_fields(params["fields"]))
+            return body
+        
+        return app
+    
+    def serve(self):
+        """
+        Run the fake on a free localhost port in a background thread
+        
+        Yields:
+            Base URL of the running server
+        """
+        return serve_app(self.app)
+
+
+@contextmanager
+def serve_app(app: Any) -> Iterator[str]:
+    """
+    Run an ASGI app with uvicorn on a free localhost port in a background thread
+    
+    Yields:
+        Base URL of the running server
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    
+    config = uvicorn.Config(app, log_level="warning", lifespan="off")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    
+    while not server.started:
+        time.sleep(0.01)
+    
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+        sock.close()
@@ -0,0 +1,236 @@
+"""
+Load test: the backend under concurrency against a local fake Google
+
+Starts the fake Google endpoints (token, userinfo, Calendar) in-process,
+runs the app with uvicorn in a subprocess pointed at them, then sends an
+open-loop request stream at a fixed rate to each scenario:
+
+    me        GET /auth/me
+    events    GET /api/events
+    callback  GET /auth/login, then GET /auth/callback with the issued state
+
+Reports p50/p95/p99 latency, throughput and error rate per scenario and
+writes them as JSON for comparing runs.
+
+Usage (from backend/):
+    python -m benchmarks.load_test --rate 50 --duration 10 --latency 0.05 --output results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+
+from benchmarks.fake_google import FakeGoogle, make_events
+
+SCENARIOS = ("me", "events", "callback")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of already sorted values"""
+    if not values:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(values)))
+    return values[min(rank, len(values)) - 1]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    """Latency percentiles (ms), throughput and error rate of one scenario"""
+    ordered = sorted(latencies)
+    total = len(ordered)
+    return {
+        "requests": total,
+        "errors": errors,
+        "error_rate": errors / total if total else 0.0,
+        "throughput_rps": total / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "mean": sum(ordered) / total * 1000 if total else 0.0,
+            "p50": percentile(ordered, 50) * 1000,
+            "p95": percentile(ordered, 95) * 1000,
+            "p99": percentile(ordered, 99) * 1000,
+            "max": ordered[-1] * 1000 if total else 0.0,
+        },
+    }
+
+
+async def run_scenario(
+    call: Callable[[], Awaitable[bool]],
+    rate: float,
+    duration: float,
+) -> Dict[str, Any]:
+    """
+    Start `call` every 1/rate seconds for `duration` seconds
+    
+    Arrivals do not wait for earlier requests to finish (open loop), so a
+    slow backend shows up as growing latency rather than a lower request rate.
+    """
+    latencies: List[float] = []
+    errors = 0
+    
+    async def timed():
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            ok = await call()
+        except httpx.HTTPError:
+            ok = False
+        latencies.append(time.perf_counter() - start)
+        if not ok:
+            errors += 1
+    
+    tasks = []
+    interval = 1 / rate
+    started = time.perf_counter()
+    for i in range(int(rate * duration)):
+        delay = started + i * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(timed()))
+    await asyncio.gather(*tasks)
+    
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_backend(env: Dict[str, str], workers: int) -> "tuple[subprocess.Popen, str]":
+    """Run the app with uvicorn in a subprocess and wait for /healthz"""
+    port = _free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "app:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning",
+        ],
+        env={**os.environ, **env},
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Backend exited during startup")
+        try:
+            if httpx.get(f"{base_url}/healthz").status_code == 200:
+                return process, base_url
+        except httpx.TransportError:
+            pass
+        time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Backend did not start within 30 seconds")
+
+
+async def drive(base_url: str, session: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """Run the selected scenarios one after another"""
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=200)
+    timeout = httpx.Timeout(30.0)
+    
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        cookies = {"Cookie": f"session={session}"}
+        
+        async def me() -> bool:
+            response = await client.get("/auth/me", headers=cookies)
+            return response.status_code == 200
+        
+        async def events() -> bool:
+            response = await client.get("/api/events", headers=cookies, params={
+                "timeMin": "2025-01-01T00:00:00Z",
+                "timeMax": "2025-12-31T00:00:00Z",
+                "timezone": "UTC",
+            })
+            return response.status_code == 200
+        
+        async def callback() -> bool:
+            login = await client.get("/auth/login")
+            state = parse_qs(urlparse(login.json()["auth_url"]).query).get("state")
+            if not state:
+                return False
+            response = await client.get("/auth/callback", params={"code": "load-test", "state": state[0]})
+            return response.status_code < 400
+        
+        calls = {"me": me, "events": events, "callback": callback}
+        results = {}
+        for name in args.scenarios:
+            # Warm connections and caches before measuring
+            await calls[name]()
+            results[name] = await run_scenario(calls[name], args.rate, args.duration)
+            print(f"{name:9} {json.dumps(results[name])}")
+        return results
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=50, help="requests per second per scenario")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per scenario")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake Google response delay (seconds)")
+    parser.add_argument("--page-size", type=int, default=50, help="fake Google events.list page size")
+    parser.add_argument("--events", type=int, default=500, help="events in the fake primary calendar")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--output", help="write results JSON to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    fake = FakeGoogle(latency=args.latency, page_size=args.page_size, events={"primary": make_events(args.events)})
+    
+    with tempfile.TemporaryDirectory() as workdir, fake.serve() as google_url:
+        env = {
+            "DATABASE_URL": f"sqlite:///{workdir}/load_test.db",
+            "GOOGLE_CLIENT_ID": "load-test-client",
+            "GOOGLE_CLIENT_SECRET": "load-test-secret",
+            "OAUTH_REDIRECT_URI": "http://localhost:3000/auth/callback",
+            "SESSION_SECRET": "load-test-session-secret",
+            "GOOGLE_TOKEN_URL": f"{google_url}/token",
+            "GOOGLE_USERINFO_URL": f"{google_url}/userinfo",
+            "CALENDAR_API_ENDPOINT": f"{google_url}/calendar/v3/",
+        }
+        # Seed the test user with the same settings the backend will read
+        os.environ.update(env)
+        from db import init_db, upsert_user_with_credential
+        from utils import create_session_jwt
+        init_db()
+        user = upsert_user_with_credential("load-test@example.com", "load-test-sub", "fake-refresh")
+        session = create_session_jwt(user.id)
+        
+        process, base_url = start_backend(env, args.workers)
+        try:
+            results = asyncio.run(drive(base_url, session, args))
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+    
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "rate": args.rate,
+            "duration": args.duration,
+            "google_latency": args.latency,
+            "page_size": args.page_size,
+            "events": args.events,
+            "workers": args.workers,
+        },
+        "google_requests": dict(fake.requests),
+        "scenarios": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,160 +1,476 @@
 """
 Google Calendar API integration
 """
-import os
-from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from dotenv import load_dotenv
+import asyncio
+import hashlib
+from datetime import timedelta
+from typing import Optional, Sequence, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
+import orjson
 
+from config import settings
 from deps import get_current_user
 from db import User, get_refresh_token_for_user
-from schemas import EventsListResponse, EventResponse
-
-load_dotenv()
+from schemas import AvailabilityResponse, EventsBatchRequest, EventsBatchResponse, EventsListResponse
+from calendar_client import CalendarAPIError, calendar_client, calendar_resource
+import availability
+import event_sync
+import event_windows
+import multi_calendar
+from metrics import token_refreshes_total
+from token_cache import Refresher, access_token_cache
+from token_refresh import token_refresh_scheduler
+from utils import refresh_access_token
 
 router = APIRouter()
 
-GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
-GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
+# Page size used when walking all pages server-side (Google allows up to 2500)
+EVENTS_STREAM_PAGE_SIZE = settings.events_stream_page_size
+
+# Max windows in one POST /events/batch request
+EVENTS_BATCH_MAX_WINDOWS = settings.events_batch_max_windows
+
+# Max time covered by the merged windows of one POST /events/batch request
+EVENTS_BATCH_MAX_SPAN = timedelta(days=settings.events_batch_max_span_days)
+
+# Response fields -> the parts of Google's event resource they are mapped from
+EVENT_FIELD_SOURCES = {
+    "id": "id",
+    "summary": "summary",
+    "start": "start(date,dateTime)",
+    "end": "end(date,dateTime)",
+    "attendees": "attendees(email)",
+    "calendarId": "organizer(email)",
+}
 
 
-def get_credentials(user_id: int) -> Credentials:
+def token_refresher(user_id: int, trigger: str = "request") -> Refresher:
     """
-    Get Google OAuth credentials for user
+    Build the refresher exchanging a user's refresh token for an access token
     
-    Retrieves refresh token from database and creates Credentials object.
-    The Credentials object will automatically refresh access token when needed.
+    Args:
+        user_id: User ID
+        trigger: "request" or "background", for token_refreshes_total
+    
+    Returns:
+        Coroutine function for access_token_cache.get
+    """
+    async def refresh():
+        try:
+            refresh_token = get_refresh_token_for_user(user_id)
+            
+            if not refresh_token:
+                raise HTTPException(
+                    status_code=401,
+                    detail="No Google credentials found. Please re-authenticate."
+                )
+            
+            tokens = await refresh_access_token(refresh_token)
+        except HTTPException:
+            token_refreshes_total.inc(trigger, "error")
+            raise
+        
+        token_refreshes_total.inc(trigger, "ok")
+        return tokens["access_token"], tokens.get("expires_in")
+    
+    return refresh
+
+
+async def get_access_token(user_id: int) -> str:
+    """
+    Get a valid Google access token for user
+    
+    Uses the cached access token while it is fresh. Only when it is close to
+    expiry is the refresh token loaded from the database and exchanged for
+    a new access token (at most once per user at a time). The user is marked
+    active, so the background scheduler keeps the token fresh from now on.
     
     Args:
         user_id: User ID
     
     Returns:
-        Google Credentials object
+        Access token string
+    
+    Raises:
+        HTTPException: If no credentials found for user or refresh fails
+    """
+    token_refresh_scheduler.touch(user_id)
+    cached = await access_token_cache.get(user_id, token_refresher(user_id))
+    return cached.access_token
+
+
+def background_token_refresher(user_id: int) -> Refresher:
+    """Refresher used by token_refresh_scheduler"""
+    return token_refresher(user_id, trigger="background")
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """
+    Parse the ?fields= query parameter
+    
+    Args:
+        fields: Comma-separated response field names, or None for all
+    
+    Returns:
+        Requested field names in schema order (id is always included),
+        or None for all fields
     
     Raises:
-        HTTPException: If no credentials found for user
+        HTTPException: 400 on unknown or no field names
     """
-    refresh_token = get_refresh_token_for_user(user_id)
+    if not fields:
+        return None
     
-    if not refresh_token:
+    requested = {name.strip() for name in fields.split(",") if name.strip()}
+    if not requested:
+        raise HTTPException(status_code=400, detail="fields must name at least one field")
+    unknown = requested - EVENT_FIELD_SOURCES.keys()
+    if unknown:
         raise HTTPException(
-            status_code=401,
-            detail="No Google credentials found. Please re-authenticate."
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}. "
+                   f"Allowed: {', '.join(EVENT_FIELD_SOURCES)}"
         )
     
-    # Create credentials object
-    # The credentials will automatically refresh the access token when needed
-    creds = Credentials(
-        token=None,  # No access token yet, will be refreshed
-        refresh_token=refresh_token,
-        token_uri="https://oauth2.googleapis.com/token",
-        client_id=GOOGLE_CLIENT_ID,
-        client_secret=GOOGLE_CLIENT_SECRET,
-        scopes=["https://www.googleapis.com/auth/calendar.readonly"]
+    requested.add("id")
+    return tuple(name for name in EVENT_FIELD_SOURCES if name in requested)
+
+
+def google_fields_mask(fields: Optional[Sequence[str]] = None) -> str:
+    """
+    Partial-response mask asking Google only for what map_event reads
+    
+    Args:
+        fields: Response fields to produce (default: all)
+    
+    Returns:
+        Value for the events.list `fields` parameter
+    """
+    sources = [EVENT_FIELD_SOURCES[name] for name in (fields or EVENT_FIELD_SOURCES)]
+    return f"nextPageToken,items({','.join(sources)})"
+
+
+def build_events_request(
+    time_min: str,
+    time_max: str,
+    tz_name: str,
+    page_token: Optional[str] = None,
+    max_results: int = 50,
+    calendar_id: str = "primary",
+    fields: Optional[Sequence[str]] = None,
+):
+    """
+    Prepare an events.list request for one calendar
+    
+    Args:
+        time_min: RFC3339 lower bound
+        time_max: RFC3339 upper bound
+        tz_name: IANA timezone name for returned times
+        page_token: Token for pagination (optional)
+        max_results: Page size
+        calendar_id: Google calendar ID (default: primary)
+        fields: Response fields needed (default: all); the rest of the
+            event resource is not requested from Google
+    
+    Returns:
+        Prepared request for calendar_client.execute
+    """
+    request_params = {
+        "calendarId": calendar_id,
+        "timeMin": time_min,
+        "timeMax": time_max,
+        "timeZone": tz_name,
+        "singleEvents": True,
+        "orderBy": "startTime",
+        "maxResults": max_results,
+        "fields": google_fields_mask(fields),
+    }
+    
+    if page_token:
+        request_params["pageToken"] = page_token
+    
+    return calendar_resource("events").list(**request_params)
+
+
+def map_event(event: dict, fields: Optional[Sequence[str]] = None) -> dict:
+    """
+    Map a Calendar API event resource to our schema
+    
+    Builds the EventResponse shape as a plain dict: responses are
+    serialized with orjson directly instead of being validated through
+    pydantic models once per event and again for the response model.
+    
+    Args:
+        event: Event resource from events.list
+        fields: Only include these response fields (default: all)
+    
+    Returns:
+        Dict with the EventResponse fields
+    """
+    if fields:
+        mapped = map_event(event)
+        return {name: mapped[name] for name in fields}
+    
+    # Get start/end time (could be dateTime or date for all-day events)
+    start = event.get("start") or {}
+    end = event.get("end") or {}
+    
+    # Get calendar ID
+    organizer = event.get("organizer")
+    
+    return {
+        "id": event.get("id", ""),
+        "summary": event.get("summary"),
+        "start": start.get("dateTime") or start.get("date", ""),
+        "end": end.get("dateTime") or end.get("date", ""),
+        "attendees": [
+            attendee["email"]
+            for attendee in event.get("attendees", ())
+            if attendee.get("email")
+        ],
+        "calendarId": organizer.get("email", "primary") if organizer else "primary",
+    }
+
+
+def events_response(events: list, next_page_token: Optional[str]) -> ORJSONResponse:
+    """
+    Serialize an events page (EventsListResponse shape) with orjson
+    
+    Args:
+        events: Event dicts from map_event
+        next_page_token: Token for the next page, if any
+    
+    Returns:
+        JSON response
+    """
+    return ORJSONResponse({"events": events, "nextPageToken": next_page_token})
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Check an If-None-Match header against an ETag (weak comparison, RFC 9110)
+    
+    Args:
+        if_none_match: Header value ("*" or comma-separated entity tags)
+        etag: Current entity tag
+    
+    Returns:
+        True if the client's copy is current
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque
+        for candidate in if_none_match.split(",")
+    )
+
+
+def with_etag(response: Response, request: Request) -> Response:
+    """
+    Tag a serialized events response and answer conditional requests
+    
+    The ETag is a BLAKE2 hash of the response body (tens of microseconds
+    for a 50-event page, ~1.6 ms per MB), so it changes whenever any mapped
+    field, the page token or the requested fields change.
+    
+    Args:
+        response: Rendered JSON response
+        request: Incoming request (If-None-Match)
+    
+    Returns:
+        The response with ETag set, or an empty 304 if the client is current
+    """
+    etag = f'"{hashlib.blake2b(response.body, digest_size=16).hexdigest()}"'
+    headers = {
+        "ETag": etag,
+        # Per-user data: browsers may keep it but must revalidate
+        "Cache-Control": "private, no-cache",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return response
+
+
+def calendar_http_error(error: CalendarAPIError, user_id: int) -> HTTPException:
+    """
+    Convert a Calendar API error into an HTTP error for the client
+    
+    Args:
+        error: Error from calendar_client
+        user_id: User the request was made for
+    
+    Returns:
+        HTTPException to raise
+    """
+    if error.status == 401:
+        # Access token revoked before its expiry - force a refresh next time
+        access_token_cache.invalidate(user_id)
+    return HTTPException(
+        status_code=error.status,
+        detail=f"Google Calendar API error: {error.reason}"
     )
+
+
+async def list_events_all_calendars(
+    user_id: int,
+    access_token: str,
+    time_min: str,
+    time_max: str,
+    tz_name: str,
+    page_token: Optional[str] = None,
+    page_size: int = 50,
+    fields: Optional[Sequence[str]] = None,
+) -> ORJSONResponse:
+    """
+    List events across all selected calendars, merged by start time
+    
+    Args:
+        user_id: User ID
+        access_token: Google access token of the user
+        time_min: RFC3339 lower bound
+        time_max: RFC3339 upper bound
+        tz_name: IANA timezone name
+        page_token: Composite cursor from a previous page (optional)
+        page_size: Max events per page
+        fields: Response fields to include (default: all)
+    
+    Returns:
+        Merged events with composite nextPageToken
+    
+    Raises:
+        HTTPException: 400 on invalid timezone or page token
+    """
+    try:
+        tz = ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Unknown timezone: {tz_name}")
     
-    return creds
+    if page_token:
+        try:
+            state = multi_calendar.decode_cursor(page_token)
+        except multi_calendar.InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        calendar_ids = await multi_calendar.list_selected_calendars(user_id, access_token)
+        state = {calendar_id: (None, 0) for calendar_id in calendar_ids}
+    
+    # calendarId comes from the source calendar; start orders the merge
+    google_fields = None
+    if fields:
+        google_fields = [name for name in fields if name != "calendarId"]
+        if "start" not in google_fields:
+            google_fields.append("start")
+    
+    async def fetch_page(calendar_id: str, calendar_page_token: Optional[str]) -> dict:
+        request = build_events_request(
+            time_min, time_max, tz_name, calendar_page_token,
+            calendar_id=calendar_id, fields=google_fields,
+        )
+        return await calendar_client.execute(request, access_token, user_id)
+    
+    merged, next_state = await multi_calendar.merge_calendars(fetch_page, state, tz, page_size)
+    
+    events = []
+    for calendar_id, item in merged:
+        event = map_event(item)
+        event["calendarId"] = calendar_id
+        if fields:
+            event = {name: event[name] for name in fields}
+        events.append(event)
+    
+    return events_response(events, multi_calendar.encode_cursor(next_state))
 
 
 @router.get("/events", response_model=EventsListResponse)
 async def list_events(
+    http_request: Request,
     timeMin: str,
     timeMax: str,
     timezone: str = "Asia/Bangkok",
     pageToken: Optional[str] = None,
+    calendars: str = "primary",
+    fields: Optional[str] = None,
     user: User = Depends(get_current_user)
 ):
     """
     List calendar events for authenticated user
     
     Args:
+        http_request: Incoming request (for If-None-Match)
         timeMin: RFC3339 timestamp - minimum time for events (inclusive)
         timeMax: RFC3339 timestamp - maximum time for events (exclusive)
         timezone: IANA timezone name (default: Asia/Bangkok)
         pageToken: Token for pagination (optional)
+        calendars: "primary" (default) or "all" to merge every selected
+            calendar; calendarId is then the source calendar
+        fields: Comma-separated event fields to return (e.g. "summary,start,end");
+            id is always included. Default: all fields
         user: Current authenticated user
     
     Returns:
-        List of events with optional pagination token
+        List of events with optional pagination token, tagged with an
+        ETag; 304 without a body if If-None-Match matches
     
     Raises:
-        HTTPException: If credentials invalid or Calendar API fails
+        HTTPException: 400 on unknown calendars value; if credentials
+            invalid or Calendar API fails
     """
+    event_fields = parse_fields(fields)
+    if calendars not in ("primary", "all"):
+        raise HTTPException(status_code=400, detail=f"calendars must be 'primary' or 'all', not '{calendars}'")
+    
     try:
-        # Get user credentials
-        creds = get_credentials(user.id)
+        # Get user access token
+        access_token = await get_access_token(user.id)
         
-        # Build Calendar API service
-        service = build("calendar", "v3", credentials=creds)
+        if calendars == "all":
+            response = await list_events_all_calendars(
+                user.id, access_token, timeMin, timeMax, timezone, pageToken, fields=event_fields
+            )
+            return with_etag(response, http_request)
         
-        # Call Calendar API
-        request_params = {
-            "calendarId": "primary",
-            "timeMin": timeMin,
-            "timeMax": timeMax,
-            "timeZone": timezone,
-            "singleEvents": True,
-            "orderBy": "startTime",
-            "maxResults": 50,  # Limit results per page
-        }
+        if event_sync.EVENT_STORE_ENABLED:
+            # Apply Google's delta to the local store, then query it unless
+            # the range starts before the history the store holds
+            await event_sync.sync_if_stale(user.id, access_token)
+            try:
+                if event_sync.store_covers(user.id, timeMin):
+                    stored_events, next_page_token = event_sync.list_stored_events(
+                        user.id, timeMin, timeMax, timezone, pageToken
+                    )
+                    if event_fields:
+                        stored_events = [
+                            {name: event[name] for name in event_fields}
+                            for event in stored_events
+                        ]
+                    return with_etag(events_response(stored_events, next_page_token), http_request)
+            except event_sync.InvalidStoreQuery as e:
+                raise HTTPException(status_code=400, detail=str(e))
         
-        if pageToken:
-            request_params["pageToken"] = pageToken
-        
-        events_result = service.events().list(**request_params).execute()
+        # Call Calendar API
+        request = build_events_request(timeMin, timeMax, timezone, pageToken, fields=event_fields)
+        events_result = await calendar_client.execute(request, access_token, user.id)
         
         # Extract events
         items = events_result.get("items", [])
         
         # Map to our schema
-        mapped_events = []
-        for event in items:
-            # Get start/end time (could be dateTime or date for all-day events)
-            start = event.get("start", {})
-            end = event.get("end", {})
-            
-            start_time = start.get("dateTime") or start.get("date", "")
-            end_time = end.get("dateTime") or end.get("date", "")
-            
-            # Get attendees
-            attendees = []
-            if event.get("attendees"):
-                attendees = [
-                    attendee.get("email", "")
-                    for attendee in event.get("attendees", [])
-                    if attendee.get("email")
-                ]
-            
-            # Get calendar ID
-            organizer = event.get("organizer", {})
-            calendar_id = organizer.get("email", "primary")
-            
-            mapped_events.append(EventResponse(
-                id=event.get("id", ""),
-                summary=event.get("summary"),
-                start=start_time,
-                end=end_time,
-                attendees=attendees,
-                calendarId=calendar_id
-            ))
+        mapped_events = [map_event(event, event_fields) for event in items]
         
         # Get next page token if available
         next_page_token = events_result.get("nextPageToken")
         
-        return EventsListResponse(
-            events=mapped_events,
-            nextPageToken=next_page_token
-        )
-        
-    except HttpError as error:
+        return with_etag(events_response(mapped_events, next_page_token), http_request)
+    
+    except CalendarAPIError as error:
         # Google API error
-        raise HTTPException(
-            status_code=error.resp.status,
-            detail=f"Google Calendar API error: {error._get_reason()}"
-        )
+        raise calendar_http_error(error, user.id)
     except HTTPException:
         # Re-raise our own exceptions
         raise
@@ -165,3 +481,326 @@ async def list_events(
             detail=f"Failed to fetch calendar events: {str(e)}"
         )
 
+
+@router.post("/events/batch", response_model=EventsBatchResponse)
+async def list_events_batch(
+    batch: EventsBatchRequest,
+    user: User = Depends(get_current_user)
+):
+    """
+    List calendar events for several date windows in one request
+    
+    Overlapping windows are merged on their UTC bounds, so every merged
+    range is fetched from Google once (all pages, ranges concurrently, one
+    access token) even if windows ask for it in different timezones. Each
+    window's events are then sliced out of its range and expressed in the
+    window's timezone; results are not paginated.
+    
+    Args:
+        batch: Windows ({timeMin, timeMax, timezone}) and optional
+            comma-separated fields, as for GET /events
+        user: Current authenticated user
+    
+    Returns:
+        {"windows": {"timeMin/timeMax/timezone": {"events": [...], "nextPageToken": null}}}
+    
+    Raises:
+        HTTPException: 400 on invalid windows, 422 if there are too many
+            windows or they cover too long a span, or if credentials invalid
+            or Calendar API fails
+    """
+    event_fields = parse_fields(batch.fields)
+    if not batch.windows:
+        raise HTTPException(status_code=400, detail="No windows given")
+    if len(batch.windows) > EVENTS_BATCH_MAX_WINDOWS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Too many windows (max {EVENTS_BATCH_MAX_WINDOWS})"
+        )
+    
+    # key -> (window, parsed bounds), duplicates collapse here
+    windows = {}
+    for window in batch.windows:
+        try:
+            ZoneInfo(window.timezone)
+        except (ZoneInfoNotFoundError, ValueError):
+            raise HTTPException(status_code=400, detail=f"Unknown timezone: {window.timezone}")
+        try:
+            parsed = event_windows.parse_window(window.timeMin, window.timeMax)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid window: {e}")
+        key = event_windows.window_key(window.timeMin, window.timeMax, window.timezone)
+        windows[key] = (window, parsed)
+    
+    # Ranges fetched from Google, in UTC so timezones do not split them
+    ranges = event_windows.merge_windows(parsed for _, parsed in windows.values())
+    if sum((end - start for start, end in ranges), timedelta()) > EVENTS_BATCH_MAX_SPAN:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Windows span too long (max {EVENTS_BATCH_MAX_SPAN.days} days)"
+        )
+    
+    try:
+        access_token = await get_access_token(user.id)
+        
+        if event_sync.EVENT_STORE_ENABLED:
+            await event_sync.sync_if_stale(user.id, access_token)
+            # Windows reaching before the stored history go to Google together
+            if all(
+                event_sync.store_covers(user.id, window.timeMin)
+                for window, _ in windows.values()
+            ):
+                results = {}
+                for key, (window, _) in windows.items():
+                    events = event_sync.list_stored_window(
+                        user.id, window.timeMin, window.timeMax, window.timezone
+                    )
+                    if event_fields:
+                        events = [{name: event[name] for name in event_fields} for event in events]
+                    results[key] = {"events": events, "nextPageToken": None}
+                return ORJSONResponse({"windows": results})
+        
+        # Slicing needs start and end even if the client did not ask for them
+        google_fields = None
+        if event_fields:
+            google_fields = list(event_fields)
+            google_fields += [name for name in ("start", "end") if name not in google_fields]
+        
+        async def fetch_range(tz_name: str, time_range: event_windows.Window) -> list:
+            time_min, time_max = (bound.isoformat() for bound in time_range)
+            items = []
+            page_token = None
+            while True:
+                request = build_events_request(
+                    time_min, time_max, tz_name, page_token,
+                    max_results=EVENTS_STREAM_PAGE_SIZE, fields=google_fields,
+                )
+                page = await calendar_client.execute(request, access_token, user.id)
+                items.extend(page.get("items", []))
+                page_token = page.get("nextPageToken")
+                if not page_token:
+                    return items
+        
+        # The one merged range that contains each window
+        range_of = {
+            key: next(
+                index for index, (range_start, range_end) in enumerate(ranges)
+                if range_start <= start and end <= range_end
+            )
+            for key, (_, (start, end)) in windows.items()
+        }
+        # Each range is fetched in the timezone of one of its windows
+        range_tz = {index: windows[key][0].timezone for key, index in range_of.items()}
+        fetched = await asyncio.gather(*(
+            fetch_range(range_tz[index], time_range) for index, time_range in enumerate(ranges)
+        ))
+        
+        results = {}
+        for key, (window, parsed) in windows.items():
+            index = range_of[key]
+            tz = ZoneInfo(window.timezone)
+            sliced = event_windows.slice_events(fetched[index], parsed, tz)
+            if window.timezone != range_tz[index]:
+                sliced = [event_windows.localize_event(event, tz) for event in sliced]
+            results[key] = {
+                "events": [map_event(event, event_fields) for event in sliced],
+                "nextPageToken": None,
+            }
+        
+        return ORJSONResponse({"windows": results})
+    
+    except CalendarAPIError as error:
+        raise calendar_http_error(error, user.id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to fetch calendar events: {str(e)}"
+        )
+
+
+@router.get("/availability", response_model=AvailabilityResponse)
+async def get_availability(
+    timeMin: str,
+    timeMax: str,
+    timezone: str = "Asia/Bangkok",
+    workdayStart: str = "09:00",
+    workdayEnd: str = "18:00",
+    minDuration: int = Query(30, ge=1, le=1440),
+    includeWeekends: bool = False,
+    calendars: str = "all",
+    user: User = Depends(get_current_user)
+):
+    """
+    Free slots within working hours, from Google's freebusy.query
+    
+    Only busy intervals are fetched from Google, not events. Intervals of
+    all calendars are merged, and free slots are what remains of each
+    day's working hours in the requested timezone.
+    
+    Args:
+        timeMin: RFC3339 timestamp - start of the range (inclusive)
+        timeMax: RFC3339 timestamp - end of the range (exclusive)
+        timezone: IANA timezone of the working hours and returned times
+        workdayStart: Local start of the working day, "HH:MM"
+        workdayEnd: Local end of the working day, "HH:MM"
+        minDuration: Minimum free slot length in minutes
+        includeWeekends: Also look for free slots on Saturday and Sunday
+        calendars: "all" (default) for every selected calendar, or "primary"
+        user: Current authenticated user
+    
+    Returns:
+        Merged busy intervals, free slots, and calendars Google reported
+        errors for (their busy time is unknown)
+    
+    Raises:
+        HTTPException: 400 on invalid parameters, or if credentials invalid
+            or Calendar API fails
+    """
+    try:
+        tz = ZoneInfo(timezone)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Unknown timezone: {timezone}")
+    try:
+        range_start, range_end = event_windows.parse_window(timeMin, timeMax)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid range: {e}")
+    try:
+        day_start = availability.parse_time_of_day(workdayStart)
+        day_end = availability.parse_time_of_day(workdayEnd)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Working hours must be HH:MM")
+    if day_end <= day_start:
+        raise HTTPException(status_code=400, detail="workdayEnd must be after workdayStart")
+    if calendars not in ("primary", "all"):
+        raise HTTPException(status_code=400, detail=f"calendars must be 'primary' or 'all', not '{calendars}'")
+    
+    try:
+        access_token = await get_access_token(user.id)
+        
+        if calendars == "all":
+            calendar_ids = await multi_calendar.list_selected_calendars(user.id, access_token)
+        else:
+            calendar_ids = ["primary"]
+        
+        async def query(chunk: list) -> dict:
+            request = calendar_resource("freebusy").query(body={
+                "timeMin": range_start.isoformat(),
+                "timeMax": range_end.isoformat(),
+                "timeZone": timezone,
+                "items": [{"id": calendar_id} for calendar_id in chunk],
+            })
+            return await calendar_client.execute(request, access_token, user.id)
+        
+        chunk_size = availability.FREEBUSY_MAX_CALENDARS
+        responses = await asyncio.gather(*(
+            query(calendar_ids[i:i + chunk_size]) for i in range(0, len(calendar_ids), chunk_size)
+        ))
+        
+        intervals = []
+        calendar_errors = {}
+        for response in responses:
+            busy, errors = availability.busy_intervals(response)
+            intervals.extend(busy)
+            calendar_errors.update(errors)
+        
+        busy = availability.merge_intervals(intervals)
+        windows = availability.working_hours(
+            range_start, range_end, tz, day_start, day_end, includeWeekends
+        )
+        free = availability.free_slots(busy, windows, timedelta(minutes=minDuration))
+        
+        return ORJSONResponse({
+            "timezone": timezone,
+            "busy": availability.format_intervals(busy, tz),
+            "free": availability.format_intervals(free, tz),
+            "calendarErrors": calendar_errors,
+        })
+    
+    except CalendarAPIError as error:
+        raise calendar_http_error(error, user.id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to fetch availability: {str(e)}"
+        )
+
+
+@router.get("/events/stream")
+async def stream_events(
+    timeMin: str,
+    timeMax: str,
+    timezone: str = "Asia/Bangkok",
+    fields: Optional[str] = None,
+    user: User = Depends(get_current_user)
+):
+    """
+    Stream all calendar events in a range as NDJSON (one event per line)
+    
+    Follows nextPageToken server-side. The next page is fetched while the
+    current one is written out, and only one page is held in memory.
+    Errors after the first page are reported as a final {"error": ...} line.
+    
+    Args:
+        timeMin: RFC3339 timestamp - minimum time for events (inclusive)
+        timeMax: RFC3339 timestamp - maximum time for events (exclusive)
+        timezone: IANA timezone name (default: Asia/Bangkok)
+        fields: Comma-separated event fields to return (default: all)
+        user: Current authenticated user
+    
+    Returns:
+        application/x-ndjson streaming response
+    
+    Raises:
+        HTTPException: 400 on invalid timezone; if credentials invalid or
+            the first page fails
+    """
+    event_fields = parse_fields(fields)
+    # Checked before the response starts: afterwards no status can be sent
+    try:
+        ZoneInfo(timezone)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Unknown timezone: {timezone}")
+    access_token = await get_access_token(user.id)
+    
+    async def fetch_page(page_token: Optional[str]) -> dict:
+        request = build_events_request(
+            timeMin, timeMax, timezone, page_token,
+            max_results=EVENTS_STREAM_PAGE_SIZE, fields=event_fields,
+        )
+        return await calendar_client.execute(request, access_token, user.id)
+    
+    # Fetch the first page up front so failures still map to a status code
+    try:
+        first_page = await fetch_page(None)
+    except CalendarAPIError as error:
+        raise calendar_http_error(error, user.id)
+    
+    async def generate():
+        page = first_page
+        next_task = None
+        try:
+            while True:
+                page_token = page.get("nextPageToken")
+                next_task = asyncio.create_task(fetch_page(page_token)) if page_token else None
+                
+                lines = [orjson.dumps(map_event(event, event_fields)) for event in page.get("items", [])]
+                if lines:
+                    yield b"\n".join(lines) + b"\n"
+                
+                if next_task is None:
+                    break
+                try:
+                    page = await next_task
+                except CalendarAPIError as error:
+                    yield orjson.dumps({"error": {"status": error.status, "reason": error.reason}}) + b"\n"
+                    break
+        finally:
+            # Client went away mid-stream
+            if next_task is not None and not next_task.done():
+                next_task.cancel()
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
@@ -0,0 +1,306 @@
+"""
+Non-blocking HTTP client for Google Calendar API calls
+"""
+import asyncio
+import threading
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+import httpx
+
+from cache import TTLCache
+from config import settings
+from metrics import google_request_duration_seconds, google_retries_total, google_throttled_total
+from rate_limit import AIMDLimiter, TokenBucket, backoff_delay, parse_retry_after
+from utils import discard_http_client
+
+if TYPE_CHECKING:
+    # google-api-python-client is slow to import; loaded on first use
+    from googleapiclient.discovery import Resource
+    from googleapiclient.http import HttpRequest
+
+# Configuration
+GOOGLE_HTTP_CONNECT_TIMEOUT = settings.google_http_connect_timeout
+GOOGLE_HTTP_READ_TIMEOUT = settings.google_http_read_timeout
+GOOGLE_HTTP_MAX_CONNECTIONS = settings.google_http_max_connections
+GOOGLE_HTTP_MAX_KEEPALIVE = settings.google_http_max_keepalive
+GOOGLE_HTTP_KEEPALIVE_EXPIRY = settings.google_http_keepalive_expiry
+CALENDAR_MAX_CONCURRENCY = settings.calendar_max_concurrency
+CALENDAR_MIN_CONCURRENCY = settings.calendar_min_concurrency
+GOOGLE_RATE_LIMIT = settings.google_rate_limit  # calls/s across all users, 0 = off
+GOOGLE_RATE_BURST = settings.google_rate_burst
+GOOGLE_USER_RATE_LIMIT = settings.google_user_rate_limit  # calls/s per user, 0 = off
+GOOGLE_USER_RATE_BURST = settings.google_user_rate_burst
+GOOGLE_RETRY_ATTEMPTS = settings.google_retry_attempts
+GOOGLE_RETRY_BASE_DELAY = settings.google_retry_base_delay  # seconds
+GOOGLE_RETRY_MAX_DELAY = settings.google_retry_max_delay  # seconds
+
+# 403 reasons Google uses for quota throttling (other 403s are permission errors)
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+# Override Calendar API root (e.g. a local stand-in server); default is Google's
+CALENDAR_API_ENDPOINT = settings.calendar_api_endpoint
+
+# Process-wide Calendar v3 service (built once from the bundled discovery document)
+_calendar_service: Optional["Resource"] = None
+_calendar_resources: dict = {}
+_service_lock = threading.Lock()
+
+
+def get_calendar_service() -> "Resource":
+    """
+    Get the shared Calendar v3 service
+    
+    The discovery document is loaded from the static copy bundled with
+    google-api-python-client, so no network call is made. The service is
+    only used to prepare requests; they are executed by CalendarClient
+    with the user's access token.
+    
+    Returns:
+        Calendar v3 service resource
+    """
+    global _calendar_service
+    
+    if _calendar_service is None:
+        with _service_lock:
+            if _calendar_service is None:
+                from googleapiclient.discovery import build_from_document
+                from googleapiclient.discovery_cache import get_static_doc
+                from googleapiclient.http import build_http
+                
+                document = get_static_doc("calendar", "v3")
+                client_options = None
+                if CALENDAR_API_ENDPOINT:
+                    client_options = {"api_endpoint": CALENDAR_API_ENDPOINT}
+                _calendar_service = build_from_document(
+                    document,
+                    http=build_http(),
+                    client_options=client_options,
+                )
+    
+    return _calendar_service
+
+
+def calendar_resource(name: str) -> "Resource":
+    """
+    Get a cached resource collection (e.g. "events") of the shared service
+    
+    Calling service.events() rebuilds the collection from the discovery
+    document every time, so collections are cached alongside the service.
+    
+    Args:
+        name: Collection name
+    
+    Returns:
+        Resource collection
+    """
+    resource = _calendar_resources.get(name)
+    if resource is None:
+        resource = getattr(get_calendar_service(), name)()
+        _calendar_resources[name] = resource
+    return resource
+
+
+def set_calendar_endpoint(endpoint: Optional[str]):
+    """
+    Point the shared service at a different API root
+    
+    Args:
+        endpoint: API root URL, or None for Google's default
+    """
+    global CALENDAR_API_ENDPOINT, _calendar_service
+    
+    with _service_lock:
+        CALENDAR_API_ENDPOINT = endpoint
+        _calendar_service = None
+        _calendar_resources.clear()
+
+
+class CalendarAPIError(Exception):
+    """Error response (or transport failure) from the Calendar API"""
+    
+    def __init__(self, status: int, reason: str):
+        super().__init__(f"{status}: {reason}")
+        self.status = status
+        self.reason = reason
+
+
+class CalendarClient:
+    """
+    Executes Calendar API requests on a pooled httpx.AsyncClient
+    
+    Requests are prepared by the shared discovery service (URL, query
+    string, body); this client only performs the I/O. Connections are kept
+    alive between calls.
+    
+    Calls pass a per-user and a global token bucket, then an AIMD limit on
+    in-flight calls that halves whenever Google throttles. Throttled calls
+    (429, 403 rateLimitExceeded) are retried with jittered exponential
+    backoff, or after Retry-After when Google sends one.
+    """
+    
+    def __init__(
+        self,
+        connect_timeout: float = GOOGLE_HTTP_CONNECT_TIMEOUT,
+        read_timeout: float = GOOGLE_HTTP_READ_TIMEOUT,
+        max_connections: int = GOOGLE_HTTP_MAX_CONNECTIONS,
+        max_keepalive: int = GOOGLE_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry: float = GOOGLE_HTTP_KEEPALIVE_EXPIRY,
+        max_concurrency: int = CALENDAR_MAX_CONCURRENCY,
+        min_concurrency: int = CALENDAR_MIN_CONCURRENCY,
+        rate_limit: float = GOOGLE_RATE_LIMIT,
+        rate_burst: int = GOOGLE_RATE_BURST,
+        user_rate_limit: float = GOOGLE_USER_RATE_LIMIT,
+        user_rate_burst: int = GOOGLE_USER_RATE_BURST,
+        retry_attempts: int = GOOGLE_RETRY_ATTEMPTS,
+        retry_base_delay: float = GOOGLE_RETRY_BASE_DELAY,
+        retry_max_delay: float = GOOGLE_RETRY_MAX_DELAY,
+    ):
+        self.timeout = httpx.Timeout(
+            connect=connect_timeout,
+            read=read_timeout,
+            write=read_timeout,
+            pool=connect_timeout,
+        )
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.limiter = AIMDLimiter(max_concurrency, min_concurrency)
+        self.rate_limiter = TokenBucket(rate_limit, rate_burst)
+        self.user_rate_limit = user_rate_limit
+        self.user_rate_burst = user_rate_burst
+        # User ID -> bucket, see _user_bucket
+        self._user_buckets = TTLCache(maxsize=10000, ttl=3600)
+        self.retry_attempts = retry_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    def _ensure_client(self) -> httpx.AsyncClient:
+        # Pooled connections belong to one event loop. The app runs a single
+        # loop, but e.g. TestClient may start a new loop per request.
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            discard_http_client(self._client, self._loop)
+            self._client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits)
+            self._loop = loop
+        return self._client
+    
+    def _user_bucket(self, user_id: int) -> TokenBucket:
+        bucket = self._user_buckets.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(self.user_rate_limit, self.user_rate_burst)
+        # Re-set on every use so only buckets idle for the whole TTL expire;
+        # those have refilled completely, so dropping them resets nothing
+        self._user_buckets.set(user_id, bucket)
+        return bucket
+    
+    async def execute(self, request: "HttpRequest", access_token: str, user_id: int) -> Dict[str, Any]:
+        """
+        Execute a prepared Calendar API request
+        
+        Args:
+            request: Request built from the discovery service (not executed)
+            access_token: Google access token of the user
+            user_id: User the call is made for (per-user rate limit)
+        
+        Returns:
+            Decoded JSON response
+        
+        Raises:
+            CalendarAPIError: On non-2xx response (after retries when
+                throttled), timeout or transport error
+        """
+        client = self._ensure_client()
+        headers = {
+            "accept": "application/json",
+            "authorization": f"Bearer {access_token}",
+        }
+        if request.body is not None:
+            headers["content-type"] = request.headers.get("content-type", "application/json")
+        
+        # e.g. "calendar.events.list" -> "events.list"
+        operation = (request.methodId or "calendar").partition(".")[2] or request.methodId
+        
+        user_bucket = self._user_bucket(user_id)
+        attempt = 0
+        while True:
+            # Per-user first: a user waiting on their own limit must not
+            # hold reserved global tokens that other users could spend
+            await user_bucket.acquire()
+            await self.rate_limiter.acquire()
+            async with self.limiter:
+                try:
+                    with google_request_duration_seconds.time(operation):
+                        response = await client.request(
+                            request.method,
+                            request.uri,
+                            headers=headers,
+                            content=request.body,
+                        )
+                except httpx.TimeoutException:
+                    raise CalendarAPIError(504, "Timed out waiting for Google Calendar")
+                except httpx.HTTPError as e:
+                    raise CalendarAPIError(502, f"Connection to Google Calendar failed: {e}")
+            
+            if not _is_throttled(response):
+                self.limiter.on_success()
+                break
+            
+            self.limiter.on_throttle()
+            google_throttled_total.inc(operation)
+            delay = None
+            if attempt < self.retry_attempts:
+                delay = backoff_delay(
+                    attempt,
+                    parse_retry_after(response.headers.get("retry-after")),
+                    self.retry_base_delay,
+                    self.retry_max_delay,
+                )
+            if delay is None:
+                break
+            google_retries_total.inc(operation)
+            await asyncio.sleep(delay)
+            attempt += 1
+        
+        if response.status_code >= 400:
+            raise CalendarAPIError(response.status_code, _error_reason(response))
+        
+        return response.json()
+    
+    async def aclose(self):
+        """Close pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+
+def _is_throttled(response: httpx.Response) -> bool:
+    """Whether Google rejected the call for exceeding a rate limit"""
+    if response.status_code == 429:
+        return True
+    if response.status_code != 403:
+        return False
+    try:
+        errors = response.json()["error"].get("errors") or []
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return False
+    return any(error.get("reason") in RATE_LIMIT_REASONS for error in errors)
+
+
+def _error_reason(response: httpx.Response) -> str:
+    """Extract the human readable reason from a Google error response"""
+    try:
+        error = response.json().get("error", {})
+        if isinstance(error, dict):
+            return error.get("message") or response.reason_phrase
+        return str(error)
+    except ValueError:
+        return response.text or response.reason_phrase
+
+
+# Shared client instance
+calendar_client = CalendarClient()
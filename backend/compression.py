@@ -0,0 +1,216 @@
+"""
+Response compression negotiated through Accept-Encoding
+
+Brotli is used when the client accepts it and the optional `brotli` package
+is installed, gzip otherwise. Buffered responses smaller than
+COMPRESSION_MIN_SIZE are sent as-is. Streaming responses are compressed
+chunk by chunk with a sync flush after each chunk, so NDJSON lines reach
+the client as soon as they are produced.
+
+Whether a response is compressed depends on its size, which a 304 does not
+reveal. Every compressible response (and every 304) therefore carries
+`Vary: Accept-Encoding` and a weak ETag, whatever coding was used.
+"""
+import zlib
+from typing import List, Optional, Tuple
+
+from config import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Configuration
+COMPRESSION_MIN_SIZE = settings.compression_min_size  # bytes
+GZIP_LEVEL = settings.gzip_level  # 1 (fast) - 9 (small)
+BROTLI_QUALITY = settings.brotli_quality  # 0 (fast) - 11 (small)
+
+COMPRESSIBLE_TYPES = (
+    b"application/json",
+    b"application/x-ndjson",
+    b"application/javascript",
+    b"text/",
+)
+
+Headers = List[Tuple[bytes, bytes]]
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Pick a content coding from an Accept-Encoding header
+    
+    Args:
+        accept_encoding: Header value, e.g. "gzip, deflate, br;q=0.9"
+    
+    Returns:
+        "br", "gzip" or None for identity
+    """
+    accepted = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    
+    wildcard = accepted.get("*", 0.0)
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best = None
+    best_quality = 0.0
+    for coding in candidates:
+        quality = accepted.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+class _Compressor:
+    """Incremental gzip or brotli encoder"""
+    
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31 = gzip container
+    
+    def compress(self, data: bytes, finish: bool = False) -> bytes:
+        """Compress a chunk; flush so the output is decodable up to here"""
+        if self.encoding == "br":
+            out = self._brotli.process(data)
+            return out + (self._brotli.finish() if finish else self._brotli.flush())
+        out = self._zlib.compress(data)
+        return out + self._zlib.flush(zlib.Z_FINISH if finish else zlib.Z_SYNC_FLUSH)
+
+
+def _header(headers: Headers, name: bytes) -> Optional[bytes]:
+    for key, value in headers:
+        if key == name:
+            return value
+    return None
+
+
+def _set_header(headers: Headers, name: bytes, value: Optional[bytes]) -> Headers:
+    headers = [(key, val) for key, val in headers if key != name]
+    if value is not None:
+        headers.append((name, value))
+    return headers
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing JSON/NDJSON/text responses
+    
+    Compressed responses get Content-Encoding. All compressible responses
+    get `Vary: Accept-Encoding` and a weakened ETag (the bytes may depend on
+    the coding), which If-None-Match still matches under weak comparison.
+    """
+    
+    def __init__(self, app, min_size: Optional[int] = None):
+        self.app = app
+        self.min_size = COMPRESSION_MIN_SIZE if min_size is None else min_size
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        accept = _header(scope["headers"], b"accept-encoding")
+        encoding = choose_encoding(accept.decode("latin-1")) if accept else None
+        
+        start_message = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+        
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+            
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                content_type = _header(headers, b"content-type") or b""
+                if message["status"] == 304:
+                    # Same validators as the 200 would carry
+                    message["headers"] = _negotiated(headers)
+                    passthrough = True
+                    await send(message)
+                    return
+                if (
+                    _header(headers, b"content-encoding") is not None
+                    or message["status"] < 200
+                    or message["status"] == 204
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                ):
+                    passthrough = True
+                    await send(message)
+                    return
+                message["headers"] = _negotiated(headers)
+                if encoding is None:
+                    passthrough = True
+                    await send(message)
+                    return
+                # Hold the start until the first body chunk shows the size
+                start_message = message
+                return
+            
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+            
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            
+            if start_message is not None:
+                start, start_message = start_message, None
+                if not more_body and len(body) < self.min_size:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                
+                compressor = _Compressor(encoding)
+                headers = start["headers"]
+                headers = _set_header(headers, b"content-encoding", encoding.encode())
+                if more_body:
+                    headers = _set_header(headers, b"content-length", None)
+                    compressed = compressor.compress(body)
+                else:
+                    compressed = compressor.compress(body, finish=True)
+                    headers = _set_header(headers, b"content-length", str(len(compressed)).encode())
+                start["headers"] = headers
+                await send(start)
+                await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+                return
+            
+            await send({
+                "type": "http.response.body",
+                "body": compressor.compress(body, finish=not more_body),
+                "more_body": more_body,
+            })
+        
+        await self.app(scope, receive, send_wrapper)
+
+
+def _negotiated(headers: Headers) -> Headers:
+    """Headers of a response whose coding depends on Accept-Encoding"""
+    return _weaken_etag(_set_header(headers, b"vary", _vary(headers)))
+
+
+def _vary(headers: Headers) -> bytes:
+    vary = _header(headers, b"vary")
+    if not vary:
+        return b"Accept-Encoding"
+    if b"accept-encoding" in vary.lower():
+        return vary
+    return vary + b", Accept-Encoding"
+
+
+def _weaken_etag(headers: Headers) -> Headers:
+    etag = _header(headers, b"etag")
+    if etag and not etag.startswith(b"W/"):
+        return _set_header(headers, b"etag", b"W/" + etag)
+    return headers
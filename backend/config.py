@@ -0,0 +1,186 @@
+"""
+Application settings, read once from the environment
+
+A .env file in the working directory is loaded first (existing environment
+variables take precedence). Modules read their configuration from the
+shared `settings` object instead of calling os.getenv themselves.
+"""
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from dotenv import load_dotenv
+
+
+def _bool(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+@dataclass(frozen=True)
+class Settings:
+    """All environment-driven configuration (see env.template)"""
+    
+    # Google OAuth
+    google_client_id: Optional[str]
+    google_client_secret: Optional[str]
+    oauth_redirect_uri: Optional[str]
+    google_token_url: str
+    google_userinfo_url: str
+    
+    # Frontend and sessions
+    frontend_origin: str
+    session_secret: str
+    session_cache_size: int
+    
+    # Database
+    database_url: str
+    db_profile: str
+    db_pool_size: int
+    db_max_overflow: int
+    db_pool_timeout: float
+    sqlite_busy_timeout_ms: int
+    sqlite_cache_size_kb: int
+    user_cache_size: int
+    user_cache_ttl: float
+    
+    # OAuth state store
+    oauth_state_backend: str
+    oauth_state_ttl: float
+    oauth_state_max: int
+    redis_url: str
+    
+    # OAuth HTTP client
+    oauth_http_connect_timeout: float
+    oauth_http_read_timeout: float
+    oauth_http_max_connections: int
+    oauth_http_max_keepalive: int
+    oauth_http2: bool
+    
+    # Calendar API client
+    google_http_connect_timeout: float
+    google_http_read_timeout: float
+    google_http_max_connections: int
+    google_http_max_keepalive: int
+    google_http_keepalive_expiry: float
+    calendar_max_concurrency: int
+    calendar_min_concurrency: int
+    google_rate_limit: float
+    google_rate_burst: int
+    google_user_rate_limit: float
+    google_user_rate_burst: int
+    google_retry_attempts: int
+    google_retry_base_delay: float
+    google_retry_max_delay: float
+    calendar_api_endpoint: Optional[str]
+    access_token_refresh_margin: float
+    events_stream_page_size: int
+    multi_calendar_concurrency: int
+    events_batch_max_windows: int
+    events_batch_max_span_days: float
+    
+    # Background access token refresh
+    token_refresh_enabled: bool
+    token_refresh_interval: float
+    token_refresh_lead_time: float
+    token_refresh_jitter: float
+    token_refresh_active_window: float
+    token_refresh_concurrency: int
+    token_refresh_max_users: int
+    
+    # Local event store
+    event_store_enabled: bool
+    event_sync_interval: float
+    event_sync_past_days: int
+    
+    # Response compression
+    compression_min_size: int
+    gzip_level: int
+    brotli_quality: int
+    
+    # Profiling
+    profile_sample_rate: float
+    profile_token: Optional[str]
+    profile_dir: str
+    profile_max_files: int
+    
+    @classmethod
+    def from_env(cls) -> "Settings":
+        """Load .env and read every setting from the environment"""
+        load_dotenv()
+        return cls(
+            google_client_id=os.getenv("GOOGLE_CLIENT_ID"),
+            google_client_secret=os.getenv("GOOGLE_CLIENT_SECRET"),
+            oauth_redirect_uri=os.getenv("OAUTH_REDIRECT_URI"),
+            google_token_url=os.getenv("GOOGLE_TOKEN_URL", "https://oauth2.googleapis.com/token"),
+            google_userinfo_url=os.getenv("GOOGLE_USERINFO_URL", "https://www.googleapis.com/oauth2/v3/userinfo"),
+            
+            frontend_origin=os.getenv("FRONTEND_ORIGIN", "http://localhost:3000"),
+            session_secret=os.getenv("SESSION_SECRET", "dev-secret-change-in-production"),
+            session_cache_size=int(os.getenv("SESSION_CACHE_SIZE", "4096")),
+            
+            database_url=os.getenv("DATABASE_URL", "sqlite:///./app.db"),
+            db_profile=os.getenv("DB_PROFILE", "default"),
+            db_pool_size=int(os.getenv("DB_POOL_SIZE", "5")),
+            db_max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+            db_pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+            sqlite_busy_timeout_ms=int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+            sqlite_cache_size_kb=int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384")),
+            user_cache_size=int(os.getenv("USER_CACHE_SIZE", "1024")),
+            user_cache_ttl=float(os.getenv("USER_CACHE_TTL", "60")),
+            
+            oauth_state_backend=os.getenv("OAUTH_STATE_BACKEND", "memory"),
+            oauth_state_ttl=float(os.getenv("OAUTH_STATE_TTL", "600")),
+            oauth_state_max=int(os.getenv("OAUTH_STATE_MAX", "100000")),
+            redis_url=os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+            
+            oauth_http_connect_timeout=float(os.getenv("OAUTH_HTTP_CONNECT_TIMEOUT", "5")),
+            oauth_http_read_timeout=float(os.getenv("OAUTH_HTTP_READ_TIMEOUT", "10")),
+            oauth_http_max_connections=int(os.getenv("OAUTH_HTTP_MAX_CONNECTIONS", "50")),
+            oauth_http_max_keepalive=int(os.getenv("OAUTH_HTTP_MAX_KEEPALIVE", "10")),
+            oauth_http2=_bool("OAUTH_HTTP2", "true"),
+            
+            google_http_connect_timeout=float(os.getenv("GOOGLE_HTTP_CONNECT_TIMEOUT", "5")),
+            google_http_read_timeout=float(os.getenv("GOOGLE_HTTP_READ_TIMEOUT", "15")),
+            google_http_max_connections=int(os.getenv("GOOGLE_HTTP_MAX_CONNECTIONS", "100")),
+            google_http_max_keepalive=int(os.getenv("GOOGLE_HTTP_MAX_KEEPALIVE", "20")),
+            google_http_keepalive_expiry=float(os.getenv("GOOGLE_HTTP_KEEPALIVE_EXPIRY", "30")),
+            calendar_max_concurrency=int(os.getenv("CALENDAR_MAX_CONCURRENCY", "32")),
+            calendar_min_concurrency=int(os.getenv("CALENDAR_MIN_CONCURRENCY", "2")),
+            google_rate_limit=float(os.getenv("GOOGLE_RATE_LIMIT", "50")),
+            google_rate_burst=int(os.getenv("GOOGLE_RATE_BURST", "100")),
+            google_user_rate_limit=float(os.getenv("GOOGLE_USER_RATE_LIMIT", "10")),
+            google_user_rate_burst=int(os.getenv("GOOGLE_USER_RATE_BURST", "20")),
+            google_retry_attempts=int(os.getenv("GOOGLE_RETRY_ATTEMPTS", "3")),
+            google_retry_base_delay=float(os.getenv("GOOGLE_RETRY_BASE_DELAY", "0.25")),
+            google_retry_max_delay=float(os.getenv("GOOGLE_RETRY_MAX_DELAY", "8")),
+            calendar_api_endpoint=os.getenv("CALENDAR_API_ENDPOINT"),
+            access_token_refresh_margin=float(os.getenv("ACCESS_TOKEN_REFRESH_MARGIN", "300")),
+            events_stream_page_size=int(os.getenv("EVENTS_STREAM_PAGE_SIZE", "250")),
+            multi_calendar_concurrency=int(os.getenv("MULTI_CALENDAR_CONCURRENCY", "8")),
+            events_batch_max_windows=int(os.getenv("EVENTS_BATCH_MAX_WINDOWS", "20")),
+            events_batch_max_span_days=float(os.getenv("EVENTS_BATCH_MAX_SPAN_DAYS", "400")),
+            
+            token_refresh_enabled=_bool("TOKEN_REFRESH_ENABLED", "true"),
+            token_refresh_interval=float(os.getenv("TOKEN_REFRESH_INTERVAL", "15")),
+            token_refresh_lead_time=float(os.getenv("TOKEN_REFRESH_LEAD_TIME", "600")),
+            token_refresh_jitter=float(os.getenv("TOKEN_REFRESH_JITTER", "240")),
+            token_refresh_active_window=float(os.getenv("TOKEN_REFRESH_ACTIVE_WINDOW", "1800")),
+            token_refresh_concurrency=int(os.getenv("TOKEN_REFRESH_CONCURRENCY", "4")),
+            token_refresh_max_users=int(os.getenv("TOKEN_REFRESH_MAX_USERS", "10000")),
+            
+            event_store_enabled=_bool("EVENT_STORE_ENABLED", "false"),
+            event_sync_interval=float(os.getenv("EVENT_SYNC_INTERVAL", "60")),
+            event_sync_past_days=int(os.getenv("EVENT_SYNC_PAST_DAYS", "365")),
+            
+            compression_min_size=int(os.getenv("COMPRESSION_MIN_SIZE", "1024")),
+            gzip_level=int(os.getenv("GZIP_LEVEL", "6")),
+            brotli_quality=int(os.getenv("BROTLI_QUALITY", "4")),
+            
+            profile_sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+            profile_token=os.getenv("PROFILE_TOKEN"),
+            profile_dir=os.getenv("PROFILE_DIR", "./profiles"),
+            profile_max_files=int(os.getenv("PROFILE_MAX_FILES", "50")),
+        )
+
+
+settings = Settings.from_env()
@@ -2,12 +2,16 @@
 Database models and operations using SQLModel + SQLite
 """
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Iterable, Iterator, List, Optional, Tuple
+from sqlalchemy import UniqueConstraint, and_, delete, event, func, inspect, or_, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
 from sqlmodel import Field, SQLModel, create_engine, Session, select
-import os
-from dotenv import load_dotenv
+import time
 
-load_dotenv()
+from cache import TTLCache
+from config import settings
+from metrics import db_query_duration_seconds
 
 # Models
 class User(SQLModel, table=True):
@@ -27,14 +31,170 @@ class Credential(SQLModel, table=True):
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
+class CalendarEvent(SQLModel, table=True):
+    """CalendarEvent model - local copy of a user's Google Calendar events"""
+    __table_args__ = (UniqueConstraint("user_id", "calendar_id", "event_id"),)
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id", index=True)
+    calendar_id: str = Field(default="primary")
+    event_id: str  # Google's event ID
+    summary: Optional[str] = None
+    start: str  # dateTime or date (all-day) as returned by Google
+    end: str
+    all_day: bool = False
+    # Naive UTC bounds used for range queries (widened by a day for all-day events)
+    start_utc: datetime = Field(index=True)
+    end_utc: datetime = Field(index=True)
+    # Naive UTC start used for ordering and paging (all-day: midnight of the date)
+    sort_start: Optional[datetime] = Field(default=None, index=True)
+    attendees: str = "[]"  # JSON list of attendee emails
+    organizer: Optional[str] = None
+
+
+class SyncState(SQLModel, table=True):
+    """SyncState model - Google incremental sync token per user calendar"""
+    __table_args__ = (UniqueConstraint("user_id", "calendar_id"),)
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id", index=True)
+    calendar_id: str = Field(default="primary")
+    sync_token: Optional[str] = None
+    synced_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    # Naive UTC lower bound of the last full sync; earlier events are not stored
+    synced_from: Optional[datetime] = None
+
+
+class OAuthState(SQLModel, table=True):
+    """OAuthState model - pending OAuth state values shared by all workers"""
+    state: str = Field(primary_key=True)
+    created_at: float = Field(index=True)  # epoch seconds
+
+
 # Database setup
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./app.db")
-engine = create_engine(DATABASE_URL, echo=False)
+DATABASE_URL = settings.database_url
+
+# "production" enables WAL, pragmas and pool sizing for multi-worker SQLite
+DB_PROFILE = settings.db_profile
+DB_POOL_SIZE = settings.db_pool_size
+DB_MAX_OVERFLOW = settings.db_max_overflow
+DB_POOL_TIMEOUT = settings.db_pool_timeout
+SQLITE_BUSY_TIMEOUT_MS = settings.sqlite_busy_timeout_ms
+SQLITE_CACHE_SIZE_KB = settings.sqlite_cache_size_kb
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Configure every new SQLite connection (production profile)"""
+    cursor = dbapi_connection.cursor()
+    # Readers no longer block the writer (and vice versa)
+    cursor.execute("PRAGMA journal_mode=WAL")
+    # Safe with WAL; fsync at checkpoints instead of on every commit
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    # Wait for the write lock instead of failing with "database is locked"
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def create_db_engine(url: str = DATABASE_URL, profile: str = DB_PROFILE) -> Engine:
+    """
+    Create the SQLAlchemy engine for a database URL
+    
+    Args:
+        url: Database URL
+        profile: "default" (plain engine) or "production" (tuned SQLite)
+    
+    Returns:
+        Engine object
+    """
+    in_memory = url in ("sqlite://", "sqlite:///:memory:")
+    if profile != "production" or not url.startswith("sqlite") or in_memory:
+        return create_engine(url, echo=False)
+    
+    tuned_engine = create_engine(
+        url,
+        echo=False,
+        connect_args={
+            # Pooled connections are shared by FastAPI's threadpool workers
+            "check_same_thread": False,
+            "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+        },
+        poolclass=QueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+    event.listen(tuned_engine, "connect", _set_sqlite_pragmas)
+    return tuned_engine
+
+
+# The start time lives on the statement's execution context, so statements
+# that fail (and never reach after_cursor_execute) leave nothing behind
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_start
+    db_query_duration_seconds.observe(elapsed, statement.split(None, 1)[0].upper())
+
+
+def instrument_engine(db_engine: Engine) -> Engine:
+    """Record statement timings of an engine in db_query_duration_seconds"""
+    event.listen(db_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(db_engine, "after_cursor_execute", _after_cursor_execute)
+    return db_engine
+
+
+engine = instrument_engine(create_db_engine())
+
+# Resolved users for authenticated requests (user_id -> detached User)
+USER_CACHE_SIZE = settings.user_cache_size
+USER_CACHE_TTL = settings.user_cache_ttl
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
 
 
 def init_db():
     """Initialize database tables"""
     SQLModel.metadata.create_all(engine)
+    _add_missing_columns()
+    _backfill_event_sort_start()
+
+
+def _add_missing_columns():
+    """
+    Add nullable columns (and their indexes) introduced after a table was created
+    
+    create_all only creates missing tables, so databases created by an
+    older version would otherwise lack new columns.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(engine.dialect)
+                connection.execute(text(
+                    f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+                ))
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+
+def _backfill_event_sort_start():
+    """Fill CalendarEvent.sort_start of rows stored before the column existed"""
+    with engine.begin() as connection:
+        # Same text format SQLAlchemy stores SQLite datetimes in
+        connection.execute(text(
+            "UPDATE calendarevent SET sort_start = CASE "
+            "WHEN all_day THEN start || ' 00:00:00.000000' ELSE start_utc END "
+            "WHERE sort_start IS NULL"
+        ))
 
 
 def get_session():
@@ -67,6 +227,7 @@ def get_or_create_user(email: str, google_sub: str) -> User:
                 session.add(user)
                 session.commit()
                 session.refresh(user)
+                user_cache.invalidate(user.id)
             return user
         
         # Create new user
@@ -77,12 +238,139 @@ def get_or_create_user(email: str, google_sub: str) -> User:
         return user
 
 
+def _dialect_insert():
+    """INSERT construct supporting ON CONFLICT for the configured database"""
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def upsert_user_with_credential(
+    email: str,
+    google_sub: str,
+    refresh_token: Optional[str] = None,
+) -> User:
+    """
+    Create or update a user and their refresh token in one transaction
+    
+    Uses INSERT ... ON CONFLICT DO UPDATE for both rows, so a login costs
+    one round trip per statement and a single commit.
+    
+    Args:
+        email: User's email from Google
+        google_sub: Google's unique subject identifier
+        refresh_token: Google refresh token (only present on some logins)
+    
+    Returns:
+        User object
+    """
+    insert = _dialect_insert()
+    now = datetime.now(timezone.utc)
+    
+    with Session(engine) as session:
+        user_insert = insert(User).values(email=email, google_sub=google_sub, created_at=now)
+        user_upsert = user_insert.on_conflict_do_update(
+            index_elements=[User.google_sub],
+            set_={"email": user_insert.excluded.email},
+        ).returning(User.id, User.email, User.google_sub, User.created_at)
+        row = session.exec(user_upsert).one()
+        
+        if refresh_token:
+            credential_insert = insert(Credential).values(
+                user_id=row.id,
+                refresh_token=refresh_token,
+                created_at=now,
+                updated_at=now,
+            )
+            session.exec(credential_insert.on_conflict_do_update(
+                index_elements=[Credential.user_id],
+                set_={
+                    "refresh_token": credential_insert.excluded.refresh_token,
+                    "updated_at": credential_insert.excluded.updated_at,
+                },
+            ))
+        
+        session.commit()
+    
+    # Email may have changed
+    user_cache.invalidate(row.id)
+    return User(id=row.id, email=row.email, google_sub=row.google_sub, created_at=row.created_at)
+
+
 def get_user_by_id(user_id: int) -> Optional[User]:
     """Get user by ID"""
     with Session(engine) as session:
         return session.get(User, user_id)
 
 
+def get_cached_user(user_id: int) -> Optional[User]:
+    """
+    Get user by ID, served from user_cache when possible
+    
+    Args:
+        user_id: User ID
+    
+    Returns:
+        User object (shared snapshot - do not modify) or None
+    """
+    user = user_cache.get(user_id)
+    if user is None:
+        user = get_user_by_id(user_id)
+        if user:
+            user_cache.set(user_id, user)
+    return user
+
+
+def count_users() -> int:
+    """Number of registered users"""
+    with Session(engine) as session:
+        return session.exec(select(func.count()).select_from(User)).one()
+
+
+def list_users_page(
+    limit: int,
+    after: Optional[Tuple[datetime, int]] = None,
+) -> List[User]:
+    """
+    Get users newest first using keyset pagination
+    
+    Args:
+        limit: Max users to return
+        after: (created_at, id) of the last user of the previous page
+    
+    Returns:
+        List of User objects
+    """
+    statement = select(User).order_by(User.created_at.desc(), User.id.desc()).limit(limit)
+    if after:
+        created_at, user_id = after
+        statement = statement.where(or_(
+            User.created_at < created_at,
+            and_(User.created_at == created_at, User.id < user_id),
+        ))
+    
+    with Session(engine) as session:
+        return list(session.exec(statement).all())
+
+
+def iter_users(batch_size: int = 500) -> Iterator[User]:
+    """
+    Iterate over all users newest first, one keyset page at a time
+    
+    Only one batch is held in memory and no transaction stays open
+    between batches.
+    """
+    after = None
+    while True:
+        users = list_users_page(batch_size, after)
+        yield from users
+        if len(users) < batch_size:
+            return
+        after = (users[-1].created_at, users[-1].id)
+
+
 def save_tokens_for_user(user_id: int, refresh_token: str) -> Credential:
     """
     Save or update refresh token for user
@@ -128,3 +416,168 @@ def get_refresh_token_for_user(user_id: int) -> Optional[str]:
         credential = session.exec(statement).first()
         return credential.refresh_token if credential else None
 
+
+
+def get_sync_state(user_id: int, calendar_id: str = "primary") -> Optional[SyncState]:
+    """
+    Get incremental sync state for a user's calendar
+    
+    Args:
+        user_id: User ID
+        calendar_id: Google calendar ID
+    
+    Returns:
+        SyncState object or None if never synced
+    """
+    with Session(engine) as session:
+        statement = select(SyncState).where(
+            SyncState.user_id == user_id,
+            SyncState.calendar_id == calendar_id,
+        )
+        return session.exec(statement).first()
+
+
+def apply_event_changes(
+    user_id: int,
+    calendar_id: str,
+    upserts: List[CalendarEvent],
+    deleted_ids: Iterable[str],
+    sync_token: Optional[str],
+    full_sync: bool = False,
+    synced_from: Optional[datetime] = None,
+):
+    """
+    Apply one page of a sync round to the local event store in a single transaction
+    
+    A full sync starts with full_sync=True, which clears the calendar and
+    its sync state. The sync state is only written again by the last page,
+    which carries the nextSyncToken; until then a full sync is incomplete.
+    
+    Args:
+        user_id: User ID
+        calendar_id: Google calendar ID
+        upserts: New or changed events
+        deleted_ids: Google event IDs that were cancelled/deleted
+        sync_token: nextSyncToken to store for the next incremental sync
+            (None on pages before the last)
+        full_sync: Replace all stored events of this calendar
+        synced_from: Lower bound (naive UTC) of the full sync this page finishes
+    """
+    scope = (CalendarEvent.user_id == user_id, CalendarEvent.calendar_id == calendar_id)
+    
+    with Session(engine) as session:
+        if full_sync:
+            session.exec(delete(CalendarEvent).where(*scope))
+        else:
+            # Changed events are replaced wholesale
+            stale_ids = list(deleted_ids) + [event.event_id for event in upserts]
+            for i in range(0, len(stale_ids), 500):
+                session.exec(delete(CalendarEvent).where(
+                    *scope, CalendarEvent.event_id.in_(stale_ids[i:i + 500])
+                ))
+        
+        session.add_all(upserts)
+        
+        if full_sync or sync_token:
+            statement = select(SyncState).where(
+                SyncState.user_id == user_id,
+                SyncState.calendar_id == calendar_id,
+            )
+            state = session.exec(statement).first()
+            if not state:
+                state = SyncState(user_id=user_id, calendar_id=calendar_id)
+            state.sync_token = sync_token
+            state.synced_at = datetime.now(timezone.utc)
+            if full_sync:
+                state.synced_from = None
+            if sync_token and synced_from:
+                state.synced_from = synced_from
+            session.add(state)
+        
+        session.commit()
+
+
+def query_events(
+    user_id: int,
+    start_utc: datetime,
+    end_utc: datetime,
+    calendar_id: str = "primary",
+    after: Optional[Tuple[datetime, int]] = None,
+    limit: Optional[int] = None,
+) -> List[CalendarEvent]:
+    """
+    Get stored events overlapping a time range, ordered by (sort_start, id)
+    
+    Args:
+        user_id: User ID
+        start_utc: Range start (naive UTC)
+        end_utc: Range end (naive UTC)
+        calendar_id: Google calendar ID
+        after: (sort_start, id) of the last event of the previous page
+        limit: Max events to return (default: all)
+    
+    Returns:
+        List of CalendarEvent objects
+    """
+    statement = (
+        select(CalendarEvent)
+        .where(
+            CalendarEvent.user_id == user_id,
+            CalendarEvent.calendar_id == calendar_id,
+            CalendarEvent.start_utc < end_utc,
+            CalendarEvent.end_utc > start_utc,
+        )
+        .order_by(CalendarEvent.sort_start, CalendarEvent.id)
+    )
+    if after:
+        after_start, after_id = after
+        statement = statement.where(or_(
+            CalendarEvent.sort_start > after_start,
+            and_(CalendarEvent.sort_start == after_start, CalendarEvent.id > after_id),
+        ))
+    if limit is not None:
+        statement = statement.limit(limit)
+    
+    with Session(engine) as session:
+        return list(session.exec(statement).all())
+
+
+def add_oauth_state(state: str, created_at: float, ttl: float):
+    """
+    Store an OAuth state and purge expired ones
+    
+    Args:
+        state: State value
+        created_at: Creation time (epoch seconds)
+        ttl: State lifetime in seconds
+    """
+    with Session(engine) as session:
+        session.exec(delete(OAuthState).where(OAuthState.created_at < created_at - ttl))
+        session.add(OAuthState(state=state, created_at=created_at))
+        session.commit()
+
+
+def consume_oauth_state(state: str, not_before: float) -> bool:
+    """
+    Delete an OAuth state if it exists and is not expired
+    
+    Args:
+        state: State value
+        not_before: Oldest acceptable creation time (epoch seconds)
+    
+    Returns:
+        True if a valid state was consumed
+    """
+    with Session(engine) as session:
+        result = session.exec(delete(OAuthState).where(
+            OAuthState.state == state,
+            OAuthState.created_at >= not_before,
+        ))
+        session.commit()
+        return result.rowcount == 1
+
+
+def count_oauth_states() -> int:
+    """Number of stored OAuth states"""
+    with Session(engine) as session:
+        return session.exec(select(func.count()).select_from(OAuthState)).one()
@@ -3,7 +3,7 @@ FastAPI dependencies for authentication and authorization
 """
 from typing import Optional
 from fastapi import Cookie, HTTPException, Depends
-from db import get_user_by_id, User
+from db import get_cached_user, User
 from utils import verify_session_jwt
 
 
@@ -34,8 +34,8 @@ async def get_current_user(session: Optional[str] = Cookie(None)) -> User:
             detail="Invalid or expired session"
         )
     
-    # Get user from database
-    user = get_user_by_id(user_id)
+    # Get user from cache, falling back to the database
+    user = get_cached_user(user_id)
     if not user:
         raise HTTPException(
             status_code=401,
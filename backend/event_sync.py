@@ -0,0 +1,417 @@
+"""
+Local event store kept current with Google Calendar incremental sync
+
+The first sync downloads a user's events once (full sync). Later syncs send
+the stored nextSyncToken and only receive what changed, including
+cancelled events. When Google expires the token (410 Gone) the store is
+rebuilt with a new full sync. Range queries are then answered locally,
+as long as they don't start before the history the full sync downloaded.
+"""
+import asyncio
+import base64
+import json
+from contextlib import asynccontextmanager
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from calendar_client import CalendarAPIError, calendar_client, calendar_resource
+from config import settings
+from db import CalendarEvent, apply_event_changes, get_sync_state, query_events
+from rfc3339 import parse_rfc3339
+
+# Configuration
+EVENT_STORE_ENABLED = settings.event_store_enabled
+EVENT_SYNC_INTERVAL = settings.event_sync_interval  # seconds between delta syncs
+EVENT_SYNC_PAST_DAYS = settings.event_sync_past_days  # history kept by full sync
+SYNC_PAGE_SIZE = 250
+# Partial response: only what event_from_resource reads (plus status for deletions)
+SYNC_FIELDS = "nextPageToken,nextSyncToken,items(id,status,summary,start,end,attendees(email),organizer(email))"
+STORE_PAGE_SIZE = 50
+
+# One sync at a time per (user, calendar):
+# key -> [lock, number of tasks holding or waiting for it]
+_sync_locks: Dict[Tuple[int, str], list] = {}
+
+
+class InvalidStoreQuery(ValueError):
+    """Range query parameters could not be parsed"""
+
+
+def event_from_resource(user_id: int, calendar_id: str, item: Dict[str, Any]) -> CalendarEvent:
+    """
+    Convert a Calendar API event resource into a store row
+    
+    Args:
+        user_id: User ID
+        calendar_id: Google calendar ID
+        item: Event resource from events.list
+    
+    Returns:
+        CalendarEvent object (not yet persisted)
+    """
+    start = item.get("start", {})
+    end = item.get("end", {})
+    all_day = "dateTime" not in start
+    
+    if all_day:
+        start_value = start.get("date", "")
+        end_value = end.get("date", "")
+        # The local day depends on the viewer's timezone, so widen the
+        # range-query bounds by a day; list_stored_events filters exactly.
+        # Ordering uses the unwidened start of the date
+        sort_start = datetime.combine(date.fromisoformat(start_value), time())
+        start_utc = sort_start - timedelta(days=1)
+        end_utc = datetime.combine(date.fromisoformat(end_value), time()) + timedelta(days=1)
+    else:
+        start_value = start["dateTime"]
+        end_value = end.get("dateTime", start_value)
+        # Stored naive, like every datetime SQLite returns
+        start_utc = sort_start = parse_rfc3339(start_value).replace(tzinfo=None)
+        end_utc = parse_rfc3339(end_value).replace(tzinfo=None)
+    
+    attendees = [
+        attendee["email"]
+        for attendee in item.get("attendees", [])
+        if attendee.get("email")
+    ]
+    
+    return CalendarEvent(
+        user_id=user_id,
+        calendar_id=calendar_id,
+        event_id=item["id"],
+        summary=item.get("summary"),
+        start=start_value,
+        end=end_value,
+        all_day=all_day,
+        start_utc=start_utc,
+        end_utc=end_utc,
+        sort_start=sort_start,
+        attendees=json.dumps(attendees),
+        organizer=item.get("organizer", {}).get("email"),
+    )
+
+
+def _page_changes(
+    user_id: int,
+    calendar_id: str,
+    items: List[Dict[str, Any]],
+) -> Tuple[List[CalendarEvent], List[str]]:
+    """Split one page of sync results into store rows and deleted event IDs"""
+    # Later entries for the same event win
+    changes: Dict[str, Optional[Dict[str, Any]]] = {}
+    for item in items:
+        changes[item["id"]] = None if item.get("status") == "cancelled" else item
+    
+    upserts = [
+        event_from_resource(user_id, calendar_id, item)
+        for item in changes.values()
+        if item is not None
+    ]
+    deleted_ids = [event_id for event_id, item in changes.items() if item is None]
+    return upserts, deleted_ids
+
+
+async def _apply_sync_pages(
+    user_id: int,
+    access_token: str,
+    calendar_id: str,
+    sync_token: Optional[str],
+    synced_from: datetime,
+) -> int:
+    """
+    Fetch a full (from synced_from, naive UTC) or incremental sync and
+    apply it to the store page by page, so only one page is held in memory
+    
+    Returns:
+        Number of changed (upserted or deleted) events
+    """
+    params: Dict[str, Any] = {
+        "calendarId": calendar_id,
+        "singleEvents": True,
+        "maxResults": SYNC_PAGE_SIZE,
+        "fields": SYNC_FIELDS,
+    }
+    if sync_token:
+        params["syncToken"] = sync_token
+    else:
+        params["timeMin"] = synced_from.strftime("%Y-%m-%dT%H:%M:%SZ")
+    
+    changed = 0
+    first_page = True
+    while True:
+        request = calendar_resource("events").list(**params)
+        result = await calendar_client.execute(request, access_token, user_id)
+        upserts, deleted_ids = _page_changes(user_id, calendar_id, result.get("items", []))
+        
+        page_token = result.get("nextPageToken")
+        # Only the last page carries nextSyncToken, which marks the round complete
+        apply_event_changes(
+            user_id,
+            calendar_id,
+            upserts,
+            deleted_ids,
+            None if page_token else result.get("nextSyncToken"),
+            full_sync=first_page and sync_token is None,
+            synced_from=None if sync_token else synced_from,
+        )
+        changed += len(upserts) + len(deleted_ids)
+        
+        if not page_token:
+            return changed
+        params["pageToken"] = page_token
+        first_page = False
+
+
+async def sync_calendar(user_id: int, access_token: str, calendar_id: str = "primary") -> int:
+    """
+    Bring the local store up to date with Google
+    
+    Args:
+        user_id: User ID
+        access_token: Google access token of the user
+        calendar_id: Google calendar ID
+    
+    Returns:
+        Number of changed (upserted or deleted) events
+    
+    Raises:
+        CalendarAPIError: If Google rejects the sync
+    """
+    state = get_sync_state(user_id, calendar_id)
+    # Stores synced before the lower bound was recorded are rebuilt
+    sync_token = state.sync_token if state and state.synced_from else None
+    synced_from = (
+        datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+        - timedelta(days=EVENT_SYNC_PAST_DAYS)
+    )
+    
+    try:
+        return await _apply_sync_pages(user_id, access_token, calendar_id, sync_token, synced_from)
+    except CalendarAPIError as error:
+        if error.status != 410 or not sync_token:
+            raise
+        # Sync token expired - Google requires a full resync
+        return await _apply_sync_pages(user_id, access_token, calendar_id, None, synced_from)
+
+
+@asynccontextmanager
+async def _sync_lock(key: Tuple[int, str]):
+    """Hold the sync lock of a (user, calendar); unused locks are dropped"""
+    entry = _sync_locks.get(key)
+    if entry is None:
+        entry = _sync_locks[key] = [asyncio.Lock(), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _sync_locks[key]
+
+
+async def sync_if_stale(user_id: int, access_token: str, calendar_id: str = "primary") -> bool:
+    """
+    Run a sync unless one finished within EVENT_SYNC_INTERVAL
+    
+    Args:
+        user_id: User ID
+        access_token: Google access token of the user
+        calendar_id: Google calendar ID
+    
+    Returns:
+        True if a sync was performed
+    """
+    async with _sync_lock((user_id, calendar_id)):
+        state = get_sync_state(user_id, calendar_id)
+        if state and state.sync_token and state.synced_from:
+            synced_at = state.synced_at
+            if synced_at.tzinfo is None:
+                synced_at = synced_at.replace(tzinfo=timezone.utc)
+            age = (datetime.now(timezone.utc) - synced_at).total_seconds()
+            if age < EVENT_SYNC_INTERVAL:
+                return False
+        
+        await sync_calendar(user_id, access_token, calendar_id)
+        return True
+
+
+def store_covers(user_id: int, time_min: str, calendar_id: str = "primary") -> bool:
+    """
+    Check whether the store holds every event ending after time_min
+    
+    Events before the lower bound of the last full sync were never
+    downloaded, so such ranges must be answered by Google.
+    
+    Args:
+        user_id: User ID
+        time_min: RFC3339 lower bound of the range query
+        calendar_id: Google calendar ID
+    
+    Returns:
+        True if the range can be answered from the store
+    
+    Raises:
+        InvalidStoreQuery: If time_min is malformed
+    """
+    state = get_sync_state(user_id, calendar_id)
+    # No complete full sync yet
+    if state is None or not state.sync_token or state.synced_from is None:
+        return False
+    return _parse_bound(time_min) >= state.synced_from
+
+
+def _parse_bound(value: str) -> datetime:
+    try:
+        return parse_rfc3339(value).replace(tzinfo=None)
+    except ValueError:
+        raise InvalidStoreQuery(f"Invalid RFC3339 timestamp: {value}")
+
+
+def _encode_store_cursor(row: CalendarEvent) -> str:
+    """Opaque keyset cursor pointing after `row`"""
+    payload = f"{row.sort_start.isoformat()}|{row.id}"
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def _decode_store_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decode a cursor from _encode_store_cursor into (sort_start, id)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_start, row_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return datetime.fromisoformat(sort_start), int(row_id)
+    except ValueError:
+        raise InvalidStoreQuery("Invalid page token")
+
+
+def _row_to_event(
+    row: CalendarEvent,
+    tz: ZoneInfo,
+    range_start: datetime,
+    range_end: datetime,
+) -> Optional[Dict[str, Any]]:
+    """
+    Convert a store row into EventResponse shape
+    
+    Returns:
+        Event dict, or None for an all-day event outside the range
+        in the requested timezone
+    """
+    if row.all_day:
+        # Exact local-day bounds in the requested timezone
+        start_local = datetime.combine(date.fromisoformat(row.start), time(), tz)
+        end_local = datetime.combine(date.fromisoformat(row.end), time(), tz)
+        start_utc = start_local.astimezone(timezone.utc).replace(tzinfo=None)
+        end_utc = end_local.astimezone(timezone.utc).replace(tzinfo=None)
+        if not (start_utc < range_end and end_utc > range_start):
+            return None
+        start_value, end_value = row.start, row.end
+    else:
+        start_value = row.start_utc.replace(tzinfo=timezone.utc).astimezone(tz).isoformat()
+        end_value = row.end_utc.replace(tzinfo=timezone.utc).astimezone(tz).isoformat()
+    
+    return {
+        "id": row.event_id,
+        "summary": row.summary,
+        "start": start_value,
+        "end": end_value,
+        "attendees": json.loads(row.attendees),
+        "calendarId": row.organizer or "primary",
+    }
+
+
+def _parse_query(time_min: str, time_max: str, tz_name: str) -> Tuple[ZoneInfo, datetime, datetime]:
+    try:
+        tz = ZoneInfo(tz_name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise InvalidStoreQuery(f"Unknown timezone: {tz_name}")
+    return tz, _parse_bound(time_min), _parse_bound(time_max)
+
+
+def list_stored_events(
+    user_id: int,
+    time_min: str,
+    time_max: str,
+    tz_name: str,
+    page_token: Optional[str] = None,
+    calendar_id: str = "primary",
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Answer an events range query from the local store
+    
+    Pages are read with keyset pagination on (sort_start, id), so each page
+    costs one indexed query regardless of how deep it is. All-day events
+    are ordered at the start of their date in UTC.
+    
+    Args:
+        user_id: User ID
+        time_min: RFC3339 lower bound (events ending after it)
+        time_max: RFC3339 upper bound (events starting before it)
+        tz_name: IANA timezone used to format times and place all-day events
+        page_token: Cursor from a previous page
+        calendar_id: Google calendar ID
+    
+    Returns:
+        Tuple of (event dicts in EventResponse shape, next page token)
+    
+    Raises:
+        InvalidStoreQuery: If a parameter is malformed
+    """
+    tz, range_start, range_end = _parse_query(time_min, time_max, tz_name)
+    after = _decode_store_cursor(page_token) if page_token else None
+    
+    # One row more than a page tells whether another page follows; all-day
+    # rows outside the exact local range may need another round
+    page: List[Tuple[CalendarEvent, Dict[str, Any]]] = []
+    while len(page) <= STORE_PAGE_SIZE:
+        rows = query_events(
+            user_id, range_start, range_end, calendar_id,
+            after=after, limit=STORE_PAGE_SIZE + 1,
+        )
+        for row in rows:
+            event = _row_to_event(row, tz, range_start, range_end)
+            if event is not None:
+                page.append((row, event))
+        if len(rows) <= STORE_PAGE_SIZE:
+            break
+        after = (rows[-1].sort_start, rows[-1].id)
+    
+    next_page_token = None
+    if len(page) > STORE_PAGE_SIZE:
+        page = page[:STORE_PAGE_SIZE]
+        next_page_token = _encode_store_cursor(page[-1][0])
+    
+    return [event for _, event in page], next_page_token
+
+
+def list_stored_window(
+    user_id: int,
+    time_min: str,
+    time_max: str,
+    tz_name: str,
+    calendar_id: str = "primary",
+) -> List[Dict[str, Any]]:
+    """
+    Answer a whole range query from the local store in one query
+    
+    Args:
+        user_id: User ID
+        time_min: RFC3339 lower bound (events ending after it)
+        time_max: RFC3339 upper bound (events starting before it)
+        tz_name: IANA timezone used to format times and place all-day events
+        calendar_id: Google calendar ID
+    
+    Returns:
+        Every event dict of the range in EventResponse shape, ordered by start
+    
+    Raises:
+        InvalidStoreQuery: If a parameter is malformed
+    """
+    tz, range_start, range_end = _parse_query(time_min, time_max, tz_name)
+    events = []
+    for row in query_events(user_id, range_start, range_end, calendar_id):
+        event = _row_to_event(row, tz, range_start, range_end)
+        if event is not None:
+            events.append(event)
+    return events
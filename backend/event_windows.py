@@ -0,0 +1,124 @@
+"""
+Date windows for batched event queries
+
+Windows requested together (a week view, the month containing it, the
+neighbouring weeks) usually overlap. They are merged on their UTC bounds
+into disjoint ranges with a sort-and-sweep so each range is fetched from
+Google once, whatever timezone the windows were asked in, and every
+window's events are then sliced back out of the range that covers it.
+"""
+from datetime import date, datetime, time, timezone
+from typing import Any, Dict, Iterable, List, Tuple
+from zoneinfo import ZoneInfo
+
+from multi_calendar import event_start_key
+from rfc3339 import parse_rfc3339
+
+# (start, end) as timezone-aware UTC datetimes, end exclusive
+Window = Tuple[datetime, datetime]
+
+
+def window_key(time_min: str, time_max: str, tz_name: str) -> str:
+    """Key a window's result by its parameters as sent by the client"""
+    return f"{time_min}/{time_max}/{tz_name}"
+
+
+def parse_window(time_min: str, time_max: str) -> Window:
+    """
+    Parse RFC3339 bounds into a Window
+    
+    Raises:
+        ValueError: If a bound is malformed or the window is empty
+    """
+    bounds = [parse_rfc3339(value, require_offset=True) for value in (time_min, time_max)]
+    if bounds[1] <= bounds[0]:
+        raise ValueError(f"timeMax must be after timeMin: {time_min}/{time_max}")
+    return bounds[0], bounds[1]
+
+
+def merge_windows(windows: Iterable[Window]) -> List[Window]:
+    """
+    Merge overlapping or touching windows into disjoint ranges
+    
+    Args:
+        windows: Windows in any order, duplicates allowed
+    
+    Returns:
+        Sorted ranges whose union equals the union of the windows
+    """
+    merged: List[Window] = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def event_end_key(event: Dict[str, Any], tz: ZoneInfo) -> datetime:
+    """
+    End of an event as an aware UTC datetime
+    
+    All-day events end at local midnight in the requested timezone.
+    """
+    end = event.get("end", {})
+    if "dateTime" in end:
+        return parse_rfc3339(end["dateTime"])
+    if "date" in end:
+        return datetime.combine(date.fromisoformat(end["date"]), time(), tz).astimezone(timezone.utc)
+    return datetime.max.replace(tzinfo=timezone.utc)
+
+
+def slice_events(
+    events: List[Dict[str, Any]],
+    window: Window,
+    tz: ZoneInfo,
+) -> List[Dict[str, Any]]:
+    """
+    Pick the events of one window out of the range that covers it
+    
+    Uses Google's timeMin/timeMax semantics: an event belongs to the window
+    when it ends after the start and starts before the end. The range may
+    have been fetched in another timezone, which orders all-day events
+    differently, so every event is checked and the result is re-sorted.
+    
+    Args:
+        events: Event resources of the covering range
+        window: Window to slice
+        tz: Timezone of the window (for all-day events)
+    
+    Returns:
+        Event resources overlapping the window, ordered by start in tz
+    """
+    start, end = window
+    selected = [
+        event for event in events
+        if event_start_key(event, tz) < end and event_end_key(event, tz) > start
+    ]
+    # Stable, so events starting together keep Google's order
+    selected.sort(key=lambda event: event_start_key(event, tz))
+    return selected
+
+
+def localize_event(event: Dict[str, Any], tz: ZoneInfo) -> Dict[str, Any]:
+    """
+    Express the dateTime bounds of an event resource in another timezone
+    
+    Google formats times in the timezone a range was requested in; windows
+    sharing that range but asked in another timezone get their own offsets.
+    
+    Args:
+        event: Event resource (left unchanged)
+        tz: Timezone of the window
+    
+    Returns:
+        Copy of the event with start/end dateTime converted to tz
+    """
+    localized = dict(event)
+    for name in ("start", "end"):
+        bound = event.get(name)
+        if bound and "dateTime" in bound:
+            value = parse_rfc3339(bound["dateTime"]).astimezone(tz).isoformat()
+            localized[name] = {**bound, "dateTime": value}
+    return localized
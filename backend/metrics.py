@@ -0,0 +1,329 @@
+"""
+In-process metrics in the Prometheus text exposition format
+
+Counters, histograms and gauges are kept in plain dicts keyed by label
+values; rendering to text only happens when /metrics is scraped. Recording
+a value costs a lock and a bisect, so it is cheap enough for every request.
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Upper bounds (seconds) for latency histograms
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class Metric(ABC):
+    """Base class: name, help text and label names"""
+    
+    type = "untyped"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+    
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Sample lines for the exposition format"""
+    
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Monotonically increasing value per label set, counted here or read from a function"""
+    
+    type = "counter"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+    
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+    
+    def set_function(self, function: Callable[[], float], *labels: str):
+        """Read the value of a label set from `function` on every scrape"""
+        with self._lock:
+            self._functions[labels] = function
+    
+    def value(self, *labels: str) -> float:
+        function = self._functions.get(labels)
+        return function() if function else self._values.get(labels, 0.0)
+    
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+            functions = list(self._functions.items())
+        items += [(labels, function()) for labels, function in functions]
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in items
+        ]
+
+
+class Histogram(Metric):
+    """Distribution of observed values over fixed buckets per label set"""
+    
+    type = "histogram"
+    
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (last is +Inf), sum]
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+    
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+    
+    def time(self, *labels: str) -> "_Timer":
+        """Context manager observing the duration of its block"""
+        return _Timer(self, labels)
+    
+    def count(self, *labels: str) -> int:
+        entry = self._values.get(labels)
+        return sum(entry[0]) if entry else 0
+    
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(labels, list(counts), total[0]) for labels, (counts, total) in self._values.items()]
+        
+        lines = []
+        names = self.labelnames + ("le",)
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(names, labels + (le,))} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+    
+    def __init__(self, histogram: Histogram, labels: LabelValues):
+        self.histogram = histogram
+        self.labels = labels
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class Gauge(Metric):
+    """Current value, either set directly or read from a function at scrape time"""
+    
+    type = "gauge"
+    
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+    
+    def set(self, value: float):
+        self._value = value
+    
+    def set_function(self, function: Callable[[], float]):
+        """Compute the value by calling `function` on every scrape"""
+        self._function = function
+    
+    def samples(self) -> List[str]:
+        value = self._function() if self._function else self._value
+        return [f"{self.name} {_format_value(value)}"]
+
+
+class Registry:
+    """Collection of metrics rendered together"""
+    
+    def __init__(self):
+        self._metrics: List[Metric] = []
+    
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+    
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+registry = Registry()
+
+http_requests_total = registry.register(Counter(
+    "http_requests_total",
+    "HTTP requests handled, by route and status code",
+    ("method", "route", "status"),
+))
+http_request_duration_seconds = registry.register(Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency (until the response body is sent)",
+    ("method", "route"),
+))
+google_request_duration_seconds = registry.register(Histogram(
+    "google_request_duration_seconds",
+    "Latency of upstream Google API calls",
+    ("operation",),
+))
+google_throttled_total = registry.register(Counter(
+    "google_throttled_total",
+    "Google API calls rejected with 429 or a rate limit 403",
+    ("operation",),
+))
+google_retries_total = registry.register(Counter(
+    "google_retries_total",
+    "Throttled Google API calls retried after backoff",
+    ("operation",),
+))
+db_query_duration_seconds = registry.register(Histogram(
+    "db_query_duration_seconds",
+    "Database statement execution time",
+    ("statement",),
+))
+token_refreshes_total = registry.register(Counter(
+    "token_refreshes_total",
+    "Google access token refreshes, on the request path or in the background",
+    ("trigger", "result"),
+))
+oauth_states = registry.register(Gauge(
+    "oauth_states",
+    "OAuth state values currently stored",
+))
+user_cache_entries = registry.register(Gauge(
+    "user_cache_entries",
+    "Users held in the authenticated-user cache",
+))
+cache_hits_total = registry.register(Counter(
+    "cache_hits_total",
+    "Lookups answered by an in-process cache",
+    ("cache",),
+))
+cache_misses_total = registry.register(Counter(
+    "cache_misses_total",
+    "Lookups an in-process cache could not answer",
+    ("cache",),
+))
+token_refresh_active_users = registry.register(Gauge(
+    "token_refresh_active_users",
+    "Recently active users whose access tokens are refreshed in the background",
+))
+google_concurrency_limit = registry.register(Gauge(
+    "google_concurrency_limit",
+    "Current adaptive limit on in-flight Google Calendar API calls",
+))
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    return registry.render()
+
+
+# endpoint -> route path template
+_route_paths: Dict[Callable, str] = {}
+
+
+def route_path(scope) -> str:
+    """
+    Path template of the route that handled a request (e.g. /api/events)
+    
+    Must be called after the app has routed the request.
+    
+    Returns:
+        Route path, or "unmatched" if no route matched
+    """
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    path = _route_paths.get(endpoint)
+    if path is None:
+        # Starlette records the matched endpoint, not the route itself
+        for route in scope["app"].routes:
+            if getattr(route, "endpoint", None) is endpoint:
+                path = route.path
+                break
+        else:
+            path = getattr(endpoint, "__name__", "unknown")
+        _route_paths[endpoint] = path
+    return path
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request counts and latency per route
+    
+    Requests are labeled with the matched route's path template (e.g.
+    /api/events), never the raw URL, so label cardinality stays bounded.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        status = 500
+        
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+        
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = route_path(scope)
+            method = scope["method"]
+            http_request_duration_seconds.observe(time.perf_counter() - start, method, route)
+            http_requests_total.inc(method, route, str(status))
@@ -0,0 +1,197 @@
+"""
+Fan-out over all of a user's calendars with a k-way merge by start time
+
+Each calendar's events.list pages are already sorted by start time, so the
+per-calendar streams are merged with a heap instead of being concatenated
+and re-sorted. Pagination uses a composite cursor recording, for every
+calendar, the Google page token of the page being consumed and how many of
+its items were already returned.
+"""
+import asyncio
+import base64
+import heapq
+import json
+from datetime import date, datetime, time, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from calendar_client import calendar_client, calendar_resource
+from config import settings
+from rfc3339 import parse_rfc3339
+
+# Max calendars fetched at the same time for one request
+MULTI_CALENDAR_CONCURRENCY = settings.multi_calendar_concurrency
+
+# calendar_id -> (page token of current page, items consumed), or None when exhausted
+CursorState = Dict[str, Optional[Tuple[Optional[str], int]]]
+
+# (calendar_id, page_token) -> events.list response
+PageFetcher = Callable[[str, Optional[str]], Awaitable[Dict[str, Any]]]
+
+
+class InvalidCursor(ValueError):
+    """Composite cursor could not be decoded"""
+
+
+def encode_cursor(state: CursorState) -> Optional[str]:
+    """
+    Encode per-calendar positions as an opaque page token
+    
+    Returns:
+        Cursor string, or None when every calendar is exhausted
+    """
+    if all(position is None for position in state.values()):
+        return None
+    payload = json.dumps(
+        {calendar_id: list(position) if position else None for calendar_id, position in state.items()},
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> CursorState:
+    """
+    Decode a cursor produced by encode_cursor
+    
+    Raises:
+        InvalidCursor: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return {
+            str(calendar_id): (position[0], int(position[1])) if position else None
+            for calendar_id, position in payload.items()
+        }
+    except (ValueError, TypeError, AttributeError, IndexError) as e:
+        raise InvalidCursor(f"Invalid page token: {e}")
+
+
+def event_start_key(event: Dict[str, Any], tz: ZoneInfo) -> datetime:
+    """
+    Sort key matching Google's orderBy=startTime
+    
+    All-day events start at local midnight in the requested timezone.
+    """
+    start = event.get("start", {})
+    if "dateTime" in start:
+        return parse_rfc3339(start["dateTime"])
+    if "date" in start:
+        return datetime.combine(date.fromisoformat(start["date"]), time(), tz).astimezone(timezone.utc)
+    return datetime.min.replace(tzinfo=timezone.utc)
+
+
+async def list_selected_calendars(user_id: int, access_token: str) -> List[str]:
+    """
+    Get IDs of calendars the user has selected in Google Calendar
+    
+    Args:
+        user_id: User ID
+        access_token: Google access token of the user
+    
+    Returns:
+        Calendar IDs, primary calendar first
+    """
+    calendar_ids: List[str] = []
+    page_token = None
+    while True:
+        params = {"pageToken": page_token} if page_token else {}
+        request = calendar_resource("calendarList").list(**params)
+        result = await calendar_client.execute(request, access_token, user_id)
+        
+        for entry in result.get("items", []):
+            if entry.get("primary"):
+                calendar_ids.insert(0, entry["id"])
+            elif entry.get("selected"):
+                calendar_ids.append(entry["id"])
+        
+        page_token = result.get("nextPageToken")
+        if not page_token:
+            return calendar_ids
+
+
+class _CalendarBuffer:
+    """Current page of one calendar being merged"""
+    
+    def __init__(self, calendar_id: str, page_token: Optional[str], consumed: int, page: Dict[str, Any]):
+        self.calendar_id = calendar_id
+        self.page_token = page_token
+        self.items = page.get("items", [])
+        self.next_token = page.get("nextPageToken")
+        self.pos = consumed
+    
+    def position(self) -> Optional[Tuple[Optional[str], int]]:
+        """Cursor entry for this calendar"""
+        if self.pos < len(self.items):
+            return (self.page_token, self.pos)
+        if self.next_token:
+            return (self.next_token, 0)
+        return None
+
+
+async def merge_calendars(
+    fetch_page: PageFetcher,
+    state: CursorState,
+    tz: ZoneInfo,
+    page_size: int,
+    concurrency: int = MULTI_CALENDAR_CONCURRENCY,
+) -> Tuple[List[Tuple[str, Dict[str, Any]]], CursorState]:
+    """
+    Return the next page_size events across calendars in start order
+    
+    Args:
+        fetch_page: Coroutine fetching one events.list page of a calendar
+        state: Cursor state (calendar -> position)
+        tz: Requested timezone (places all-day events)
+        page_size: Max events to return
+        concurrency: Max calendars fetched at once
+    
+    Returns:
+        Tuple of ([(calendar_id, event resource)], cursor state for next page)
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def fetch(calendar_id: str, page_token: Optional[str]) -> Dict[str, Any]:
+        async with semaphore:
+            return await fetch_page(calendar_id, page_token)
+    
+    active = [(calendar_id, position) for calendar_id, position in state.items() if position]
+    pages = await asyncio.gather(*[
+        fetch(calendar_id, page_token) for calendar_id, (page_token, _) in active
+    ])
+    buffers = [
+        _CalendarBuffer(calendar_id, page_token, consumed, page)
+        for (calendar_id, (page_token, consumed)), page in zip(active, pages)
+    ]
+    
+    heap: List[Tuple[datetime, int, int]] = []
+    
+    async def push_next(index: int):
+        buffer = buffers[index]
+        # Skip over empty pages until an item or the end of the calendar
+        while buffer.pos >= len(buffer.items) and buffer.next_token:
+            page = await fetch(buffer.calendar_id, buffer.next_token)
+            buffer.page_token = buffer.next_token
+            buffer.items = page.get("items", [])
+            buffer.next_token = page.get("nextPageToken")
+            buffer.pos = 0
+        if buffer.pos < len(buffer.items):
+            key = event_start_key(buffer.items[buffer.pos], tz)
+            heapq.heappush(heap, (key, index, buffer.pos))
+    
+    await asyncio.gather(*[push_next(index) for index in range(len(buffers))])
+    
+    merged: List[Tuple[str, Dict[str, Any]]] = []
+    while heap and len(merged) < page_size:
+        _, index, pos = heapq.heappop(heap)
+        buffer = buffers[index]
+        merged.append((buffer.calendar_id, buffer.items[pos]))
+        buffer.pos = pos + 1
+        if len(merged) < page_size:
+            await push_next(index)
+    
+    next_state: CursorState = {calendar_id: None for calendar_id in state}
+    for buffer in buffers:
+        next_state[buffer.calendar_id] = buffer.position()
+    
+    return merged, next_state
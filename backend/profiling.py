@@ -0,0 +1,121 @@
+"""
+Opt-in per-request profiling
+
+A request is profiled with cProfile when it is sampled (PROFILE_SAMPLE_RATE)
+or carries the X-Profile header set to PROFILE_TOKEN. Each profile is
+written to PROFILE_DIR as a .prof file (open with `python -m pstats` or
+snakeviz) plus a .json file with the route, status and total time; only the
+newest PROFILE_MAX_FILES profiles are kept. The profile also contains
+whatever else the event loop ran while the request was in flight.
+
+Unsampled requests cost at most one random() call, plus a header scan when
+PROFILE_TOKEN is set.
+"""
+import asyncio
+import cProfile
+import hmac
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from config import settings
+from metrics import route_path
+
+# Configuration
+PROFILE_SAMPLE_RATE = settings.profile_sample_rate  # fraction of requests, 0 = off
+PROFILE_TOKEN = settings.profile_token  # enables X-Profile: <token> (unset = header ignored)
+PROFILE_DIR = settings.profile_dir
+PROFILE_MAX_FILES = settings.profile_max_files
+
+PROFILE_HEADER = b"x-profile"
+
+# cProfile hooks the whole thread, so only one request is profiled at a time
+_profile_lock = threading.Lock()
+
+
+def _requested_by_header(scope) -> bool:
+    if not PROFILE_TOKEN:
+        return False
+    for name, value in scope["headers"]:
+        if name == PROFILE_HEADER:
+            return hmac.compare_digest(value, PROFILE_TOKEN.encode())
+    return False
+
+
+def _write_profile(profiler: cProfile.Profile, metadata: dict) -> str:
+    """Dump a profile with its metadata and drop the oldest beyond PROFILE_MAX_FILES"""
+    directory = Path(PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    
+    route = re.sub(r"[^A-Za-z0-9]+", "_", metadata["route"]).strip("_") or "root"
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    name = f"{stamp}-{route}-{metadata['total_ms']:.0f}ms"
+    profiler.dump_stats(directory / f"{name}.prof")
+    (directory / f"{name}.json").write_text(json.dumps(metadata, indent=2))
+    
+    # Names start with the UTC timestamp, so they sort oldest first
+    profiles = sorted(directory.glob("*.prof"))
+    for old in profiles[:max(0, len(profiles) - PROFILE_MAX_FILES)]:
+        old.unlink(missing_ok=True)
+        old.with_suffix(".json").unlink(missing_ok=True)
+    
+    return name
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling sampled or explicitly requested requests"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        if _requested_by_header(scope):
+            reason = "header"
+        elif PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+            reason = "sampled"
+        else:
+            await self.app(scope, receive, send)
+            return
+        
+        if not _profile_lock.acquire(blocking=False):
+            # Another request is being profiled
+            await self.app(scope, receive, send)
+            return
+        
+        status = 500
+        
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+        
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            profiler.enable()
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                profiler.disable()
+        finally:
+            _profile_lock.release()
+            total = time.perf_counter() - start
+            metadata = {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "method": scope["method"],
+                "route": route_path(scope),
+                "path": scope["path"],
+                "status": status,
+                "total_ms": total * 1000,
+                "reason": reason,
+            }
+            await asyncio.to_thread(_write_profile, profiler, metadata)
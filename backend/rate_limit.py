@@ -0,0 +1,180 @@
+"""
+Client-side rate limiting and backoff for upstream Google calls
+
+- TokenBucket: smooths the request rate (one bucket per user plus a
+  global one) before Google's quota does it with 429s
+- AIMDLimiter: concurrency limit that grows by one per round of
+  successful calls and halves when Google throttles
+- backoff_delay: exponential backoff with full jitter, or the server's
+  Retry-After when it sends one
+
+All of them are plain objects driven from the event loop thread; none
+holds loop-bound primitives between calls.
+"""
+import asyncio
+import random
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Deque, Optional
+
+
+class TokenBucket:
+    """
+    Token bucket allowing `rate` calls per second with bursts of `burst`
+    
+    Tokens are reserved up front, so the count may go negative: each caller
+    learns immediately how long to wait and callers are served in order.
+    A rate of 0 disables the bucket.
+    """
+    
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+    
+    def reserve(self) -> float:
+        """
+        Take one token
+        
+        Returns:
+            Seconds to wait before the call may be made
+        """
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+    
+    async def acquire(self):
+        """Wait until a call is allowed"""
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class AIMDLimiter:
+    """
+    Concurrency limit adapted with additive increase / multiplicative decrease
+    
+    Every successful call raises the limit by 1/limit (about +1 per round of
+    `limit` calls), up to `max_limit`. A throttled call multiplies it by
+    `decrease`, down to `min_limit`; throttles within `cooldown` seconds of
+    the last decrease are part of the same burst and don't shrink it again.
+    """
+    
+    def __init__(
+        self,
+        max_limit: int,
+        min_limit: int = 1,
+        decrease: float = 0.5,
+        cooldown: float = 1.0,
+    ):
+        self.max_limit = max_limit
+        self.min_limit = max(1, min(min_limit, max_limit))
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self._last_decrease = float("-inf")
+        self._waiters: Deque[asyncio.Future] = deque()
+    
+    async def acquire(self):
+        """Wait for a free slot under the current limit"""
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                else:
+                    # Already woken: pass the free slot on
+                    self._wake()
+                raise
+        self.in_flight += 1
+    
+    def release(self):
+        """Free a slot taken by acquire"""
+        self.in_flight -= 1
+        self._wake()
+    
+    def _wake(self):
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+    
+    def on_success(self):
+        """Record a call that was not throttled"""
+        self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._wake()
+    
+    def on_throttle(self):
+        """Record a call Google throttled"""
+        now = time.monotonic()
+        if now - self._last_decrease >= self.cooldown:
+            self.limit = max(self.min_limit, self.limit * self.decrease)
+            self._last_decrease = now
+    
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header (delay in seconds or an HTTP date)
+    
+    Returns:
+        Seconds to wait, or None if absent or malformed
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(
+    attempt: int,
+    retry_after: Optional[float],
+    base: float,
+    cap: float,
+) -> Optional[float]:
+    """
+    Delay before retrying a throttled call
+    
+    Args:
+        attempt: Number of the failed attempt (0 = first call)
+        retry_after: Delay requested by the server, if any
+        base: Delay scale in seconds
+        cap: Longest delay worth waiting for
+    
+    Returns:
+        Seconds to sleep, or None if the server asks for longer than `cap`
+    """
+    if retry_after is not None:
+        if retry_after > cap:
+            return None
+        # Spread out the callers that were all told the same delay
+        return retry_after + random.uniform(0, base)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
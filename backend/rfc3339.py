@@ -0,0 +1,27 @@
+"""
+RFC3339 timestamps as sent to and returned by the Calendar API
+"""
+from datetime import datetime, timezone
+
+
+def parse_rfc3339(value: str, require_offset: bool = False) -> datetime:
+    """
+    Parse an RFC3339 timestamp into an aware UTC datetime
+    
+    Args:
+        value: Timestamp, e.g. "2025-01-01T09:00:00+07:00" or "2025-01-01T02:00:00Z"
+        require_offset: Reject timestamps without a UTC offset instead of
+            reading them as UTC
+    
+    Returns:
+        Timezone-aware datetime in UTC
+    
+    Raises:
+        ValueError: If the value is malformed or lacks a required offset
+    """
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        if require_offset:
+            raise ValueError(f"Missing UTC offset: {value}")
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
@@ -1,7 +1,7 @@
 """
 Pydantic schemas for request/response validation
 """
-from typing import Optional, List
+from typing import Dict, Optional, List
 from pydantic import BaseModel
 
 
@@ -21,6 +21,38 @@ class EventsListResponse(BaseModel):
     nextPageToken: Optional[str] = None
 
 
+class EventWindow(BaseModel):
+    """One date window of a batch events request"""
+    timeMin: str
+    timeMax: str
+    timezone: str = "Asia/Bangkok"
+
+
+class EventsBatchRequest(BaseModel):
+    """Several date windows fetched in one request"""
+    windows: List[EventWindow]
+    fields: Optional[str] = None
+
+
+class EventsBatchResponse(BaseModel):
+    """Events of every window, keyed by "timeMin/timeMax/timezone" of the window"""
+    windows: Dict[str, EventsListResponse]
+
+
+class TimeSlot(BaseModel):
+    """Time interval (RFC3339, end exclusive)"""
+    start: str
+    end: str
+
+
+class AvailabilityResponse(BaseModel):
+    """Merged busy intervals and free slots within working hours"""
+    timezone: str
+    busy: List[TimeSlot]
+    free: List[TimeSlot]
+    calendarErrors: Dict[str, str] = {}
+
+
 class UserResponse(BaseModel):
     """User information response"""
     email: str
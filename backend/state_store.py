@@ -0,0 +1,164 @@
+"""
+Storage backends for one-time OAuth state values (CSRF protection)
+
+- memory: per-process, expires entries in insertion order (O(1) amortized)
+- sqlite: rows in the app database, shared by all workers
+- redis: keys with native expiry, shared by all workers (optional dependency)
+"""
+import math
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Optional
+
+from config import settings
+from db import add_oauth_state, consume_oauth_state, count_oauth_states
+
+# Configuration
+OAUTH_STATE_BACKEND = settings.oauth_state_backend
+OAUTH_STATE_TTL = settings.oauth_state_ttl  # 10 minutes
+OAUTH_STATE_MAX = settings.oauth_state_max  # memory backend cap
+REDIS_URL = settings.redis_url
+
+
+class StateStore(ABC):
+    """One-time OAuth state values that expire after `ttl` seconds"""
+    
+    def __init__(self, ttl: float = OAUTH_STATE_TTL):
+        self.ttl = ttl
+    
+    @abstractmethod
+    def add(self, state: str):
+        """Store a newly issued state"""
+    
+    @abstractmethod
+    def consume(self, state: str) -> bool:
+        """
+        Remove a state, reporting whether it was valid
+        
+        Returns:
+            True if the state existed and had not expired
+        """
+    
+    @abstractmethod
+    def __len__(self) -> int:
+        """Number of stored states (may include not yet purged expired ones)"""
+
+
+class MemoryStateStore(StateStore):
+    """
+    In-process store
+    
+    States are kept in insertion order, which is also expiry order, so
+    expired entries are purged from the front without scanning the rest.
+    Only valid with a single worker process.
+    """
+    
+    def __init__(self, ttl: float = OAUTH_STATE_TTL, max_size: int = OAUTH_STATE_MAX):
+        super().__init__(ttl)
+        self.max_size = max_size
+        self._states: "OrderedDict[str, float]" = OrderedDict()  # state -> created (monotonic)
+    
+    def _purge(self, now: float):
+        cutoff = now - self.ttl
+        while self._states:
+            oldest, created = next(iter(self._states.items()))
+            if created >= cutoff:
+                break
+            del self._states[oldest]
+    
+    def add(self, state: str):
+        now = time.monotonic()
+        self._purge(now)
+        self._states[state] = now
+        # Bound memory under login bursts by dropping the oldest states
+        while len(self._states) > self.max_size:
+            self._states.popitem(last=False)
+    
+    def consume(self, state: str) -> bool:
+        created = self._states.pop(state, None)
+        if created is None:
+            return False
+        return time.monotonic() - created <= self.ttl
+    
+    def __len__(self) -> int:
+        return len(self._states)
+
+
+class SQLiteStateStore(StateStore):
+    """
+    Store backed by the app database (OAuthState table)
+    
+    consume() is a single conditional DELETE, so a state can only be used
+    once even when several workers receive the callback concurrently.
+    """
+    
+    def add(self, state: str):
+        add_oauth_state(state, time.time(), self.ttl)
+    
+    def consume(self, state: str) -> bool:
+        return consume_oauth_state(state, time.time() - self.ttl)
+    
+    def __len__(self) -> int:
+        return count_oauth_states()
+
+
+class RedisStateStore(StateStore):
+    """
+    Store backed by Redis keys with native expiry
+    
+    Issue times are also kept in a sorted set, so the number of live states
+    can be counted (for /metrics) without scanning the keyspace.
+    Requires the `redis` package unless a client is passed in.
+    """
+    
+    def __init__(
+        self,
+        ttl: float = OAUTH_STATE_TTL,
+        client: Optional[Any] = None,
+        url: str = REDIS_URL,
+        prefix: str = "oauth_state:",
+    ):
+        super().__init__(ttl)
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("OAUTH_STATE_BACKEND=redis requires the 'redis' package")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self.index_key = prefix.rstrip(":") + "_index"
+    
+    def add(self, state: str):
+        if self.client.set(self.prefix + state, "1", ex=max(1, math.ceil(self.ttl)), nx=True):
+            self.client.zadd(self.index_key, {state: time.time()})
+    
+    def consume(self, state: str) -> bool:
+        self.client.zrem(self.index_key, state)
+        # DEL is atomic: only one caller sees a count of 1
+        return self.client.delete(self.prefix + state) == 1
+    
+    def __len__(self) -> int:
+        # Expired keys vanish on their own; drop their index entries too
+        self.client.zremrangebyscore(self.index_key, "-inf", time.time() - self.ttl)
+        return self.client.zcard(self.index_key)
+
+
+def create_state_store(backend: str = OAUTH_STATE_BACKEND) -> StateStore:
+    """
+    Create the configured state store
+    
+    Args:
+        backend: "memory", "sqlite" or "redis"
+    
+    Returns:
+        StateStore instance
+    """
+    if backend == "memory":
+        return MemoryStateStore()
+    if backend == "sqlite":
+        return SQLiteStateStore()
+    if backend == "redis":
+        return RedisStateStore()
+    raise ValueError(f"Unknown OAUTH_STATE_BACKEND: {backend}")
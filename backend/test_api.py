@@ -7,16 +7,24 @@ from unittest.mock import patch, MagicMock
 
 from app import app
 from utils import build_auth_url, generate_state, verify_state
-from db import init_db
+from db import init_db, get_or_create_user
 
 client = TestClient(app)
 
 
 @pytest.fixture(autouse=True)
-def setup_db():
-    """Setup test database"""
+def setup_db(tmp_path_factory, monkeypatch):
+    """Point the app at a fresh SQLite database for every test"""
+    import db
+    
+    url = f"sqlite:///{tmp_path_factory.mktemp('db') / 'app.db'}"
+    monkeypatch.setattr(db, "DATABASE_URL", url)
+    monkeypatch.setattr(db, "engine", db.instrument_engine(db.create_db_engine(url)))
+    # Cached rows belong to the previous test's database
+    db.user_cache.clear()
     init_db()
     yield
+    db.engine.dispose()
 
 
 def test_healthz():
@@ -98,9 +106,8 @@ def test_callback_with_invalid_state(mock_exchange):
 
 
 @patch("auth.exchange_code_for_tokens")
-@patch("auth.get_or_create_user")
-@patch("auth.save_tokens_for_user")
-def test_callback_success_flow(mock_save_tokens, mock_get_user, mock_exchange):
+@patch("auth.upsert_user_with_credential")
+def test_callback_success_flow(mock_get_user, mock_exchange):
     """Test successful OAuth callback flow"""
     # Setup mocks
     mock_exchange.return_value = (
@@ -127,6 +134,1300 @@ def test_callback_success_flow(mock_save_tokens, mock_get_user, mock_exchange):
     assert "session" in response.cookies
 
 
+def test_calendar_service_is_shared():
+    """Test Calendar service is built once and reused across requests"""
+    from calendar_client import get_calendar_service, calendar_resource
+    
+    assert get_calendar_service() is get_calendar_service()
+    assert calendar_resource("events") is calendar_resource("events")
+    
+    request = calendar_resource("events").list(calendarId="primary", maxResults=50)
+    assert "/calendars/primary/events" in request.uri
+
+
+def test_http_clients_closed_when_event_loop_changes():
+    """Test pooled clients are closed, not leaked, when the event loop changes"""
+    import asyncio
+    import utils
+    from calendar_client import CalendarClient
+    
+    calendar = CalendarClient()
+    
+    async def get_client():
+        client = calendar._ensure_client()
+        # Let the close of a replaced client run
+        await asyncio.sleep(0.01)
+        return client
+    
+    first = asyncio.run(get_client())
+    second = asyncio.run(get_client())
+    assert second is not first
+    assert first.is_closed
+    assert not second.is_closed
+    asyncio.run(calendar.aclose())
+    
+    async def get_oauth_client():
+        client = utils.get_http_client()
+        await asyncio.sleep(0.01)
+        return client
+    
+    first = asyncio.run(get_oauth_client())
+    second = asyncio.run(get_oauth_client())
+    assert first.is_closed
+    assert not second.is_closed
+    asyncio.run(utils.close_http_client())
+
+
+def test_access_token_cache_single_refresh():
+    """Test concurrent requests for one user trigger a single token refresh"""
+    import asyncio
+    from token_cache import AccessTokenCache
+    
+    cache = AccessTokenCache(refresh_margin=60)
+    calls = []
+    
+    async def refresh():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return f"token-{len(calls)}", 3600
+    
+    async def run():
+        return await asyncio.gather(*[cache.get(1, refresh) for _ in range(10)])
+    
+    tokens = asyncio.run(run())
+    assert len(calls) == 1
+    assert {t.access_token for t in tokens} == {"token-1"}
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["hits"] == 9
+
+
+def test_access_token_cache_refreshes_near_expiry():
+    """Test token is refreshed once it is within the refresh margin"""
+    import asyncio
+    from token_cache import AccessTokenCache
+    
+    cache = AccessTokenCache(refresh_margin=60)
+    cache.put(1, "old-token", expires_in=30)  # already inside the margin
+    
+    async def refresh():
+        return "new-token", 3600
+    
+    token = asyncio.run(cache.get(1, refresh))
+    assert token.access_token == "new-token"
+    assert cache.stats()["misses"] == 1
+
+
+def test_token_refresh_transport_errors_map_to_gateway_errors(monkeypatch):
+    """Test refresh_access_token reports timeouts as 504 and other transport errors as 502"""
+    import asyncio
+    import httpx
+    import utils
+    from fastapi import HTTPException
+    
+    for error, status in ((httpx.ReadTimeout("slow"), 504), (httpx.ConnectError("refused"), 502)):
+        def handler(request, error=error):
+            raise error
+        
+        async def refresh():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http_client:
+                monkeypatch.setattr(utils, "get_http_client", lambda: http_client)
+                await utils.refresh_access_token("refresh-token")
+        
+        with pytest.raises(HTTPException) as excinfo:
+            asyncio.run(refresh())
+        assert excinfo.value.status_code == status
+
+
+def test_token_refresh_scheduler_refreshes_active_users_ahead_of_expiry():
+    """Test background refresh covers due tokens of active users, bounded and stoppable"""
+    import asyncio
+    import time
+    from fastapi import HTTPException
+    from token_cache import AccessTokenCache
+    from token_refresh import TokenRefreshScheduler
+    
+    cache = AccessTokenCache(refresh_margin=300)
+    in_flight = 0
+    max_in_flight = 0
+    refreshed = []
+    
+    def refresher_for(user_id):
+        async def refresh():
+            nonlocal in_flight, max_in_flight
+            if user_id == 9:
+                raise HTTPException(status_code=401, detail="revoked")
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.02)
+            in_flight -= 1
+            refreshed.append(user_id)
+            return f"new-{user_id}", 3600
+        return refresh
+    
+    scheduler = TokenRefreshScheduler(
+        cache=cache, interval=3600, lead_time=600, jitter=0,
+        active_window=60, concurrency=2, refresher_for=refresher_for,
+    )
+    for user_id in (1, 2, 3, 4, 5, 7, 8, 9):
+        cache.put(user_id, f"old-{user_id}", expires_in=500)  # due: inside the lead time
+    cache.put(6, "old-6", expires_in=3600)  # not due yet
+    for user_id in (1, 2, 3, 4, 5, 6, 8, 9):  # 7 never used the API
+        scheduler.touch(user_id)
+    scheduler._active.set(8, True, ttl=0)  # idle for too long
+    
+    assert asyncio.run(scheduler.run_once()) == 6
+    assert sorted(refreshed) == [1, 2, 3, 4, 5]
+    assert max_in_flight == 2
+    assert [cache.peek(i).access_token for i in (1, 6, 7, 8)] == ["new-1", "old-6", "old-7", "old-8"]
+    # Failed and idle users are dropped until they make a request again
+    assert len(scheduler) == 6
+    
+    refreshed.clear()
+    assert asyncio.run(scheduler.run_once()) == 0
+    
+    # Tracking is bounded even when the background task never runs
+    bounded = TokenRefreshScheduler(cache=cache, max_users=3)
+    for user_id in range(100):
+        bounded.touch(user_id)
+    assert len(bounded) == 3
+    
+    # Jittered refresh times stay between lead time and the request-path margin
+    jittered = TokenRefreshScheduler(cache=cache, lead_time=600, jitter=1000)
+    assert jittered.jitter == 300
+    expires_at = time.time() + 3600
+    times = {jittered._refresh_at(user_id, expires_at) for user_id in range(50)}
+    assert len(times) > 1
+    assert all(expires_at - 600 <= t <= expires_at - 300 for t in times)
+    
+    async def start_and_stop():
+        scheduler.start()
+        await asyncio.sleep(0.05)
+        started = time.perf_counter()
+        await scheduler.stop()
+        return time.perf_counter() - started
+    
+    assert asyncio.run(start_and_stop()) < 1
+    assert scheduler._task is None
+
+
+@pytest.fixture
+def fake_google():
+    """Local stand-in Calendar API with a primed access token for a test user"""
+    from calendar_client import set_calendar_endpoint
+    from benchmarks.fake_google import FakeGoogle
+    from token_cache import access_token_cache
+    from utils import create_session_jwt
+    
+    user = get_or_create_user(email="calendar@example.com", google_sub="calendar-sub")
+    access_token_cache.put(user.id, "fake-access-token", 3600)
+    
+    fake = FakeGoogle(latency=0.2)
+    with fake.serve() as base_url:
+        set_calendar_endpoint(f"{base_url}/calendar/v3/")
+        fake.session = create_session_jwt(user.id)
+        yield fake
+    set_calendar_endpoint(None)
+    access_token_cache.invalidate(user.id)
+
+
+def test_events_requests_run_concurrently(fake_google):
+    """Test concurrent /api/events calls overlap instead of queueing"""
+    import asyncio
+    import time
+    import httpx
+    
+    n_requests = 10
+    
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            http.cookies.set("session", fake_google.session)
+            return await asyncio.gather(*[
+                http.get("/api/events", params={
+                    "timeMin": "2025-01-01T00:00:00Z",
+                    "timeMax": "2025-01-02T00:00:00Z",
+                })
+                for _ in range(n_requests)
+            ])
+    
+    start = time.perf_counter()
+    responses = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    
+    assert all(r.status_code == 200 for r in responses)
+    events = responses[0].json()["events"]
+    assert len(events) == 10
+    assert events[0] == {
+        "id": "evt0",
+        "summary": "Event 0",
+        "start": "2025-01-01T00:00:00+00:00",
+        "end": "2025-01-01T01:00:00+00:00",
+        "attendees": ["guest0@example.com", "guest1@example.com", "guest2@example.com"],
+        "calendarId": "owner@example.com",
+    }
+    
+    # Serial execution would take n_requests * latency (2s)
+    assert fake_google.requests["events.list"] == n_requests
+    assert elapsed < n_requests * fake_google.latency / 2
+
+
+def test_events_served_from_incremental_sync_store(fake_google, monkeypatch):
+    """Test /api/events answers from the local store kept current with syncToken deltas"""
+    import event_sync
+    from benchmarks.fake_google import make_events
+    
+    monkeypatch.setattr(event_sync, "EVENT_STORE_ENABLED", True)
+    monkeypatch.setattr(event_sync, "EVENT_SYNC_INTERVAL", 0)
+    monkeypatch.setattr(event_sync, "EVENT_SYNC_PAST_DAYS", 3650)
+    fake_google.latency = 0
+    
+    
+    def fetch():
+        response = client.get(
+            "/api/events",
+            params={"timeMin": "2025-01-01T00:00:00Z", "timeMax": "2025-01-02T00:00:00Z", "timezone": "UTC"},
+            headers={"Cookie": f"session={fake_google.session}"},
+        )
+        assert response.status_code == 200
+        return {e["id"]: e for e in response.json()["events"]}
+    
+    # Full sync
+    events = fetch()
+    assert len(events) == 10
+    assert events["evt0"]["start"] == "2025-01-01T00:00:00+00:00"
+    
+    # Incremental sync picks up updates, inserts and deletions
+    updated = dict(fake_google.calendars["primary"][1], summary="Renamed")
+    fake_google.update_event("primary", updated)
+    fake_google.update_event("primary", make_events(1, prefix="new")[0])
+    fake_google.delete_event("primary", "evt2")
+    
+    events = fetch()
+    assert events["evt1"]["summary"] == "Renamed"
+    assert "new0" in events
+    assert "evt2" not in events
+    assert len(events) == 10
+    
+    # Expired sync token (410 Gone) triggers a full resync
+    fake_google.sync_tokens_expired = True
+    fake_google.delete_event("primary", "evt3")
+    events = fetch()
+    assert "evt3" not in events
+    assert len(events) == 9
+    
+    assert fake_google.requests["events.list"] == 4
+
+
+def test_event_store_pages_validates_and_falls_back_before_synced_bound(fake_google, monkeypatch):
+    """Test the store pages by keyset, rejects bad input and leaves older ranges to Google"""
+    from datetime import datetime, timedelta, timezone
+    import event_sync
+    from db import get_sync_state, get_user_by_id
+    from benchmarks.fake_google import make_events
+    from utils import verify_session_jwt
+    
+    monkeypatch.setattr(event_sync, "EVENT_STORE_ENABLED", True)
+    monkeypatch.setattr(event_sync, "EVENT_SYNC_INTERVAL", 3600)
+    monkeypatch.setattr(event_sync, "EVENT_SYNC_PAST_DAYS", 30)
+    fake_google.latency = 0
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    
+    fake_google.calendars["primary"] = (
+        make_events(5, start=now - timedelta(days=60), prefix="old")
+        + make_events(120, start=now, spacing=timedelta(minutes=30))
+    )
+    
+    def fetch(time_min, **params):
+        return client.get(
+            "/api/events",
+            params={
+                "timeMin": time_min.isoformat(),
+                "timeMax": (now + timedelta(days=30)).isoformat(),
+                "timezone": "UTC",
+                **params,
+            },
+            headers={"Cookie": f"session={fake_google.session}"},
+        )
+    
+    # Served from the store, one page after another
+    ids = []
+    page_token = None
+    while True:
+        response = fetch(now - timedelta(days=1), **({"pageToken": page_token} if page_token else {}))
+        assert response.status_code == 200
+        ids += [e["id"] for e in response.json()["events"]]
+        page_token = response.json()["nextPageToken"]
+        if not page_token:
+            break
+    assert ids == [f"evt{i}" for i in range(120)]
+    # Only the full sync (fake pages hold 50 events) went to Google
+    assert fake_google.requests["events.list"] == 3
+    
+    user = get_user_by_id(verify_session_jwt(fake_google.session))
+    synced_from = get_sync_state(user.id, "primary").synced_from
+    assert synced_from == (now - timedelta(days=30)).replace(tzinfo=None)
+    
+    # The full sync did not download events before its bound: ask Google
+    response = fetch(now - timedelta(days=90))
+    assert response.status_code == 200
+    assert [e["id"] for e in response.json()["events"][:5]] == [f"old{i}" for i in range(5)]
+    assert fake_google.requests["events.list"] == 4
+    
+    # Malformed input is a client error, not a crash
+    assert fetch(now, timezone="Not/AZone").status_code == 400
+    assert fetch(now, pageToken="not-a-cursor").status_code == 400
+    response = client.get(
+        "/api/events",
+        params={"timeMin": "yesterday", "timeMax": "today", "timezone": "UTC"},
+        headers={"Cookie": f"session={fake_google.session}"},
+    )
+    assert response.status_code == 400
+
+
+def test_event_store_orders_all_day_and_timed_events_by_start(fake_google, monkeypatch):
+    """Test all-day events sort by their date, not the widened query bound, across pages"""
+    import event_sync
+    
+    monkeypatch.setattr(event_sync, "EVENT_STORE_ENABLED", True)
+    monkeypatch.setattr(event_sync, "EVENT_SYNC_INTERVAL", 3600)
+    monkeypatch.setattr(event_sync, "EVENT_SYNC_PAST_DAYS", 3650)
+    monkeypatch.setattr(event_sync, "STORE_PAGE_SIZE", 1)
+    fake_google.latency = 0
+    fake_google.calendars["primary"] = [
+        {"id": "timed", "start": {"dateTime": "2025-01-01T10:00:00Z"}, "end": {"dateTime": "2025-01-01T11:00:00Z"}},
+        {"id": "allday", "start": {"date": "2025-01-02"}, "end": {"date": "2025-01-03"}},
+        {"id": "later", "start": {"dateTime": "2025-01-02T10:00:00Z"}, "end": {"dateTime": "2025-01-02T11:00:00Z"}},
+    ]
+    
+    ids = []
+    page_token = None
+    while True:
+        params = {"timeMin": "2025-01-01T00:00:00Z", "timeMax": "2025-01-05T00:00:00Z", "timezone": "UTC"}
+        if page_token:
+            params["pageToken"] = page_token
+        response = client.get("/api/events", params=params, headers={"Cookie": f"session={fake_google.session}"})
+        assert response.status_code == 200
+        ids += [event["id"] for event in response.json()["events"]]
+        page_token = response.json()["nextPageToken"]
+        if not page_token:
+            break
+    
+    assert ids == ["timed", "allday", "later"]
+    # Sync locks are dropped once released
+    assert event_sync._sync_locks == {}
+
+
+def test_events_stream_walks_all_pages(fake_google):
+    """Test /api/events/stream follows every page and emits one event per line"""
+    import json
+    from benchmarks.fake_google import make_events
+    
+    fake_google.latency = 0
+    fake_google.calendars["primary"] = make_events(120)
+    
+    response = client.get(
+        "/api/events/stream",
+        params={"timeMin": "2025-01-01T00:00:00Z", "timeMax": "2025-02-01T00:00:00Z"},
+        headers={"Cookie": f"session={fake_google.session}"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert [e["id"] for e in events] == [f"evt{i}" for i in range(120)]
+    assert events[0]["attendees"] == ["guest0@example.com", "guest1@example.com", "guest2@example.com"]
+    
+    # Fake caps pages at 50 events
+    assert fake_google.requests["events.list"] == 3
+    
+    # Invalid timezone fails before the stream starts
+    response = client.get(
+        "/api/events/stream",
+        params={"timeMin": "2025-01-01T00:00:00Z", "timeMax": "2025-02-01T00:00:00Z", "timezone": "Not/AZone"},
+        headers={"Cookie": f"session={fake_google.session}"},
+    )
+    assert response.status_code == 400
+    assert fake_google.requests["events.list"] == 3
+
+
+def test_events_all_calendars_merged_by_start(fake_google):
+    """Test calendars=all merges every selected calendar in start order across pages"""
+    from datetime import datetime, timedelta, timezone
+    from benchmarks.fake_google import make_events
+    
+    fake_google.latency = 0
+    fake_google.page_size = 20
+    base = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    fake_google.calendars = {
+        "primary": make_events(40, start=base, spacing=timedelta(hours=3), prefix="p"),
+        "work": make_events(35, start=base + timedelta(hours=1), spacing=timedelta(hours=2), prefix="w"),
+        "holidays": make_events(5, start=base + timedelta(days=2), spacing=timedelta(days=1), prefix="h"),
+        "hidden": make_events(5, start=base, prefix="x"),
+    }
+    fake_google.unselected_calendars = {"hidden"}
+    
+    events = []
+    page_token = None
+    pages = 0
+    while True:
+        params = {
+            "timeMin": "2025-01-01T00:00:00Z",
+            "timeMax": "2025-02-01T00:00:00Z",
+            "timezone": "UTC",
+            "calendars": "all",
+        }
+        if page_token:
+            params["pageToken"] = page_token
+        response = client.get(
+            "/api/events",
+            params=params,
+            headers={"Cookie": f"session={fake_google.session}"},
+        )
+        assert response.status_code == 200
+        data = response.json()
+        events.extend(data["events"])
+        pages += 1
+        page_token = data["nextPageToken"]
+        if not page_token:
+            break
+    
+    assert pages == 2
+    assert len(events) == 80
+    assert len({(e["calendarId"], e["id"]) for e in events}) == 80
+    starts = [e["start"] for e in events]
+    assert starts == sorted(starts)
+    assert {e["calendarId"] for e in events} == {"primary", "work", "holidays"}
+    assert fake_google.requests["calendarList.list"] == 1
+    
+    response = client.get(
+        "/api/events",
+        params={"timeMin": "2025-01-01T00:00:00Z", "timeMax": "2025-02-01T00:00:00Z",
+                "calendars": "all", "pageToken": "not-a-cursor"},
+        headers={"Cookie": f"session={fake_google.session}"},
+    )
+    assert response.status_code == 400
+    
+    response = client.get(
+        "/api/events",
+        params={"timeMin": "2025-01-01T00:00:00Z", "timeMax": "2025-02-01T00:00:00Z",
+                "calendars": "everything"},
+        headers={"Cookie": f"session={fake_google.session}"},
+    )
+    assert response.status_code == 400
+
+
+def test_user_cache_serves_repeat_lookups_and_invalidates_on_email_change():
+    """Test get_cached_user avoids the DB on repeat and sees email updates"""
+    import db
+    from db import get_cached_user, user_cache
+    
+    user = get_or_create_user(email="cache@example.com", google_sub="cache-sub")
+    user_cache.invalidate(user.id)
+    
+    with patch("db.get_user_by_id", wraps=db.get_user_by_id) as lookup:
+        assert get_cached_user(user.id).email == "cache@example.com"
+        assert get_cached_user(user.id).email == "cache@example.com"
+        assert lookup.call_count == 1
+    
+    get_or_create_user(email="cache-new@example.com", google_sub="cache-sub")
+    assert get_cached_user(user.id).email == "cache-new@example.com"
+
+
+def test_ttl_cache_evicts_lru_and_expired_entries():
+    """Test TTLCache bounds its size and honours TTL"""
+    import time
+    from cache import TTLCache
+    
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now least recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    
+    cache.set("short", 4, ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("short") is None
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 2
+
+
+def test_session_jwt_cache_rejects_tampered_and_expired_tokens():
+    """Test cached session verification still rejects tampered and expired tokens"""
+    import base64
+    import json
+    import time
+    from jose import jwt
+    from utils import (
+        SESSION_SECRET,
+        create_session_jwt,
+        session_token_cache,
+        verify_session_jwt,
+    )
+    
+    token = create_session_jwt(42)
+    assert verify_session_jwt(token) == 42
+    hits = session_token_cache.hits
+    assert verify_session_jwt(token) == 42
+    assert session_token_cache.hits == hits + 1
+    
+    # Same signature, different payload
+    header, payload, signature = token.split(".")
+    claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+    claims["sub"] = "1"
+    forged = base64.urlsafe_b64encode(json.dumps(claims).encode()).decode().rstrip("=")
+    assert verify_session_jwt(f"{header}.{forged}.{signature}") is None
+    
+    # Expired token whose signature is still cached
+    expired = jwt.encode(
+        {"sub": "42", "exp": int(time.time()) - 10},
+        SESSION_SECRET,
+        algorithm="HS256",
+    )
+    signing_input, _, expired_signature = expired.rpartition(".")
+    session_token_cache.set(expired_signature, (signing_input, 42, time.time() - 10))
+    assert verify_session_jwt(expired) is None
+
+
+class FakeRedis:
+    """Minimal stand-in for the redis client calls RedisStateStore makes"""
+    
+    def __init__(self):
+        self.data = {}
+        self.sorted_sets = {}
+    
+    def set(self, key, value, ex=None, nx=False):
+        import time
+        if nx and key in self.data and self.data[key][1] > time.time():
+            return None
+        self.data[key] = (value, time.time() + ex if ex else float("inf"))
+        return True
+    
+    def delete(self, key):
+        import time
+        value = self.data.pop(key, None)
+        return 1 if value and value[1] > time.time() else 0
+    
+    def zadd(self, key, mapping):
+        self.sorted_sets.setdefault(key, {}).update(mapping)
+    
+    def zrem(self, key, member):
+        return 1 if self.sorted_sets.get(key, {}).pop(member, None) is not None else 0
+    
+    def zremrangebyscore(self, key, low, high):
+        members = self.sorted_sets.get(key, {})
+        for member, score in list(members.items()):
+            if float(low) <= score <= float(high):
+                del members[member]
+    
+    def zcard(self, key):
+        return len(self.sorted_sets.get(key, {}))
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite", "redis"])
+def test_state_store_backends(backend):
+    """Test every OAuth state backend is one-time use and expires states"""
+    import time
+    from state_store import MemoryStateStore, RedisStateStore, SQLiteStateStore
+    
+    def make(ttl):
+        if backend == "memory":
+            return MemoryStateStore(ttl=ttl)
+        if backend == "sqlite":
+            return SQLiteStateStore(ttl=ttl)
+        return RedisStateStore(ttl=ttl, client=FakeRedis())
+    
+    store = make(ttl=600)
+    store.add("state-a")
+    store.add("state-b")
+    assert len(store) == 2
+    assert store.consume("state-a") is True
+    assert store.consume("state-a") is False
+    assert store.consume("unknown") is False
+    assert len(store) == 1
+    
+    store = make(ttl=1)
+    store.add("state-old")
+    time.sleep(1.1)
+    assert store.consume("state-old") is False
+
+
+def test_memory_state_store_purges_expired_in_order():
+    """Test expired states are dropped from the front when new ones are added"""
+    from state_store import MemoryStateStore
+    
+    store = MemoryStateStore(ttl=600, max_size=3)
+    for i in range(5):
+        store.add(f"s{i}")
+    assert len(store) == 3
+    assert store.consume("s0") is False
+    assert store.consume("s4") is True
+    
+    store.ttl = 0
+    store.add("fresh")
+    assert len(store) == 1
+
+
+@pytest.mark.parametrize("issue_id_token", [True, False])
+def test_code_exchange_uses_id_token_claims(issue_id_token, monkeypatch):
+    """Test the userinfo round trip is skipped when the id_token carries the claims"""
+    import asyncio
+    import utils
+    from benchmarks.fake_google import FakeGoogle
+    
+    fake = FakeGoogle()
+    fake.issue_id_token = issue_id_token
+    monkeypatch.setattr(utils, "GOOGLE_CLIENT_ID", "test-client-id")
+    
+    async def run():
+        try:
+            first = await utils.exchange_code_for_tokens("code-1")
+            client_before = utils.get_http_client()
+            second = await utils.exchange_code_for_tokens("code-2")
+            assert utils.get_http_client() is client_before
+            return first, second
+        finally:
+            await utils.close_http_client()
+    
+    with fake.serve() as base_url:
+        monkeypatch.setattr(utils, "GOOGLE_TOKEN_URL", f"{base_url}/token")
+        monkeypatch.setattr(utils, "GOOGLE_USERINFO_URL", f"{base_url}/userinfo")
+        (tokens, userinfo), _ = asyncio.run(run())
+    
+    assert userinfo["sub"] == "fake-sub"
+    assert userinfo["email"] == "fake@example.com"
+    assert tokens["refresh_token"] == "fake-refresh"
+    assert fake.requests["token"] == 2
+    assert fake.requests["userinfo"] == (0 if issue_id_token else 2)
+
+
+def _db_writer(url, worker, n_logins, errors):
+    """Simulate a worker handling a burst of logins (runs in a child process)"""
+    from sqlalchemy.exc import OperationalError
+    from sqlmodel import Session, select
+    from db import Credential, User, create_db_engine
+    
+    engine = create_db_engine(url, profile="production")
+    for i in range(n_logins):
+        try:
+            with Session(engine) as session:
+                user = User(email=f"w{worker}-{i}@example.com", google_sub=f"w{worker}-{i}")
+                session.add(user)
+                session.commit()
+                session.refresh(user)
+                
+                session.add(Credential(user_id=user.id, refresh_token="token"))
+                session.commit()
+                
+                statement = select(Credential).where(Credential.user_id == user.id)
+                credential = session.exec(statement).first()
+                credential.refresh_token = "rotated"
+                session.add(credential)
+                session.commit()
+        except OperationalError as e:
+            errors.put(str(e))
+    engine.dispose()
+
+
+def test_production_sqlite_profile_handles_concurrent_writers(tmp_path):
+    """Test WAL profile lets several processes write without 'database is locked'"""
+    import multiprocessing
+    from sqlalchemy import text
+    from sqlmodel import SQLModel
+    from db import create_db_engine
+    
+    url = f"sqlite:///{tmp_path / 'prod.db'}"
+    engine = create_db_engine(url, profile="production")
+    SQLModel.metadata.create_all(engine)
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+    
+    ctx = multiprocessing.get_context("fork")
+    errors = ctx.Queue()
+    workers = [ctx.Process(target=_db_writer, args=(url, w, 40, errors)) for w in range(6)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join(timeout=60)
+    
+    assert all(p.exitcode == 0 for p in workers)
+    assert errors.empty()
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT COUNT(*) FROM credential")).scalar() == 240
+    engine.dispose()
+
+
+def test_upsert_user_with_credential_single_commit():
+    """Test login write path upserts user and credential with one commit"""
+    from sqlalchemy import event
+    from db import engine, get_refresh_token_for_user, upsert_user_with_credential
+    
+    commits = []
+    listener = lambda conn: commits.append(1)
+    event.listen(engine, "commit", listener)
+    try:
+        user = upsert_user_with_credential("upsert@example.com", "upsert-sub", "refresh-1")
+        assert len(commits) == 1
+        
+        updated = upsert_user_with_credential("upsert-new@example.com", "upsert-sub", "refresh-2")
+        assert len(commits) == 2
+    finally:
+        event.remove(engine, "commit", listener)
+    
+    assert updated.id == user.id
+    assert updated.email == "upsert-new@example.com"
+    assert get_refresh_token_for_user(user.id) == "refresh-2"
+    
+    # Logins without a refresh token keep the stored one
+    upsert_user_with_credential("upsert@example.com", "upsert-sub")
+    assert get_refresh_token_for_user(user.id) == "refresh-2"
+
+
+def test_admin_users_keyset_pagination():
+    """Test /admin/users pages by cursor and streams an NDJSON export"""
+    import json
+    
+    seeded = {
+        get_or_create_user(email=f"admin-page{i}@example.com", google_sub=f"admin-page-sub{i}").id
+        for i in range(5)
+    }
+    
+    users = []
+    pages = 0
+    cursor = None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/admin/users", params=params)
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["users"]) <= 2
+        assert data["total_users"] == 5
+        users.extend(data["users"])
+        pages += 1
+        cursor = data["next_cursor"]
+        if not cursor:
+            break
+    
+    # Every seeded user exactly once, across 2 + 2 + 1
+    assert pages == 3
+    assert sorted(user["id"] for user in users) == sorted(seeded)
+    keys = [(user["created_at"], user["id"]) for user in users]
+    assert keys == sorted(keys, reverse=True)
+    
+    response = client.get("/admin/users", params={"format": "ndjson"})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert exported == users
+    
+    assert client.get("/admin/users", params={"cursor": "not-a-cursor"}).status_code == 400
+
+
+def test_metrics_endpoint(fake_google):
+    """Test /metrics exposes route, upstream, DB, cache and gauge metrics"""
+    from metrics import google_request_duration_seconds, http_requests_total
+    from token_cache import access_token_cache
+    
+    before = http_requests_total.value("GET", "/api/events", "200")
+    response = client.get(
+        "/api/events",
+        params={"timeMin": "2025-01-01T00:00:00Z", "timeMax": "2025-01-02T00:00:00Z"},
+        headers={"Cookie": f"session={fake_google.session}"},
+    )
+    assert response.status_code == 200
+    assert http_requests_total.value("GET", "/api/events", "200") == before + 1
+    assert google_request_duration_seconds.count("events.list") >= 1
+    
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert "# TYPE http_request_duration_seconds histogram" in body
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/api/events",le="+Inf"}' in body
+    assert 'google_request_duration_seconds_count{operation="events.list"}' in body
+    assert 'db_query_duration_seconds_count{statement="SELECT"}' in body
+    assert "\noauth_states " in body
+    assert f'cache_hits_total{{cache="access_token"}} {access_token_cache.hits}' in body
+    for cache_name in ("user", "session_token"):
+        assert f'cache_hits_total{{cache="{cache_name}"}} ' in body
+        assert f'cache_misses_total{{cache="{cache_name}"}} ' in body
+    
+    # Unknown paths share one label instead of one per URL
+    client.get("/no/such/path")
+    assert http_requests_total.value("GET", "unmatched", "404") >= 1
+
+
+def test_profiling_middleware(tmp_path, monkeypatch):
+    """Test requests are profiled on header or sampling, keeping the newest dumps"""
+    import json
+    import profiling
+    
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", "profile-secret")
+    monkeypatch.setattr(profiling, "PROFILE_MAX_FILES", 2)
+    
+    client.get("/healthz", headers={"X-Profile": "wrong"})
+    client.get("/healthz")
+    assert list(tmp_path.iterdir()) == []
+    
+    client.get("/healthz", headers={"X-Profile": "profile-secret"})
+    (metadata_file,) = tmp_path.glob("*.json")
+    metadata = json.loads(metadata_file.read_text())
+    assert metadata["route"] == "/healthz"
+    assert metadata["status"] == 200
+    assert metadata["reason"] == "header"
+    assert metadata_file.with_suffix(".prof").exists()
+    
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 1.0)
+    client.get("/healthz")
+    client.get("/auth/me")
+    assert len(list(tmp_path.glob("*.prof"))) == 2
+    assert len(list(tmp_path.glob("*.json"))) == 2
+
+
+def test_map_event_matches_schema():
+    """Test fast event mapping produces the EventResponse shape"""
+    from calendar_api import map_event
+    from schemas import EventResponse
+    
+    events = [
+        {
+            "id": "timed",
+            "summary": "Standup",
+            "start": {"dateTime": "2025-01-01T09:00:00+07:00"},
+            "end": {"dateTime": "2025-01-01T09:15:00+07:00"},
+            "attendees": [{"email": "a@example.com"}, {"responseStatus": "accepted"}],
+            "organizer": {"email": "owner@example.com"},
+        },
+        {"id": "all-day", "start": {"date": "2025-01-02"}, "end": {"date": "2025-01-03"}},
+        {"id": "bare", "organizer": {}},
+    ]
+    
+    for event in events:
+        mapped = map_event(event)
+        assert EventResponse(**mapped).model_dump() == mapped
+    
+    assert map_event(events[0])["attendees"] == ["a@example.com"]
+    assert map_event(events[1])["calendarId"] == "primary"
+    assert map_event(events[2])["start"] == ""
+
+
+def test_events_sparse_fieldsets(fake_google):
+    """Test ?fields= trims the response and the mask sent to Google"""
+    params = {"timeMin": "2025-01-01T00:00:00Z", "timeMax": "2025-01-02T00:00:00Z"}
+    headers = {"Cookie": f"session={fake_google.session}"}
+    
+    response = client.get("/api/events", params=params, headers=headers)
+    assert response.status_code == 200
+    assert fake_google.field_masks[-1] == (
+        "nextPageToken,items(id,summary,start(date,dateTime),end(date,dateTime),"
+        "attendees(email),organizer(email))"
+    )
+    assert response.json()["events"][0]["attendees"] == [
+        "guest0@example.com", "guest1@example.com", "guest2@example.com"
+    ]
+    
+    response = client.get("/api/events", params={**params, "fields": "start,summary"}, headers=headers)
+    assert response.status_code == 200
+    assert fake_google.field_masks[-1] == "nextPageToken,items(id,summary,start(date,dateTime))"
+    assert response.json()["events"][0] == {
+        "id": "evt0",
+        "summary": "Event 0",
+        "start": "2025-01-01T00:00:00+00:00",
+    }
+    
+    response = client.get("/api/events", params={**params, "fields": "summary,description"}, headers=headers)
+    assert response.status_code == 400
+    
+    response = client.get("/api/events", params={**params, "fields": " , "}, headers=headers)
+    assert response.status_code == 400
+
+
+def test_events_batch_merges_overlapping_windows(fake_google, monkeypatch):
+    """Test /api/events/batch fetches each merged range once and slices per window"""
+    import event_sync
+    from benchmarks.fake_google import make_events
+    
+    fake_google.calendars["primary"] = make_events(60)  # every 2h from 2025-01-01
+    fake_google.page_size = 10
+    headers = {"Cookie": f"session={fake_google.session}"}
+    day = {"timeMin": "2025-01-01T00:00:00Z", "timeMax": "2025-01-02T00:00:00Z"}
+    windows = [
+        day,
+        {"timeMin": "2025-01-01T12:00:00Z", "timeMax": "2025-01-03T00:00:00Z"},
+        day,
+        {"timeMin": "2025-01-01T07:30:00+07:00", "timeMax": "2025-01-01T09:00:00+07:00"},
+        {"timeMin": "2025-01-04T00:00:00Z", "timeMax": "2025-01-04T06:00:00Z"},
+    ]
+    
+    before = fake_google.requests["events.list"]
+    response = client.post("/api/events/batch", json={"windows": windows}, headers=headers)
+    assert response.status_code == 200
+    results = response.json()["windows"]
+    
+    # Jan 1-3 (24 events, 3 pages) and Jan 4 (1 page)
+    assert fake_google.requests["events.list"] - before == 4
+    
+    def ids(time_min, time_max):
+        events = results[f"{time_min}/{time_max}/Asia/Bangkok"]["events"]
+        return [event["id"] for event in events]
+    
+    assert len(results) == 4
+    assert ids(day["timeMin"], day["timeMax"]) == [f"evt{i}" for i in range(12)]
+    assert ids("2025-01-01T12:00:00Z", "2025-01-03T00:00:00Z") == [f"evt{i}" for i in range(6, 24)]
+    assert ids("2025-01-01T07:30:00+07:00", "2025-01-01T09:00:00+07:00") == ["evt0"]
+    assert ids("2025-01-04T00:00:00Z", "2025-01-04T06:00:00Z") == ["evt36", "evt37", "evt38"]
+    
+    # The event store answers every window with one query each
+    monkeypatch.setattr(event_sync, "EVENT_STORE_ENABLED", True)
+    monkeypatch.setattr(event_sync, "EVENT_SYNC_INTERVAL", 3600)
+    monkeypatch.setattr(event_sync, "EVENT_SYNC_PAST_DAYS", 3650)
+    google_ids = {key: [event["id"] for event in result["events"]] for key, result in results.items()}
+    response = client.post("/api/events/batch", json={"windows": windows}, headers=headers)
+    assert response.status_code == 200
+    results = response.json()["windows"]
+    assert {key: [event["id"] for event in result["events"]] for key, result in results.items()} == google_ids
+    monkeypatch.setattr(event_sync, "EVENT_STORE_ENABLED", False)
+    
+    # Sparse fields still fetch start/end from Google for slicing
+    response = client.post(
+        "/api/events/batch",
+        json={"windows": [day], "fields": "summary"},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    (result,) = response.json()["windows"].values()
+    assert result["events"][0] == {"id": "evt0", "summary": "Event 0"}
+    assert fake_google.field_masks[-1] == (
+        "nextPageToken,items(id,summary,start(date,dateTime),end(date,dateTime))"
+    )
+    
+    # The same UTC range asked in two timezones is fetched once
+    before = fake_google.requests["events.list"]
+    response = client.post(
+        "/api/events/batch",
+        json={"windows": [day, {**day, "timezone": "UTC"}]},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert fake_google.requests["events.list"] - before == 2  # 12 events, 2 pages
+    results = response.json()["windows"]
+    bangkok, utc = (
+        results[f"{day['timeMin']}/{day['timeMax']}/{tz_name}"]["events"]
+        for tz_name in ("Asia/Bangkok", "UTC")
+    )
+    assert [event["id"] for event in bangkok] == [event["id"] for event in utc]
+    assert {bangkok[0]["start"], utc[0]["start"]} == {
+        "2025-01-01T07:00:00+07:00", "2025-01-01T00:00:00+00:00"
+    }
+    
+    for body in (
+        {"windows": []},
+        {"windows": [{**day, "timezone": "Mars/Olympus"}]},
+        {"windows": [{"timeMin": day["timeMax"], "timeMax": day["timeMin"]}]},
+    ):
+        response = client.post("/api/events/batch", json=body, headers=headers)
+        assert response.status_code == 400
+    
+    # Fan-out limits: window count and total span
+    for body in (
+        {"windows": [day] * 21},
+        {"windows": [{"timeMin": "2025-01-01T00:00:00Z", "timeMax": "2026-03-01T00:00:00Z"}]},
+    ):
+        response = client.post("/api/events/batch", json=body, headers=headers)
+        assert response.status_code == 422
+
+
+def test_availability_merges_busy_intervals(fake_google):
+    """Test /api/availability merges busy time across calendars into free slots"""
+    from datetime import datetime, timedelta, timezone as dt_timezone
+    from benchmarks.fake_google import make_events
+    
+    bangkok = dt_timezone(timedelta(hours=7))
+    
+    def event(prefix, day, hour, minute, minutes):
+        start = datetime(2025, 1, day, hour, minute, tzinfo=bangkok)
+        return make_events(1, start=start, duration=timedelta(minutes=minutes), prefix=prefix)[0]
+    
+    # Monday 6 and Tuesday 7 January 2025
+    fake_google.calendars = {
+        "primary": [event("a", 6, 10, 0, 60), event("b", 6, 12, 10, 20), event("c", 7, 17, 45, 75)],
+        "team@example.com": [event("d", 6, 10, 30, 90)],
+    }
+    headers = {"Cookie": f"session={fake_google.session}"}
+    params = {"timeMin": "2025-01-06T00:00:00+07:00", "timeMax": "2025-01-08T00:00:00+07:00"}
+    
+    before = fake_google.requests["events.list"]
+    response = client.get("/api/availability", params=params, headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert fake_google.requests["freebusy.query"] == 1
+    assert fake_google.requests["events.list"] == before
+    
+    assert body["busy"] == [
+        {"start": "2025-01-06T10:00:00+07:00", "end": "2025-01-06T12:00:00+07:00"},
+        {"start": "2025-01-06T12:10:00+07:00", "end": "2025-01-06T12:30:00+07:00"},
+        {"start": "2025-01-07T17:45:00+07:00", "end": "2025-01-07T19:00:00+07:00"},
+    ]
+    # The 10 minute gap at 12:00 is below minDuration
+    assert body["free"] == [
+        {"start": "2025-01-06T09:00:00+07:00", "end": "2025-01-06T10:00:00+07:00"},
+        {"start": "2025-01-06T12:30:00+07:00", "end": "2025-01-06T18:00:00+07:00"},
+        {"start": "2025-01-07T09:00:00+07:00", "end": "2025-01-07T17:45:00+07:00"},
+    ]
+    assert body["calendarErrors"] == {}
+    
+    response = client.get(
+        "/api/availability",
+        params={**params, "minDuration": 5, "workdayStart": "12:00", "workdayEnd": "13:00", "calendars": "primary"},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert response.json()["free"] == [
+        {"start": "2025-01-06T12:00:00+07:00", "end": "2025-01-06T12:10:00+07:00"},
+        {"start": "2025-01-06T12:30:00+07:00", "end": "2025-01-06T13:00:00+07:00"},
+        {"start": "2025-01-07T12:00:00+07:00", "end": "2025-01-07T13:00:00+07:00"},
+    ]
+    
+    # Saturday only: no working hours unless weekends are included
+    weekend = {"timeMin": "2025-01-11T00:00:00+07:00", "timeMax": "2025-01-12T00:00:00+07:00"}
+    response = client.get("/api/availability", params=weekend, headers=headers)
+    assert response.json()["free"] == []
+    response = client.get("/api/availability", params={**weekend, "includeWeekends": "true"}, headers=headers)
+    assert len(response.json()["free"]) == 1
+    
+    for bad in (
+        {"workdayStart": "18:00", "workdayEnd": "09:00"},
+        {"workdayEnd": "25:00"},
+        {"timezone": "Mars/Olympus"},
+        {"calendars": "everything"},
+    ):
+        response = client.get("/api/availability", params={**params, **bad}, headers=headers)
+        assert response.status_code == 400
+
+
+def test_rate_limit_primitives():
+    """Test token bucket pacing, AIMD limit changes and Retry-After parsing"""
+    import asyncio
+    from email.utils import format_datetime
+    from datetime import datetime, timedelta, timezone as dt_timezone
+    from rate_limit import AIMDLimiter, TokenBucket, backoff_delay, parse_retry_after
+    
+    bucket = TokenBucket(rate=10, burst=2)
+    delays = [bucket.reserve() for _ in range(4)]
+    assert delays[:2] == [0.0, 0.0]
+    assert delays[2] == pytest.approx(0.1, abs=0.01)
+    assert delays[3] == pytest.approx(0.2, abs=0.01)
+    assert TokenBucket(rate=0, burst=1).reserve() == 0.0
+    
+    limiter = AIMDLimiter(max_limit=4, min_limit=1, cooldown=60)
+    in_flight = 0
+    peak = 0
+    
+    async def call():
+        nonlocal in_flight, peak
+        async with limiter:
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+    
+    async def burst():
+        await asyncio.gather(*(call() for _ in range(12)))
+    
+    asyncio.run(burst())
+    assert peak == 4
+    
+    limiter.on_throttle()
+    limiter.on_throttle()  # same burst, within the cooldown
+    assert limiter.limit == 2
+    peak = 0
+    asyncio.run(burst())
+    assert peak == 2
+    for _ in range(2):
+        limiter.on_success()
+    assert limiter.limit == pytest.approx(2 + 1 / 2 + 1 / 2.5)
+    
+    assert parse_retry_after("3") == 3
+    assert parse_retry_after("soon") is None
+    in_ten_seconds = format_datetime(datetime.now(dt_timezone.utc) + timedelta(seconds=10), usegmt=True)
+    assert 8 <= parse_retry_after(in_ten_seconds) <= 10
+    
+    assert all(0 <= backoff_delay(3, None, base=0.5, cap=2) <= 2 for _ in range(50))
+    assert 1 <= backoff_delay(0, 1, base=0.5, cap=2) <= 1.5
+    assert backoff_delay(0, 30, base=0.5, cap=2) is None
+
+
+def test_calendar_client_backs_off_on_throttling(fake_google, monkeypatch):
+    """Test 429 / rateLimitExceeded responses are retried and shrink concurrency"""
+    import time
+    from calendar_client import calendar_client
+    from rate_limit import AIMDLimiter
+    
+    monkeypatch.setattr(calendar_client, "limiter", AIMDLimiter(32, 2))
+    monkeypatch.setattr(calendar_client, "retry_base_delay", 0.01)
+    params = {"timeMin": "2025-01-01T00:00:00Z", "timeMax": "2025-01-02T00:00:00Z"}
+    headers = {"Cookie": f"session={fake_google.session}"}
+    
+    before = fake_google.requests["events.list"]
+    fake_google.throttle(2, retry_after="0")
+    response = client.get("/api/events", params=params, headers=headers)
+    assert response.status_code == 200
+    assert fake_google.requests["events.list"] - before == 3
+    # One halving per burst of throttles, then additive increase
+    assert 16 < calendar_client.limiter.limit < 17
+    
+    fake_google.throttle(1, status=403)
+    response = client.get("/api/events", params=params, headers=headers)
+    assert response.status_code == 200
+    
+    # Retries exhausted: the throttling reaches the client
+    before = fake_google.requests["events.list"]
+    fake_google.throttle(4)
+    response = client.get("/api/events", params=params, headers=headers)
+    assert response.status_code == 429
+    assert fake_google.requests["events.list"] - before == 4
+    
+    # Retry-After longer than worth waiting for: fail fast
+    before = fake_google.requests["events.list"]
+    fake_google.throttle(1, retry_after="120")
+    started = time.perf_counter()
+    response = client.get("/api/events", params=params, headers=headers)
+    assert response.status_code == 429
+    assert time.perf_counter() - started < 5
+    assert fake_google.requests["events.list"] - before == 1
+    
+    # Per-user buckets are keyed by user and kept while in use
+    from cache import TTLCache
+    monkeypatch.setattr(calendar_client, "_user_buckets", TTLCache(maxsize=10, ttl=0.2))
+    bucket = calendar_client._user_bucket(1)
+    for _ in range(3):
+        time.sleep(0.1)
+        assert calendar_client._user_bucket(1) is bucket
+    assert calendar_client._user_bucket(2) is not bucket
+
+
+def test_events_etag_not_modified(fake_google):
+    """Test /api/events answers a matching If-None-Match with 304"""
+    params = {"timeMin": "2025-01-01T00:00:00Z", "timeMax": "2025-01-02T00:00:00Z"}
+    headers = {"Cookie": f"session={fake_google.session}"}
+    
+    response = client.get("/api/events", params=params, headers={**headers, "Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    # Weak even uncompressed: the 304 can't tell whether the 200 was compressed
+    etag = response.headers["etag"]
+    assert etag.startswith('W/"')
+    
+    for if_none_match in (etag, etag[2:], f'"other", {etag}'):
+        response = client.get("/api/events", params=params, headers={
+            **headers, "If-None-Match": if_none_match, "Accept-Encoding": "identity"
+        })
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+    
+    # Different representation, different tag
+    response = client.get(
+        "/api/events",
+        params={**params, "fields": "summary"},
+        headers={**headers, "If-None-Match": etag},
+    )
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "br"])
+def test_response_compression(fake_google, encoding):
+    """Test large responses are compressed, small ones and unknown codings are not"""
+    import gzip
+    import json
+    
+    if encoding == "br":
+        brotli = pytest.importorskip("brotli")
+        decompress = brotli.decompress
+    else:
+        decompress = gzip.decompress
+    
+    params = {"timeMin": "2025-01-01T00:00:00Z", "timeMax": "2025-01-02T00:00:00Z"}
+    headers = {"Cookie": f"session={fake_google.session}", "Accept-Encoding": encoding}
+    
+    # httpx decodes transparently, so read the raw stream
+    with client.stream("GET", "/api/events", params=params, headers=headers) as response:
+        raw = b"".join(response.iter_raw())
+    assert response.headers["content-encoding"] == encoding
+    assert "accept-encoding" in response.headers["vary"].lower()
+    assert response.headers["etag"].startswith('W/"')
+    assert int(response.headers["content-length"]) == len(raw)
+    assert len(json.loads(decompress(raw))["events"]) == 10
+    
+    # Weak ETag from the compressed response still revalidates
+    response = client.get("/api/events", params=params, headers={
+        **headers, "If-None-Match": response.headers["etag"]
+    })
+    assert response.status_code == 304
+    
+    # Streaming responses are compressed chunk by chunk
+    with client.stream("GET", "/api/events/stream", params=params, headers=headers) as response:
+        raw = b"".join(response.iter_raw())
+    assert response.headers["content-encoding"] == encoding
+    assert "content-length" not in response.headers
+    assert len(decompress(raw).splitlines()) == 10
+    
+    response = client.get("/healthz", headers={"Accept-Encoding": encoding})
+    assert "content-encoding" not in response.headers
+    
+    response = client.get("/healthz", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    
+    # Uncompressed JSON still varies by coding and has the same weak validator
+    for accept_encoding in ("identity", encoding):
+        response = client.get("/api/events", params={**params, "fields": "id"}, headers={
+            **headers, "Accept-Encoding": accept_encoding
+        })
+        assert "content-encoding" not in response.headers
+        assert "accept-encoding" in response.headers["vary"].lower()
+        assert response.headers["etag"].startswith('W/"')
+    not_modified = client.get("/api/events", params={**params, "fields": "id"}, headers={
+        **headers, "If-None-Match": response.headers["etag"]
+    })
+    assert not_modified.status_code == 304
+    assert not_modified.headers["etag"] == response.headers["etag"]
+    assert "accept-encoding" in not_modified.headers["vary"].lower()
+
+
+def test_import_time_budget():
+    """Test `import app` stays within budget and leaves Google client libraries unloaded"""
+    import os
+    import subprocess
+    import sys
+    from pathlib import Path
+    
+    budget = float(os.getenv("IMPORT_TIME_BUDGET", "2.0"))
+    script = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import app\n"
+        "elapsed = time.perf_counter() - start\n"
+        "print(elapsed, any(m.startswith('googleapiclient') for m in sys.modules))\n"
+    )
+    
+    # Best of two fresh interpreters to smooth out disk cache effects
+    timings = []
+    for _ in range(2):
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        elapsed, google_loaded = result.stdout.split()[-2:]
+        timings.append(float(elapsed))
+        assert google_loaded == "False"
+    
+    assert min(timings) < budget, f"import app took {min(timings):.2f}s (budget {budget}s)"
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
 
@@ -0,0 +1,128 @@
+"""
+In-process cache of Google access tokens, keyed by user ID
+"""
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from config import settings
+
+# Refresh tokens this many seconds before Google says they expire
+ACCESS_TOKEN_REFRESH_MARGIN = settings.access_token_refresh_margin
+
+# Google access tokens live for one hour unless the token response says otherwise
+DEFAULT_EXPIRES_IN = 3600
+
+
+@dataclass
+class CachedToken:
+    """Access token with its absolute expiry (epoch seconds)"""
+    access_token: str
+    expires_at: float
+    
+    def is_fresh(self, margin: float) -> bool:
+        return time.time() < self.expires_at - margin
+
+
+# Refresher returns (access_token, expires_in seconds)
+Refresher = Callable[[], Awaitable[Tuple[str, Optional[float]]]]
+
+
+class AccessTokenCache:
+    """
+    Cache of access tokens per user
+    
+    A token is reused until it is within `refresh_margin` seconds of expiry.
+    Refreshes are serialized with a per-user lock, so concurrent requests
+    for the same user trigger at most one call to the token endpoint.
+    """
+    
+    def __init__(self, refresh_margin: float = ACCESS_TOKEN_REFRESH_MARGIN):
+        self.refresh_margin = refresh_margin
+        self._tokens: Dict[int, CachedToken] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+    
+    def _lock_for(self, user_id: int) -> asyncio.Lock:
+        lock = self._locks.get(user_id)
+        if lock is None:
+            lock = self._locks.setdefault(user_id, asyncio.Lock())
+        return lock
+    
+    def put(self, user_id: int, access_token: str, expires_in: Optional[float] = None) -> CachedToken:
+        """
+        Store a freshly issued access token
+        
+        Args:
+            user_id: User ID
+            access_token: Google access token
+            expires_in: Lifetime in seconds as returned by the token endpoint
+        
+        Returns:
+            Cached token entry
+        """
+        lifetime = float(expires_in) if expires_in else DEFAULT_EXPIRES_IN
+        token = CachedToken(access_token=access_token, expires_at=time.time() + lifetime)
+        self._tokens[user_id] = token
+        return token
+    
+    def peek(self, user_id: int) -> Optional[CachedToken]:
+        """Get cached entry without refreshing or touching counters"""
+        return self._tokens.get(user_id)
+    
+    def invalidate(self, user_id: int):
+        """Drop cached token for user (e.g. after Google rejected it)"""
+        self._tokens.pop(user_id, None)
+    
+    async def get(
+        self,
+        user_id: int,
+        refresh: Refresher,
+        margin: Optional[float] = None,
+    ) -> CachedToken:
+        """
+        Get a valid access token, refreshing it only when close to expiry
+        
+        Args:
+            user_id: User ID
+            refresh: Coroutine function fetching a new (token, expires_in)
+            margin: Refresh if the token expires within this many seconds
+                (default: refresh_margin)
+        
+        Returns:
+            Cached token entry
+        """
+        if margin is None:
+            margin = self.refresh_margin
+        
+        token = self._tokens.get(user_id)
+        if token and token.is_fresh(margin):
+            self.hits += 1
+            return token
+        
+        async with self._lock_for(user_id):
+            # Another request may have refreshed while we waited for the lock
+            token = self._tokens.get(user_id)
+            if token and token.is_fresh(margin):
+                self.hits += 1
+                return token
+            
+            self.misses += 1
+            access_token, expires_in = await refresh()
+            return self.put(user_id, access_token, expires_in)
+    
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._tokens),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+# Shared cache instance
+access_token_cache = AccessTokenCache()
@@ -0,0 +1,174 @@
+"""
+Background refresh of Google access tokens for active users
+
+Users are tracked from the moment they use a Google API through
+get_access_token. While they stay active, their cached access token is
+refreshed ahead of expiry by a background task, so requests find a fresh
+token instead of waiting on the token endpoint.
+
+Each token gets its own refresh time, drawn at random between
+TOKEN_REFRESH_LEAD_TIME and TOKEN_REFRESH_LEAD_TIME - TOKEN_REFRESH_JITTER
+seconds before it expires, so tokens issued together (e.g. after a restart)
+are not all refreshed in the same tick.
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from cache import TTLCache
+from config import settings
+from token_cache import AccessTokenCache, Refresher, access_token_cache
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+TOKEN_REFRESH_ENABLED = settings.token_refresh_enabled
+TOKEN_REFRESH_INTERVAL = settings.token_refresh_interval  # seconds between scans
+TOKEN_REFRESH_LEAD_TIME = settings.token_refresh_lead_time  # seconds before expiry
+TOKEN_REFRESH_JITTER = settings.token_refresh_jitter  # seconds
+TOKEN_REFRESH_ACTIVE_WINDOW = settings.token_refresh_active_window  # seconds since last use
+TOKEN_REFRESH_CONCURRENCY = settings.token_refresh_concurrency
+TOKEN_REFRESH_MAX_USERS = settings.token_refresh_max_users
+
+# user_id -> refresher for that user's token
+RefresherFactory = Callable[[int], Refresher]
+
+
+class TokenRefreshScheduler:
+    """
+    Refreshes access tokens of recently active users before they expire
+    
+    touch() is called on the request path and only records the user in a
+    cache whose entries expire after `active_window` seconds without a
+    request, so it stays bounded even while the background task is not
+    running. The task scans the active users every `interval` seconds and
+    refreshes the tokens that are due, at most `concurrency` at a time.
+    """
+    
+    def __init__(
+        self,
+        cache: AccessTokenCache = access_token_cache,
+        interval: float = TOKEN_REFRESH_INTERVAL,
+        lead_time: float = TOKEN_REFRESH_LEAD_TIME,
+        jitter: float = TOKEN_REFRESH_JITTER,
+        active_window: float = TOKEN_REFRESH_ACTIVE_WINDOW,
+        concurrency: int = TOKEN_REFRESH_CONCURRENCY,
+        refresher_for: Optional[RefresherFactory] = None,
+        max_users: int = TOKEN_REFRESH_MAX_USERS,
+    ):
+        self.cache = cache
+        self.interval = interval
+        self.lead_time = lead_time
+        # Refreshing later than the request path would is pointless
+        self.jitter = max(0.0, min(jitter, lead_time - cache.refresh_margin))
+        self.active_window = active_window
+        self.concurrency = concurrency
+        # user_id -> True while the user made a request within active_window
+        self._active = TTLCache(maxsize=max_users, ttl=active_window)
+        # user_id -> (expires_at of the token, when to refresh it)
+        self._schedule: Dict[int, Tuple[float, float]] = {}
+        self.refresher_for = refresher_for
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+    
+    def __len__(self) -> int:
+        return len(self._active.items())
+    
+    def touch(self, user_id: int):
+        """Mark user as active"""
+        self._active.set(user_id, True)
+    
+    def _refresh_at(self, user_id: int, expires_at: float) -> float:
+        scheduled = self._schedule.get(user_id)
+        if scheduled is None or scheduled[0] != expires_at:
+            refresh_at = expires_at - self.lead_time + random.uniform(0, self.jitter)
+            scheduled = self._schedule[user_id] = (expires_at, refresh_at)
+        return scheduled[1]
+    
+    def _forget(self, user_id: int):
+        self._active.invalidate(user_id)
+        self._schedule.pop(user_id, None)
+    
+    async def run_once(self) -> int:
+        """
+        Refresh every due token once
+        
+        Returns:
+            Number of refreshes attempted
+        """
+        active = [user_id for user_id, _ in self._active.items()]
+        # Users that went idle (or were evicted) lose their refresh time
+        for user_id in self._schedule.keys() - set(active):
+            del self._schedule[user_id]
+        
+        now = time.time()
+        due = []
+        for user_id in active:
+            token = self.cache.peek(user_id)
+            # Without a cached token the next request fetches one anyway
+            if token is not None and now >= self._refresh_at(user_id, token.expires_at):
+                due.append(user_id)
+        
+        if due:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            
+            async def refresh(user_id: int):
+                async with semaphore:
+                    await self._refresh(user_id)
+            
+            await asyncio.gather(*(refresh(user_id) for user_id in due))
+        return len(due)
+    
+    async def _refresh(self, user_id: int):
+        try:
+            await self.cache.get(user_id, self.refresher_for(user_id), margin=self.lead_time)
+        except Exception:
+            # e.g. revoked credentials: stop trying until the user is back
+            self._forget(user_id)
+    
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Token refresh scan failed")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+    
+    def start(self, refresher_for: Optional[RefresherFactory] = None):
+        """
+        Start the background task on the running event loop
+        
+        Args:
+            refresher_for: Returns the refresher for a user's token
+                (default: the one given to the constructor)
+        """
+        if self._task is not None:
+            return
+        if refresher_for is not None:
+            self.refresher_for = refresher_for
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self, timeout: float = 5.0):
+        """
+        Stop the background task
+        
+        Waits up to `timeout` seconds for in-flight refreshes, then cancels them.
+        """
+        if self._task is None:
+            return
+        self._stopping.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._task = None
+
+
+# Shared scheduler instance
+token_refresh_scheduler = TokenRefreshScheduler()
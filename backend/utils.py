@@ -1,7 +1,8 @@
 """
 Utility functions for OAuth, JWT, and session management
 """
-import os
+import asyncio
+import hmac
 import secrets
 import time
 from typing import Optional, Dict, Any
@@ -10,25 +11,43 @@ from urllib.parse import urlencode
 
 from jose import jwt, JWTError
 from fastapi import Response, HTTPException
-from dotenv import load_dotenv
 import httpx
 
-load_dotenv()
+from cache import TTLCache
+from config import settings
+from metrics import google_request_duration_seconds
+from state_store import create_state_store
 
 # Configuration
-GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
-GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
-OAUTH_REDIRECT_URI = os.getenv("OAUTH_REDIRECT_URI")
-SESSION_SECRET = os.getenv("SESSION_SECRET", "dev-secret-change-in-production")
-FRONTEND_ORIGIN = os.getenv("FRONTEND_ORIGIN", "http://localhost:3000")
+GOOGLE_CLIENT_ID = settings.google_client_id
+GOOGLE_CLIENT_SECRET = settings.google_client_secret
+OAUTH_REDIRECT_URI = settings.oauth_redirect_uri
+SESSION_SECRET = settings.session_secret
+FRONTEND_ORIGIN = settings.frontend_origin
 
-# OAuth state storage (in-memory for demo - use Redis in production)
-oauth_states: Dict[str, float] = {}  # state -> timestamp
+# Verified session tokens: signature -> (signed header.payload, user_id, exp)
+SESSION_CACHE_SIZE = settings.session_cache_size
+session_token_cache = TTLCache(maxsize=SESSION_CACHE_SIZE, ttl=7 * 24 * 60 * 60)
+
+# OAuth state storage (OAUTH_STATE_BACKEND: memory, sqlite or redis)
+state_store = create_state_store()
 
 # OAuth endpoints
 GOOGLE_AUTH_URL = "https://accounts.google.com/o/oauth2/v2/auth"
-GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token"
-GOOGLE_USERINFO_URL = "https://www.googleapis.com/oauth2/v3/userinfo"
+GOOGLE_TOKEN_URL = settings.google_token_url
+GOOGLE_USERINFO_URL = settings.google_userinfo_url
+GOOGLE_ID_TOKEN_ISSUERS = ("https://accounts.google.com", "accounts.google.com")
+
+# Shared HTTP client for the token and userinfo endpoints
+OAUTH_HTTP_CONNECT_TIMEOUT = settings.oauth_http_connect_timeout
+OAUTH_HTTP_READ_TIMEOUT = settings.oauth_http_read_timeout
+OAUTH_HTTP_MAX_CONNECTIONS = settings.oauth_http_max_connections
+OAUTH_HTTP_MAX_KEEPALIVE = settings.oauth_http_max_keepalive
+OAUTH_HTTP2 = settings.oauth_http2
+
+_http_client: Optional[httpx.AsyncClient] = None
+_http_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_closing_tasks: set = set()
 
 
 def generate_state() -> str:
@@ -39,14 +58,7 @@ def generate_state() -> str:
         Random state string
     """
     state = secrets.token_urlsafe(32)
-    oauth_states[state] = time.time()
-    
-    # Clean up old states (older than 10 minutes)
-    cutoff = time.time() - 600
-    expired = [s for s, ts in oauth_states.items() if ts < cutoff]
-    for s in expired:
-        del oauth_states[s]
-    
+    state_store.add(state)
     return state
 
 
@@ -54,23 +66,16 @@ def verify_state(state: str) -> bool:
     """
     Verify OAuth state exists and is valid
     
+    States expire after 10 minutes (OAUTH_STATE_TTL) and are removed on
+    use (one-time use).
+    
     Args:
         state: State to verify
     
     Returns:
         True if valid, False otherwise
     """
-    if state not in oauth_states:
-        return False
-    
-    # Check if not expired (10 minutes max)
-    if time.time() - oauth_states[state] > 600:
-        del oauth_states[state]
-        return False
-    
-    # Remove state after use (one-time use)
-    del oauth_states[state]
-    return True
+    return state_store.consume(state)
 
 
 def build_auth_url(state: str) -> str:
@@ -100,6 +105,130 @@ def build_auth_url(state: str) -> str:
     return f"{GOOGLE_AUTH_URL}?{urlencode(params)}"
 
 
+def discard_http_client(
+    client: Optional[httpx.AsyncClient],
+    loop: Optional[asyncio.AbstractEventLoop],
+):
+    """
+    Close an AsyncClient that is being replaced because the event loop changed
+    
+    Its pooled connections belong to `loop`, so they are closed there if
+    that loop is still running (e.g. in another thread). When the loop has
+    stopped, the client is closed on the current loop instead; the
+    transports of a closed loop are already gone and errors are ignored.
+    
+    Args:
+        client: Client being replaced (None: nothing to do)
+        loop: Event loop the client was created on
+    """
+    if client is None:
+        return
+    if loop is not None and loop.is_running() and not loop.is_closed():
+        asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        return
+    
+    async def close_quietly():
+        try:
+            await client.aclose()
+        except Exception:
+            pass
+    
+    task = asyncio.get_running_loop().create_task(close_quietly())
+    # The loop only keeps a weak reference to tasks
+    _closing_tasks.add(task)
+    task.add_done_callback(_closing_tasks.discard)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Get the app-lifetime HTTP client for Google OAuth endpoints
+    
+    Created at startup (see start_http_client); created lazily if a request
+    arrives first or runs on a different event loop (e.g. under TestClient).
+    
+    Returns:
+        Shared httpx.AsyncClient
+    """
+    global _http_client, _http_client_loop
+    
+    loop = asyncio.get_running_loop()
+    if _http_client is None or _http_client_loop is not loop:
+        discard_http_client(_http_client, _http_client_loop)
+        _http_client = httpx.AsyncClient(
+            http2=OAUTH_HTTP2 and _http2_available(),
+            timeout=httpx.Timeout(
+                connect=OAUTH_HTTP_CONNECT_TIMEOUT,
+                read=OAUTH_HTTP_READ_TIMEOUT,
+                write=OAUTH_HTTP_READ_TIMEOUT,
+                pool=OAUTH_HTTP_CONNECT_TIMEOUT,
+            ),
+            limits=httpx.Limits(
+                max_connections=OAUTH_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=OAUTH_HTTP_MAX_KEEPALIVE,
+            ),
+        )
+        _http_client_loop = loop
+    return _http_client
+
+
+async def start_http_client():
+    """Create the shared OAuth HTTP client (app startup)"""
+    get_http_client()
+
+
+async def close_http_client():
+    """Close the shared OAuth HTTP client (app shutdown)"""
+    global _http_client, _http_client_loop
+    
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+        _http_client_loop = None
+
+
+def userinfo_from_id_token(tokens: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Read user info from the id_token of a token response
+    
+    The id_token was received directly from Google's token endpoint over
+    TLS, so its claims can be used without verifying the signature (OpenID
+    Connect Core 3.1.3.7). Audience, issuer and expiry are still checked.
+    
+    Args:
+        tokens: Token endpoint response
+    
+    Returns:
+        Dict with at least sub and email, or None if not usable
+    """
+    id_token = tokens.get("id_token")
+    if not id_token:
+        return None
+    
+    try:
+        claims = jwt.get_unverified_claims(id_token)
+    except JWTError:
+        return None
+    
+    if claims.get("aud") != GOOGLE_CLIENT_ID:
+        return None
+    if claims.get("iss") not in GOOGLE_ID_TOKEN_ISSUERS:
+        return None
+    if not claims.get("exp") or claims["exp"] < time.time():
+        return None
+    if not claims.get("sub") or not claims.get("email"):
+        return None
+    
+    return claims
+
+
 async def exchange_code_for_tokens(code: str) -> tuple[Dict[str, Any], Dict[str, Any]]:
     """
     Exchange authorization code for tokens
@@ -113,44 +242,93 @@ async def exchange_code_for_tokens(code: str) -> tuple[Dict[str, Any], Dict[str,
     Raises:
         HTTPException: If token exchange fails
     """
-    async with httpx.AsyncClient() as client:
-        # Exchange code for tokens
-        token_data = {
-            "code": code,
-            "client_id": GOOGLE_CLIENT_ID,
-            "client_secret": GOOGLE_CLIENT_SECRET,
-            "redirect_uri": OAUTH_REDIRECT_URI,
-            "grant_type": "authorization_code",
-        }
-        
+    client = get_http_client()
+    
+    # Exchange code for tokens
+    token_data = {
+        "code": code,
+        "client_id": GOOGLE_CLIENT_ID,
+        "client_secret": GOOGLE_CLIENT_SECRET,
+        "redirect_uri": OAUTH_REDIRECT_URI,
+        "grant_type": "authorization_code",
+    }
+    
+    with google_request_duration_seconds.time("token_exchange"):
         token_response = await client.post(GOOGLE_TOKEN_URL, data=token_data)
-        
-        if token_response.status_code != 200:
-            error_detail = token_response.text
-            try:
-                error_json = token_response.json()
-                error_detail = error_json.get("error_description", error_json.get("error", error_detail))
-            except:
-                pass
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Failed to exchange code for tokens: {error_detail}"
-            )
-        
-        tokens = token_response.json()
-        
-        # Get user info using access token
+    
+    if token_response.status_code != 200:
+        error_detail = token_response.text
+        try:
+            error_json = token_response.json()
+            error_detail = error_json.get("error_description", error_json.get("error", error_detail))
+        except:
+            pass
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Failed to exchange code for tokens: {error_detail}"
+        )
+    
+    tokens = token_response.json()
+    
+    # Prefer the id_token claims; fall back to the userinfo endpoint
+    userinfo = userinfo_from_id_token(tokens)
+    if userinfo is not None:
+        return tokens, userinfo
+    
+    # Get user info using access token
+    with google_request_duration_seconds.time("userinfo"):
         userinfo_response = await client.get(
             GOOGLE_USERINFO_URL,
             headers={"Authorization": f"Bearer {tokens['access_token']}"}
         )
-        
-        if userinfo_response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Failed to get user info")
-        
-        userinfo = userinfo_response.json()
-        
-        return tokens, userinfo
+    
+    if userinfo_response.status_code != 200:
+        raise HTTPException(status_code=400, detail="Failed to get user info")
+    
+    userinfo = userinfo_response.json()
+    
+    return tokens, userinfo
+
+
+async def refresh_access_token(refresh_token: str) -> Dict[str, Any]:
+    """
+    Get a new access token using a refresh token
+    
+    Args:
+        refresh_token: Google refresh token
+    
+    Returns:
+        Token response dict (access_token, expires_in, ...)
+    
+    Raises:
+        HTTPException: 401 if Google rejects the refresh token, 504 if it
+            times out, 502 otherwise
+    """
+    try:
+        with google_request_duration_seconds.time("token_refresh"):
+            token_response = await get_http_client().post(GOOGLE_TOKEN_URL, data={
+                "refresh_token": refresh_token,
+                "client_id": GOOGLE_CLIENT_ID,
+                "client_secret": GOOGLE_CLIENT_SECRET,
+                "grant_type": "refresh_token",
+            })
+    except httpx.TimeoutException:
+        raise HTTPException(status_code=504, detail="Timed out waiting for Google token endpoint")
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Connection to Google token endpoint failed: {e}")
+    
+    if token_response.status_code in (400, 401):
+        raise HTTPException(
+            status_code=401,
+            detail="Google credentials expired or revoked. Please re-authenticate."
+        )
+    if token_response.status_code != 200:
+        raise HTTPException(
+            status_code=502,
+            detail=f"Failed to refresh access token: {token_response.status_code}"
+        )
+    
+    return token_response.json()
 
 
 def create_session_jwt(user_id: int) -> str:
@@ -175,18 +353,36 @@ def verify_session_jwt(token: str) -> Optional[int]:
     """
     Verify and decode JWT session token
     
+    Tokens verified before are recognised by their signature and skip the
+    full decode until their exp. The signed header and payload must match
+    the cached ones exactly, so a tampered token is still rejected.
+    
     Args:
         token: JWT token string
     
     Returns:
         User ID if valid, None otherwise
     """
+    signing_input, _, signature = token.rpartition(".")
+    
+    cached = session_token_cache.get(signature) if signature else None
+    if cached is not None:
+        cached_input, user_id, exp = cached
+        if time.time() < exp and hmac.compare_digest(cached_input, signing_input):
+            return user_id
+    
     try:
         payload = jwt.decode(token, SESSION_SECRET, algorithms=["HS256"])
         user_id = payload.get("sub")
-        return int(user_id) if user_id else None
+        user_id = int(user_id) if user_id else None
     except JWTError:
         return None
+    
+    exp = payload.get("exp")
+    if user_id and exp:
+        session_token_cache.set(signature, (signing_input, user_id, exp), ttl=exp - time.time())
+    
+    return user_id
 
 
 def create_session_cookie(response: Response, user_id: int):
@@ -36,7 +36,7 @@ export async function api<T>(
       "Content-Type": "application/json",
       ...(init?.headers || {}),
     },
-    cache: "no-store", // Disable caching for dynamic data
+    cache: "no-cache", // Revalidate with the server (ETag / 304) before reusing a cached copy
   });
 
   // Handle non-OK responses
@@ -103,6 +103,30 @@ export interface EventsResponse {
   nextPageToken?: string;
 }
 
+export interface EventWindow {
+  timeMin: string;
+  timeMax: string;
+  timezone?: string;
+}
+
+export interface EventsBatchResponse {
+  /** Keyed by `${timeMin}/${timeMax}/${timezone}` */
+  windows: Record<string, EventsResponse>;
+}
+
+export interface TimeSlot {
+  start: string;
+  end: string;
+}
+
+export interface AvailabilityResponse {
+  timezone: string;
+  busy: TimeSlot[];
+  free: TimeSlot[];
+  /** Calendars whose busy time Google could not report */
+  calendarErrors: Record<string, string>;
+}
+
 export const calendarApi = {
   /**
    * Fetch calendar events
@@ -125,5 +149,50 @@ export const calendarApi = {
     
     return api(`/api/events?${queryParams.toString()}`);
   },
+
+  /**
+   * Fetch events for several date windows (e.g. week, month, neighbours) at once
+   */
+  async getEventsBatch(windows: EventWindow[]): Promise<EventsBatchResponse> {
+    return api("/api/events/batch", {
+      method: "POST",
+      body: JSON.stringify({
+        windows: windows.map((window) => ({
+          ...window,
+          timezone: window.timezone || "Asia/Bangkok",
+        })),
+      }),
+    });
+  },
+
+  /**
+   * Fetch merged busy intervals and free slots within working hours
+   */
+  async getAvailability(params: {
+    timeMin: string;
+    timeMax: string;
+    timezone?: string;
+    workdayStart?: string;
+    workdayEnd?: string;
+    minDuration?: number;
+  }): Promise<AvailabilityResponse> {
+    const queryParams = new URLSearchParams({
+      timeMin: params.timeMin,
+      timeMax: params.timeMax,
+      timezone: params.timezone || "Asia/Bangkok",
+    });
+
+    if (params.workdayStart) {
+      queryParams.append("workdayStart", params.workdayStart);
+    }
+    if (params.workdayEnd) {
+      queryParams.append("workdayEnd", params.workdayEnd);
+    }
+    if (params.minDuration) {
+      queryParams.append("minDuration", String(params.minDuration));
+    }
+
+    return api(`/api/availability?${queryParams.toString()}`);
+  },
 };
 